@@ -1,9 +1,12 @@
 import streamlit as st
 from PIL import Image
-from utils.auth import authenticate_user, create_user, reset_password
+from db.admission import DatabaseBusy
+from utils.auth import authenticate_user, create_user, reset_password, AuthBusy
 from frontend.client import client_dashboard
 from frontend.agent import agent_dashboard
 from frontend.admin import admin_dashboard
+from utils.catalog import warm_up as warm_up_catalog
+from utils.leases import refresh_statuses_if_due
 import re
 
 # ------------------------------------------------------------
@@ -57,7 +60,11 @@ def login_page():
             if not is_valid_email(username):
                 st.error("❌ Please enter a valid email address (e.g., name@domain.ext).")
                 return
-            user = authenticate_user(username, password)
+            try:
+                user = authenticate_user(username, password)
+            except (AuthBusy, DatabaseBusy) as e:
+                st.warning(f"⏳ {e}")
+                return
             if user:
                 st.session_state.user = user
                 # Route based on role
@@ -91,7 +98,11 @@ def create_account_page():
             return
         
         # Role automatically defaults to 'Client'
-        success = create_user(name, email, phone, password)
+        try:
+            success = create_user(name, email, phone, password)
+        except (AuthBusy, DatabaseBusy) as e:
+            st.warning(f"⏳ {e}")
+            return
         if success:
             st.success("✅ Account created successfully! You can now log in.")
             st.session_state.page = "login"
@@ -114,7 +125,12 @@ def forgot_password_page():
             st.error("❌ Invalid email format. Please enter a valid email.")
             return
         
-        if reset_password(email, new_password):
+        try:
+            changed = reset_password(email, new_password)
+        except (AuthBusy, DatabaseBusy) as e:
+            st.warning(f"⏳ {e}")
+            return
+        if changed:
             st.success("✅ Password changed successfully! Return to login.")
             st.session_state.page = "login"
         else:
@@ -125,6 +141,11 @@ def forgot_password_page():
 # Main App Logic
 # ------------------------------------------------------------
 def main():
+    # Start the shared catalog snapshot refresher; once any worker has published a current
+    # version stamp, catalog pages are served from the mapped file without a MySQL round trip
+    warm_up_catalog()
+    # Flip rentals whose leases started or ended since yesterday (background, once per day)
+    refresh_statuses_if_due()
     if "page" not in st.session_state:
         st.session_state.page = "login"
     if "user" not in st.session_state:
@@ -0,0 +1,108 @@
+"""
+Driver benchmark: PyMySQL vs mysql-connector-python, plain vs server-side
+prepared statements, on the app's hottest repeated reads.
+
+    python -m benchmarks.bench_drivers                      # every installed driver, 2,000 calls per query
+    python -m benchmarks.bench_drivers --iterations 10000
+    python -m benchmarks.bench_drivers --drivers pymysql
+
+Each configuration uses one long-lived session (prepared statements are per
+connection). Reported per query: calls/s (wall clock) and client CPU in
+microseconds per call (process time), so driver overhead is visible apart
+from server time.
+"""
+import argparse
+import random
+import time
+
+from db.driver import available_drivers, connect
+from utils.leases import BOOKABLE_SQL
+
+ITERATIONS = 2_000
+WARMUP = 50
+SAMPLE_SIZE = 200
+
+# Same SQL the app runs (utils/auth.py, frontend/client.py)
+HOT_QUERIES = {
+    "login": "SELECT * FROM Users WHERE email=%s",
+    "catalog": f"""
+        SELECT p.property_id, p.title, p.price, p.location, p.type, p.status,
+               u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email, u.user_id AS agent_id
+        FROM Properties p
+        JOIN Users u ON p.agent_id = u.user_id
+        WHERE p.type=%s AND p.price<=%s AND p.location LIKE %s AND {BOOKABLE_SQL};
+    """,
+    "appointments": """
+        SELECT a.appointment_id, a.datetime, a.status, p.title AS property,
+               u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email
+        FROM Appointments a
+        JOIN Properties p ON a.property_id = p.property_id
+        JOIN Users u ON a.agent_id = u.user_id
+        WHERE a.user_id=%s
+        ORDER BY datetime DESC;
+    """,
+}
+
+
+def sample_arguments(seed=7):
+    """Realistic argument tuples per query, drawn from the live tables."""
+    session = connect(prepare=False)
+    if session is None:
+        raise SystemExit("Could not connect to the database.")
+    with session:
+        emails = [r["email"] for r in session.query("SELECT email FROM Users LIMIT %s;", (SAMPLE_SIZE,))]
+        clients = [r["user_id"] for r in session.query(
+            "SELECT user_id FROM Users WHERE role='Client' LIMIT %s;", (SAMPLE_SIZE,))]
+        cities = [r["city"] for r in session.query(
+            "SELECT DISTINCT SUBSTRING_INDEX(location, ',', 1) AS city FROM Properties LIMIT %s;", (SAMPLE_SIZE,))]
+    rng = random.Random(seed)
+    return {
+        "login": [(rng.choice(emails or ["nobody@example.com"]),) for _ in range(SAMPLE_SIZE)],
+        "catalog": [(rng.choice(["For_Sale", "For_Rent"]), rng.choice([50_000, 1_000_000, 10_000_000]),
+                     f"%{rng.choice(cities or [''])}%") for _ in range(SAMPLE_SIZE)],
+        "appointments": [(rng.choice(clients or [0]),) for _ in range(SAMPLE_SIZE)],
+    }
+
+
+def run(driver, prepare, arguments, iterations):
+    session = connect(driver, prepare=prepare)
+    if session is None:
+        return None
+    results = {}
+    with session:
+        for name, sql in HOT_QUERIES.items():
+            args = arguments[name]
+            for i in range(WARMUP):
+                session.query(sql, args[i % len(args)])
+            wall, cpu = time.perf_counter(), time.process_time()
+            for i in range(iterations):
+                session.query(sql, args[i % len(args)])
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            results[name] = (iterations / wall, cpu / iterations * 1e6)
+            session.commit()       # end the read snapshot between queries
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--drivers", nargs="+", default=available_drivers())
+    args = parser.parse_args()
+
+    arguments = sample_arguments()
+    print(f"{'driver':<17} {'mode':<9}" + "".join(f" {name:>24}" for name in HOT_QUERIES))
+    print(f"{'':<27}" + "".join(f" {'calls/s':>11} {'CPU µs':>12}" for _ in HOT_QUERIES))
+    for driver in args.drivers:
+        if driver not in available_drivers():
+            print(f"{driver:<17} not installed, skipped")
+            continue
+        for prepare in (False, True):
+            results = run(driver, prepare, arguments, args.iterations)
+            if results is None:
+                continue
+            print(f"{driver:<17} {'prepared' if prepare else 'plain':<9}" + "".join(
+                f" {qps:>11,.0f} {cpu_us:>12.1f}" for qps, cpu_us in results.values()))
+
+
+if __name__ == "__main__":
+    main()
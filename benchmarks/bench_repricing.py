@@ -0,0 +1,73 @@
+"""
+Bulk repricing benchmark.
+
+    python -m benchmarks.bench_repricing               # planner only, synthetic 10k portfolio
+    python -m benchmarks.bench_repricing --db AGENT_ID # also time the real transaction (rolled back)
+"""
+import random
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_EVEN
+
+import numpy as np
+
+from utils.pricing import bulk_reprice, plan_repricing
+
+PORTFOLIO_SIZE = 10_000
+PERCENTS = (5.0, -5.0, -12.0)
+REPEATS = 5
+
+
+def synthetic_portfolio(n, seed=7):
+    rng = random.Random(seed)
+    ids = list(range(1, n + 1))
+    prices = [Decimal(rng.choice([25000, 40000, 4500000, 8500000])) * Decimal(rng.uniform(0.5, 2.0)).quantize(Decimal("0.01"))
+              for _ in ids]
+    return ids, prices
+
+
+def plan_row_by_row(ids, prices, percent):
+    """Baseline: the per-row Decimal check the trigger performs, done in a Python loop."""
+    factor = Decimal(1) + Decimal(str(percent)) / 100
+    accepted, rejected = [], []
+    for pid, old in zip(ids, prices):
+        new = (old * factor).quantize(Decimal("0.01"), rounding=ROUND_HALF_EVEN)
+        (accepted if new > 0 and new >= old * Decimal("0.90") else rejected).append((pid, old, new))
+    return accepted, rejected
+
+
+def best_of(fn, repeats=REPEATS):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    ids, prices = synthetic_portfolio(PORTFOLIO_SIZE)
+    # Column arrays as the planner receives them once fetched
+    price_ids, price_array = np.asarray(ids), np.asarray(prices, dtype=np.float64)
+    print(f"Portfolio: {PORTFOLIO_SIZE:,} listings, best of {REPEATS}")
+    print(f"{'change':>8} {'row-by-row ms':>14} {'vectorized ms':>14} {'accepted':>9} {'rejected':>9}")
+    for percent in PERCENTS:
+        t_loop, (acc_loop, _) = best_of(lambda: plan_row_by_row(ids, prices, percent))
+        t_vec, plan = best_of(lambda: plan_repricing(price_ids, price_array, percent))
+        assert len(acc_loop) == plan.accepted_count, "planners disagree"
+        print(f"{percent:>+7.1f}% {t_loop * 1000:>14.2f} {t_vec * 1000:>14.2f} "
+              f"{plan.accepted_count:>9,} {plan.rejected_count:>9,}")
+
+    if "--db" in sys.argv:
+        agent_id = int(sys.argv[sys.argv.index("--db") + 1])
+        for percent in PERCENTS:
+            started = time.perf_counter()
+            accepted, rejected = bulk_reprice(agent_id=agent_id, percent=percent, commit=False)
+            elapsed = time.perf_counter() - started
+            print(f"DB {percent:+.1f}%: {len(accepted):,} accepted, {len(rejected):,} rejected "
+                  f"in {elapsed * 1000:.1f} ms (rolled back)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Row container memory benchmark: DictCursor dicts vs shared-schema CompactRows.
+
+    python -m benchmarks.bench_row_memory            # synthetic 100k catalog rows
+    python -m benchmarks.bench_row_memory --db       # also measure the real Properties catalog
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+import pymysql
+
+from db.connection import create_connection
+from db.rows import CompactCursor, compact_rows
+
+ROWS = 100_000
+CITIES = ["Bangalore", "Chennai", "Hyderabad", "Mumbai", "Pune", "Delhi", "Kolkata", "Kochi"]
+
+
+def synthetic_rows(n, seed=7):
+    """Rows shaped like fetch_all_properties(); strings are fresh objects per row, as the driver returns them."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, n + 1):
+        agent = rng.randint(2, 500)
+        rows.append({
+            "property_id": i,
+            "title": f"{rng.randint(1, 4)}BHK Apartment #{i}",
+            "price": Decimal(rng.randint(20_000, 9_000_000)),
+            "location": "".join(rng.choice(CITIES)),
+            "type": "".join(rng.choice(["For_Sale", "For_Rent"])),
+            "status": "".join("Available"),
+            "agent_name": f"Agent {agent}",
+            "agent_phone": f"98765{agent:05d}",
+            "agent_email": f"agent{agent}@example.com",
+            "agent_id": agent,
+        })
+    return rows
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def access_time(rows):
+    started = time.perf_counter()
+    total = 0
+    for r in rows:
+        total += r["agent_id"]
+        r.get("distance_km")
+    return time.perf_counter() - started
+
+
+def report(label, rows, size, build_s):
+    print(f"{label:<28} {size / 2**20:>9.1f} MiB {size / len(rows):>9.0f} B/row "
+          f"{build_s * 1000:>9.0f} ms build {access_time(rows) * 1000:>8.0f} ms scan")
+
+
+def main():
+    print(f"{'container':<28} {'memory':>13} {'per row':>13} {'':>14} {'':>12}")
+    dict_rows, dict_size, dict_s = measure(lambda: synthetic_rows(ROWS))
+    report(f"dict rows ({ROWS:,})", dict_rows, dict_size, dict_s)
+
+    # Only the conversion's own allocations: the shared values stay, the dicts go
+    compact, _, compact_s = measure(lambda: compact_rows(dict_rows))
+    del dict_rows
+    gc.collect()
+    _, compact_size, _ = measure(lambda: compact_rows(synthetic_rows(ROWS)))
+    report(f"CompactRow ({ROWS:,})", compact, compact_size, compact_s)
+    print(f"-> {dict_size / compact_size:.1f}x smaller")
+
+    if "--db" in sys.argv:
+        query = """
+            SELECT p.property_id, p.title, p.price, p.location, p.type, p.status,
+                   u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email, u.user_id AS agent_id
+            FROM Properties p JOIN Users u ON p.agent_id = u.user_id;
+        """
+        for label, cursorclass in (("DictCursor (db)", pymysql.cursors.DictCursor), ("CompactCursor (db)", CompactCursor)):
+            conn = create_connection()
+            try:
+                with conn.cursor(cursorclass) as cursor:
+                    rows, size, elapsed = measure(lambda: (cursor.execute(query), cursor.fetchall())[1])
+            finally:
+                conn.close()
+            if rows:
+                report(label, rows, size, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -194,3 +194,369 @@ DROP FOREIGN KEY Reviews_ibfk_3,
 ADD CONSTRAINT fk_rev_user FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
 ADD CONSTRAINT fk_rev_property FOREIGN KEY (property_id) REFERENCES Properties(property_id) ON DELETE CASCADE,
 ADD CONSTRAINT fk_rev_agent FOREIGN KEY (agent_id) REFERENCES Users(user_id) ON DELETE CASCADE;
+
+-- ========================
+-- TABLE VERSIONS (change polling)
+-- ========================
+-- Up to 8 counter rows per tracked table; triggers in func_trig_proc.sql
+-- bump one of them (picked by connection id) on every write, so concurrent
+-- writers rarely wait on the same row lock. A table's version is the sum of
+-- its rows, which dashboards compare to skip re-querying unchanged data.
+CREATE TABLE TableVersions (
+    table_name VARCHAR(64) NOT NULL,
+    slot TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, slot)
+);
+
+INSERT INTO TableVersions (table_name) VALUES
+('Users'), ('Properties'), ('Appointments'), ('Buys'), ('Rents'), ('Reviews');
+
+-- ========================
+-- PROPERTY COORDINATES (geo search)
+-- ========================
+-- latitude/longitude are the source of truth; geo_point and geohash are kept
+-- in sync by the BEFORE INSERT/UPDATE triggers in func_trig_proc.sql.
+-- geo_point stores POINT(longitude, latitude); POINT(0, 0) means "not geocoded".
+ALTER TABLE Properties
+ADD COLUMN latitude DECIMAL(9,6) NULL,
+ADD COLUMN longitude DECIMAL(9,6) NULL,
+ADD COLUMN geo_point POINT NOT NULL SRID 0 DEFAULT (POINT(0, 0)),
+ADD COLUMN geohash CHAR(9) NULL,
+ADD CONSTRAINT chk_latitude_range CHECK (latitude IS NULL OR latitude BETWEEN -90 AND 90),
+ADD CONSTRAINT chk_longitude_range CHECK (longitude IS NULL OR longitude BETWEEN -180 AND 180);
+
+ALTER TABLE Properties
+ADD SPATIAL INDEX idx_prop_geo_point (geo_point),
+ADD INDEX idx_prop_geohash (geohash);
+
+-- Local geocoding lookup used to place listings that only have a city name
+CREATE TABLE CityCoordinates (
+    city VARCHAR(100) PRIMARY KEY,
+    latitude DECIMAL(9,6) NOT NULL,
+    longitude DECIMAL(9,6) NOT NULL
+);
+
+INSERT INTO CityCoordinates (city, latitude, longitude) VALUES
+('Bangalore', 12.971599, 77.594566),
+('Bengaluru', 12.971599, 77.594566),
+('Chennai', 13.082680, 80.270718),
+('Hyderabad', 17.385044, 78.486671),
+('Mumbai', 19.075984, 72.877656),
+('Delhi', 28.704060, 77.102493),
+('Pune', 18.520430, 73.856744),
+('Kolkata', 22.572646, 88.363895),
+('Ahmedabad', 23.022505, 72.571362),
+('Kochi', 9.931233, 76.267304),
+('Mysore', 12.295810, 76.639381),
+('Coimbatore', 11.016844, 76.955832);
+
+-- ========================
+-- SIMILAR PROPERTY RECOMMENDATIONS
+-- ========================
+-- Precomputed top-k neighbours per listing (utils/recommend.py). similar_id
+-- has no FK on purpose: the refresh job needs to see neighbours that vanished.
+CREATE TABLE PropertySimilar (
+    property_id INT NOT NULL,
+    rank_pos TINYINT UNSIGNED NOT NULL,
+    similar_id INT NOT NULL,
+    distance FLOAT NOT NULL,
+    PRIMARY KEY (property_id, rank_pos),
+    CONSTRAINT fk_similar_property FOREIGN KEY (property_id)
+        REFERENCES Properties(property_id) ON DELETE CASCADE
+);
+
+-- Listings whose features changed since the last refresh (filled by triggers)
+CREATE TABLE RecommendationQueue (
+    property_id INT PRIMARY KEY,
+    queued_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+);
+
+-- ========================
+-- TRANSACTION HISTORY INDEXES
+-- ========================
+-- Back the per-client purchase/rental history (keyset-paginated, newest first)
+CREATE INDEX idx_buys_buyer_date ON Buys (buyer_id, date);
+CREATE INDEX idx_rents_tenant_start ON Rents (tenant_id, start_date);
+
+-- ========================
+-- PROPERTY PHOTOS
+-- ========================
+-- Image bytes live on disk under media/, addressed by their SHA-256
+-- (utils/photos.py); this table only links digests to listings.
+CREATE TABLE PropertyPhotos (
+    photo_id INT PRIMARY KEY AUTO_INCREMENT,
+    property_id INT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    is_primary TINYINT(1) NOT NULL DEFAULT 0,
+    uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_photo_property_sha (property_id, sha256),
+    INDEX idx_photo_primary (is_primary, property_id),
+    CONSTRAINT fk_photo_property FOREIGN KEY (property_id)
+        REFERENCES Properties(property_id) ON DELETE CASCADE
+);
+
+-- ========================
+-- AUDIT LOG
+-- ========================
+-- Append-only; written in batches by utils/audit.py. No FKs so events
+-- outlive the users and listings they describe.
+CREATE TABLE AuditLog (
+    event_id BIGINT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+    occurred_at DATETIME(6) NOT NULL,
+    actor_id INT NULL,
+    entity VARCHAR(32) NOT NULL,
+    entity_id INT NULL,
+    action VARCHAR(32) NOT NULL,
+    details JSON NULL,
+    INDEX idx_audit_entity (entity, entity_id, occurred_at),
+    INDEX idx_audit_actor (actor_id, occurred_at),
+    INDEX idx_audit_time (occurred_at)
+);
+
+-- ========================
+-- APPOINTMENT ARCHIVE
+-- ========================
+-- Closed (Completed/Cancelled) appointments are moved here in small chunks by
+-- utils/archive.py so the hot Appointments table only holds live bookings.
+-- RANGE partitioning was not an option: partitioned InnoDB tables cannot have
+-- foreign keys. The archive has no FKs so history survives deletions.
+CREATE TABLE AppointmentsArchive (
+    appointment_id INT PRIMARY KEY,
+    property_id INT,
+    user_id INT,
+    agent_id INT,
+    datetime DATETIME NOT NULL,
+    status ENUM('Pending', 'Confirmed', 'Completed', 'Cancelled') NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_appt_arch_user (user_id, datetime),
+    INDEX idx_appt_arch_agent (agent_id, datetime),
+    INDEX idx_appt_arch_datetime (datetime)
+);
+
+-- Hot-table indexes: archival/auto-complete scans and per-user dashboards
+CREATE INDEX idx_appt_status_datetime ON Appointments (status, datetime);
+CREATE INDEX idx_appt_user_datetime ON Appointments (user_id, datetime);
+CREATE INDEX idx_appt_agent_datetime ON Appointments (agent_id, datetime);
+
+-- ========================
+-- AGENT SCHEDULE DIGESTS
+-- ========================
+-- One precomputed row per agent with their upcoming appointments
+-- (utils/digests.py), read by the agent dashboard with a single PK lookup.
+CREATE TABLE AgentScheduleDigest (
+    agent_id INT PRIMARY KEY,
+    generated_at DATETIME NOT NULL,
+    horizon_days INT NOT NULL,
+    appointment_count INT NOT NULL,
+    digest JSON NOT NULL,
+    CONSTRAINT fk_digest_agent FOREIGN KEY (agent_id) REFERENCES Users(user_id) ON DELETE CASCADE
+);
+
+-- ========================
+-- RENT LEDGER
+-- ========================
+-- Monthly instalments are generated per lease by utils/ledger.py up to a
+-- short lookahead (Rents.dues_through records how far), on payment and by the
+-- daily `python -m utils.ledger --catch-up`; payments are
+-- allocated to the oldest unpaid instalment first.
+ALTER TABLE Rents
+ADD COLUMN rent_id INT NOT NULL AUTO_INCREMENT UNIQUE FIRST,
+ADD COLUMN dues_through DATE NULL;
+
+CREATE TABLE RentDues (
+    due_id INT PRIMARY KEY AUTO_INCREMENT,
+    rent_id INT NOT NULL,
+    due_date DATE NOT NULL,
+    period_end DATE NOT NULL,
+    amount DECIMAL(12,2) NOT NULL,
+    paid_amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_due_rent_date (rent_id, due_date),
+    INDEX idx_due_date (due_date),
+    CONSTRAINT fk_due_rent FOREIGN KEY (rent_id) REFERENCES Rents(rent_id) ON DELETE CASCADE
+);
+
+CREATE TABLE RentPayments (
+    payment_id INT PRIMARY KEY AUTO_INCREMENT,
+    rent_id INT NOT NULL,
+    amount DECIMAL(12,2) NOT NULL,
+    paid_on DATE NOT NULL,
+    recorded_by INT NULL,
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_payment_rent (rent_id, paid_on),
+    CONSTRAINT chk_payment_positive CHECK (amount > 0),
+    CONSTRAINT fk_payment_rent FOREIGN KEY (rent_id) REFERENCES Rents(rent_id) ON DELETE CASCADE
+);
+
+-- ========================
+-- USER SEARCH INDEXES
+-- ========================
+-- Prefix (LIKE 'abc%') typeahead in admin user management; email is already
+-- covered by its UNIQUE key.
+CREATE INDEX idx_users_name ON Users (name);
+CREATE INDEX idx_users_phone ON Users (phone);
+
+-- ========================
+-- SAVED SEARCHES
+-- ========================
+-- Clients' saved (type, location, max budget) searches live with Users in the
+-- main database. A new or re-listed property is matched in reverse through
+-- idx_saved_search_match: one range scan per candidate location_prefix
+-- (utils/saved_searches.py) instead of a pass over every saved search, then
+-- the same LIKE '%location%' test the Location search runs.
+CREATE TABLE SavedSearches (
+    search_id INT PRIMARY KEY AUTO_INCREMENT,
+    client_id INT NOT NULL,
+    type ENUM('For_Sale','For_Rent') NOT NULL,
+    location VARCHAR(255) NOT NULL DEFAULT '',
+    location_prefix VARCHAR(3) AS (LEFT(location, 3)) STORED,
+    max_budget DECIMAL(12,2) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_saved_search (client_id, type, location, max_budget),
+    INDEX idx_saved_search_match (type, location_prefix, max_budget),
+    CONSTRAINT fk_saved_search_client FOREIGN KEY (client_id) REFERENCES Users(user_id) ON DELETE CASCADE
+);
+
+-- Per-client inbox. Listings may live on another office shard, so the match
+-- keeps its own copy of what the client needs to see instead of an FK.
+CREATE TABLE SearchMatches (
+    match_id INT PRIMARY KEY AUTO_INCREMENT,
+    search_id INT NOT NULL,
+    client_id INT NOT NULL,
+    property_id INT NOT NULL,
+    title VARCHAR(150) NOT NULL,
+    type ENUM('For_Sale','For_Rent') NOT NULL,
+    price DECIMAL(12,2) NOT NULL,
+    location VARCHAR(255),
+    matched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    seen TINYINT(1) NOT NULL DEFAULT 0,
+    UNIQUE KEY uq_match_search_property (search_id, property_id),
+    INDEX idx_match_inbox (client_id, seen, matched_at),
+    CONSTRAINT fk_match_search FOREIGN KEY (search_id) REFERENCES SavedSearches(search_id) ON DELETE CASCADE,
+    CONSTRAINT fk_match_client FOREIGN KEY (client_id) REFERENCES Users(user_id) ON DELETE CASCADE
+);
+
+-- ========================
+-- NEAR-DUPLICATE LISTING INDEX
+-- ========================
+-- MinHash signatures (128 x uint32) of each listing's title, location and
+-- price band, and their 32 LSH band buckets (utils/dedup.py). A new listing
+-- looks up its own buckets on the primary key to find likely duplicates.
+CREATE TABLE PropertySignatures (
+    property_id INT PRIMARY KEY,
+    signature VARBINARY(512) NOT NULL,
+    CONSTRAINT fk_signature_property FOREIGN KEY (property_id) REFERENCES Properties(property_id) ON DELETE CASCADE
+);
+
+CREATE TABLE PropertyLSH (
+    band TINYINT UNSIGNED NOT NULL,
+    bucket BIGINT UNSIGNED NOT NULL,
+    property_id INT NOT NULL,
+    PRIMARY KEY (band, bucket, property_id),
+    INDEX idx_lsh_property (property_id),
+    CONSTRAINT fk_lsh_property FOREIGN KEY (property_id) REFERENCES Properties(property_id) ON DELETE CASCADE
+);
+
+-- ========================
+-- REVIEW ANALYTICS
+-- ========================
+-- One row per agent and per property, updated in the same transaction as
+-- each new review (utils/review_stats.py): rating histogram [1..5 stars],
+-- per-month [count, rating sum] and Space-Saving keyword counts. Dashboards
+-- read them with a single primary-key lookup. add_review() is the only writer
+-- of Reviews. Edits and deletes (including the cascades from deleting a user
+-- or listing) queue the affected rows in ReviewStatsQueue via triggers
+-- (func_trig_proc.sql); those rows are rebuilt from Reviews by the delete
+-- paths, or on their next read. `python -m utils.review_stats --rebuild`
+-- recomputes everything (first install, restores).
+ALTER TABLE Reviews
+ADD COLUMN created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE AgentReviewStats (
+    agent_id INT PRIMARY KEY,
+    review_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    histogram JSON NOT NULL,
+    monthly JSON NOT NULL,
+    keywords JSON NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT fk_review_stats_agent FOREIGN KEY (agent_id) REFERENCES Users(user_id) ON DELETE CASCADE
+);
+
+CREATE TABLE PropertyReviewStats (
+    property_id INT PRIMARY KEY,
+    review_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    histogram JSON NOT NULL,
+    monthly JSON NOT NULL,
+    keywords JSON NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT fk_review_stats_property FOREIGN KEY (property_id) REFERENCES Properties(property_id) ON DELETE CASCADE
+);
+
+-- Stats rows whose reviews were edited or deleted since they were last rebuilt
+CREATE TABLE ReviewStatsQueue (
+    scope ENUM('agent', 'property') NOT NULL,
+    subject_id INT NOT NULL,
+    queued_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (scope, subject_id)
+);
+
+-- ========================
+-- PRICE HISTORY AND CITY PRICE TRENDS
+-- ========================
+-- Every asking price a listing has had, written by triggers on Properties
+-- (func_trig_proc.sql) so no update path can skip it. No FK: the history
+-- outlives a deleted listing.
+CREATE TABLE PriceHistory (
+    history_id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    property_id INT NOT NULL,
+    old_price DECIMAL(12,2) NULL,
+    new_price DECIMAL(12,2) NOT NULL,
+    changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_price_history_property (property_id, changed_at)
+);
+
+-- Monthly rollups per (city, type, kind), maintained by the same triggers and
+-- by inserts into Buys/Rents. 'Asking' counts each listing or repricing in the
+-- month it happened; 'Transaction' counts sale amounts and monthly rents.
+-- Medians come from log-spaced buckets (2% wide) without reading any history.
+CREATE TABLE PriceRollups (
+    city VARCHAR(255) NOT NULL,
+    type ENUM('For_Sale','For_Rent') NOT NULL,
+    kind ENUM('Asking','Transaction') NOT NULL,
+    month DATE NOT NULL,
+    samples INT NOT NULL DEFAULT 0,
+    total DECIMAL(20,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (city, type, kind, month),
+    INDEX idx_price_rollup_month (type, kind, month)
+);
+
+CREATE TABLE PriceRollupBuckets (
+    city VARCHAR(255) NOT NULL,
+    type ENUM('For_Sale','For_Rent') NOT NULL,
+    kind ENUM('Asking','Transaction') NOT NULL,
+    month DATE NOT NULL,
+    bucket SMALLINT NOT NULL,
+    samples INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (city, type, kind, month, bucket),
+    INDEX idx_price_bucket_month (type, kind, month)
+);
+
+-- ========================
+-- LEASE CALENDAR
+-- ========================
+-- A property can carry several leases (renewals, future bookings), so rent_id
+-- becomes the primary key. Leases must not overlap; end_date is the last day
+-- (inclusive) and NULL means open-ended (lease_end reads it as 9999-12-31).
+-- utils/leases.py checks lease_end >= new_start AND start_date <= new_end,
+-- under a lock on the property row. idx_rents_property_window is ordered by
+-- lease_end, so the scan starts at the first lease still running on
+-- new_start and never reads a property's past leases.
+ALTER TABLE Rents
+ADD COLUMN lease_end DATE AS (COALESCE(end_date, DATE '9999-12-31')) STORED,
+ADD INDEX idx_rents_property_window (property_id, lease_end, start_date),
+DROP PRIMARY KEY,
+ADD PRIMARY KEY (rent_id),
+DROP INDEX rent_id;
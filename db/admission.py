@@ -0,0 +1,181 @@
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+from db.connection import create_connection
+
+# Priority classes: lower value is admitted first
+INTERACTIVE, WRITE, ANALYTICS = 0, 1, 2
+CLASS_NAMES = {INTERACTIVE: "interactive", WRITE: "write", ANALYTICS: "analytics"}
+
+# Concurrent statements this process may run (keep well below MySQL max_connections / app processes)
+MAX_CONCURRENT = int(os.environ.get("REALESTATE_DB_SLOTS", "8"))
+# Longest a request may wait for a slot before giving up
+QUEUE_TIMEOUT = {INTERACTIVE: 2.0, WRITE: 5.0, ANALYTICS: 10.0}
+# Waiters beyond this per class are turned away immediately
+MAX_WAITING = {INTERACTIVE: 64, WRITE: 32, ANALYTICS: 4}
+
+
+class DatabaseBusy(pymysql.err.OperationalError):
+    """Raised when no database slot is available in time; callers should ask the user to retry."""
+
+
+# ------------------------------------------------------------
+# Priority Admission Controller
+# ------------------------------------------------------------
+class AdmissionController:
+    """
+    Bounded counting semaphore with a priority queue in front of it.
+
+    At most `capacity` holders run at once. Waiters are woken in (priority,
+    arrival) order, each class has its own queue-time limit, and a class whose
+    queue is already full is rejected without waiting at all.
+
+    slot() is re-entrant per thread: a helper that opens its own connection
+    while its caller already holds a slot reuses that slot instead of
+    queueing behind itself.
+    """
+
+    def __init__(self, capacity=MAX_CONCURRENT, timeouts=None, max_waiting=None):
+        self.capacity = capacity
+        self.timeouts = dict(timeouts or QUEUE_TIMEOUT)
+        self.max_waiting = dict(max_waiting or MAX_WAITING)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queue = []                    # heap of (priority, seq)
+        self._waiting = {c: 0 for c in CLASS_NAMES}
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self._stats = {
+            "admitted": {c: 0 for c in CLASS_NAMES},
+            "rejected": {c: 0 for c in CLASS_NAMES},
+            "timed_out": {c: 0 for c in CLASS_NAMES},
+            "max_wait_ms": 0.0,
+            "total_wait_ms": 0.0,
+            "max_queue_depth": 0,
+        }
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        timeout = self.timeouts[priority] if timeout is None else timeout
+        started = time.monotonic()
+        with self._cond:
+            if self._active < self.capacity and not self._queue:
+                return self._admit(priority, started)
+            if self._waiting[priority] >= self.max_waiting[priority]:
+                self._stats["rejected"][priority] += 1
+                raise DatabaseBusy("The database is busy right now. Please try again in a moment.")
+
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            self._waiting[priority] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+            deadline = started + timeout
+            try:
+                while not (self._queue[0] == ticket and self._active < self.capacity):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(ticket)
+                        heapq.heapify(self._queue)
+                        self._stats["timed_out"][priority] += 1
+                        # The head may have changed; let the next waiter re-check
+                        self._cond.notify_all()
+                        raise DatabaseBusy("Timed out waiting for the database. Please try again.")
+                    self._cond.wait(remaining)
+                heapq.heappop(self._queue)
+            finally:
+                self._waiting[priority] -= 1
+            admitted = self._admit(priority, started)
+            if self._queue and self._active < self.capacity:
+                self._cond.notify_all()
+            return admitted
+
+    def _admit(self, priority, started):
+        self._active += 1
+        waited_ms = (time.monotonic() - started) * 1000
+        self._stats["admitted"][priority] += 1
+        self._stats["total_wait_ms"] += waited_ms
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+        return waited_ms
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, timeout=None):
+        depth = getattr(self._local, "depth", 0)
+        if not depth:
+            self.acquire(priority, timeout)
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if not depth:
+                self.release()
+
+    def held(self):
+        """True if the calling thread is inside slot()."""
+        return getattr(self._local, "depth", 0) > 0
+
+    def metrics(self):
+        with self._cond:
+            admitted = sum(self._stats["admitted"].values())
+            return {
+                "capacity": self.capacity,
+                "active": self._active,
+                "queue_depth": len(self._queue),
+                "waiting": {CLASS_NAMES[c]: n for c, n in self._waiting.items()},
+                "admitted": {CLASS_NAMES[c]: n for c, n in self._stats["admitted"].items()},
+                "rejected": {CLASS_NAMES[c]: n for c, n in self._stats["rejected"].items()},
+                "timed_out": {CLASS_NAMES[c]: n for c, n in self._stats["timed_out"].items()},
+                "max_queue_depth": self._stats["max_queue_depth"],
+                "max_wait_ms": round(self._stats["max_wait_ms"], 1),
+                "avg_wait_ms": round(self._stats["total_wait_ms"] / admitted, 2) if admitted else 0.0,
+            }
+
+
+# One controller per process: every Streamlit session shares it
+admission = AdmissionController()
+
+
+@contextmanager
+def admitted_connection(priority=WRITE, connect=create_connection):
+    """One slot and one connection for the length of the block; OperationalError if MySQL is unreachable."""
+    with admission.slot(priority):
+        conn = connect()
+        if conn is None:
+            raise pymysql.err.OperationalError("Could not connect to the database.")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+_RAISE = object()
+
+
+def admitted(priority=INTERACTIVE, busy=_RAISE):
+    """
+    Decorator: run the function inside admission.slot(priority), so every
+    connection it opens is counted. With `busy`, that value is returned
+    instead of raising DatabaseBusy (for reads that already degrade quietly).
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                with admission.slot(priority):
+                    return fn(*args, **kwargs)
+            except DatabaseBusy:
+                if busy is _RAISE:
+                    raise
+                return busy() if callable(busy) else busy
+        return wrapper
+    return decorate
@@ -0,0 +1,36 @@
+BULK_BATCH_SIZE = 5000
+
+
+# ------------------------------------------------------------
+# Set-Based Column Updates
+# ------------------------------------------------------------
+def bulk_update_column(cursor, table, key_column, value_column, value_type, pairs, batch_size=BULK_BATCH_SIZE):
+    """
+    Apply {key: value} updates to one column with a single UPDATE ... JOIN.
+
+    The (key, value) pairs are loaded into a session temporary table with
+    batched multi-row INSERTs, then joined in one set-based statement. Runs in
+    the caller's transaction; identifiers must come from code, never input.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return 0
+    tmp = f"tmp_bulk_{table.lower()}_{value_column}"
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {tmp};")
+    cursor.execute(f"""
+        CREATE TEMPORARY TABLE {tmp} (
+            k INT PRIMARY KEY,
+            v {value_type}
+        ) ENGINE=MEMORY;
+    """)
+    try:
+        for start in range(0, len(pairs), batch_size):
+            cursor.executemany(f"INSERT INTO {tmp} (k, v) VALUES (%s, %s);", pairs[start:start + batch_size])
+        cursor.execute(f"""
+            UPDATE {table} t
+            JOIN {tmp} b ON t.{key_column} = b.k
+            SET t.{value_column} = b.v;
+        """)
+        return cursor.rowcount
+    finally:
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {tmp};")
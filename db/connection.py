@@ -1,12 +1,17 @@
 import pymysql
 
-def create_connection():
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",            # Change if different
+    "password": "",      # Your DB password
+    "db": "real_estate_mgmt",
+}
+
+def create_connection(**overrides):
+    """Connect to the main database; keyword overrides (host, port, db, ...) select another one, e.g. a shard."""
     try:
         connection = pymysql.connect(
-            host='localhost',
-            user='root',           # Change if different
-            password='',     # Your DB password
-            db='real_estate_mgmt',
+            **{**DB_CONFIG, **overrides},
             cursorclass=pymysql.cursors.DictCursor
         )
         return connection
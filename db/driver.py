@@ -0,0 +1,228 @@
+import os
+import re
+from collections import OrderedDict
+
+import pymysql
+from db.connection import DB_CONFIG
+
+try:
+    import mysql.connector as mysql_connector
+except ImportError:          # optional: only needed for driver="mysql-connector"
+    mysql_connector = None
+
+DEFAULT_DRIVER = os.environ.get("REALESTATE_DB_DRIVER", "pymysql")
+PREPARE_STATEMENTS = os.environ.get("REALESTATE_DB_PREPARE", "0") == "1"
+MAX_PREPARED = 64            # per connection; the server caps the total at max_prepared_stmt_count
+
+# A quoted literal/identifier (backslash and doubled-quote escapes included) or a placeholder
+_PLACEHOLDER = re.compile(r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`|%(s|%)""")
+
+
+def to_qmark(sql):
+    """
+    '... WHERE email=%s AND x LIKE 'a%%'' -> '... WHERE email=? AND x LIKE 'a%''
+    for server-side PREPARE. Only a %s outside quotes becomes ?; inside a
+    quoted literal it stays text. %% is unescaped everywhere, as pymysql's
+    %-formatting does, so both paths send the same literal.
+    """
+    def replace(m):
+        if m.group(1) is None:
+            return m.group(0).replace("%%", "%")
+        return "?" if m.group(1) == "s" else "%"
+    return _PLACEHOLDER.sub(replace, sql)
+
+
+def _result(cursor):
+    """(columns, tuple rows, rowcount, lastrowid) from any DB-API cursor."""
+    if cursor.description:
+        return [d[0] for d in cursor.description], cursor.fetchall(), cursor.rowcount, cursor.lastrowid
+    return [], [], cursor.rowcount, cursor.lastrowid
+
+
+# ------------------------------------------------------------
+# Drivers
+# ------------------------------------------------------------
+class PyMySQLDriver:
+    """
+    Pure-Python driver used by the rest of the app. It has no binary-protocol
+    support, so prepared statements are SQL-level PREPARE / EXECUTE USING
+    with the arguments passed through session variables (one extra round trip).
+    """
+
+    name = "pymysql"
+    Error = pymysql.Error
+
+    def connect(self, config):
+        return pymysql.connect(**config)
+
+    def run(self, raw, sql, params):
+        with raw.cursor() as cursor:
+            cursor.execute(sql, tuple(params or ()))
+            return _result(cursor)
+
+    def prepare(self, raw, handle, sql):
+        with raw.cursor() as cursor:
+            cursor.execute(f"PREPARE {handle} FROM %s;", (to_qmark(sql),))
+        return handle
+
+    def run_prepared(self, raw, handle, sql, params):
+        with raw.cursor() as cursor:
+            using = ""
+            if params:
+                names = [f"@{handle}_{i}" for i in range(len(params))]
+                cursor.execute("SET " + ", ".join(f"{n} = %s" for n in names) + ";", tuple(params))
+                using = " USING " + ", ".join(names)
+            cursor.execute(f"EXECUTE {handle}{using};")
+            return _result(cursor)
+
+    def deallocate(self, raw, handle):
+        with raw.cursor() as cursor:
+            cursor.execute(f"DEALLOCATE PREPARE {handle};")
+
+
+class ConnectorDriver:
+    """
+    Oracle's mysql-connector-python (C extension when available). Prepared
+    statements use the binary protocol: one MySQLCursorPrepared per cached
+    statement, prepared on first execute and re-executed by id afterwards.
+    """
+
+    name = "mysql-connector"
+    Error = mysql_connector.Error if mysql_connector else pymysql.Error
+
+    def connect(self, config):
+        if mysql_connector is None:
+            raise ImportError("mysql-connector-python is not installed (pip install -r requirements.txt).")
+        config = dict(config)
+        init_command = config.pop("init_command", None)
+        if "db" in config:
+            config["database"] = config.pop("db")
+        raw = mysql_connector.connect(**config)
+        if init_command:
+            # No init_command option here; run it once like pymysql does
+            cursor = raw.cursor()
+            cursor.execute(init_command)
+            cursor.close()
+        return raw
+
+    def run(self, raw, sql, params):
+        cursor = raw.cursor()
+        try:
+            cursor.execute(sql, tuple(params or ()))
+            return _result(cursor)
+        finally:
+            cursor.close()
+
+    def prepare(self, raw, handle, sql):
+        return raw.cursor(prepared=True)
+
+    def run_prepared(self, raw, cursor, sql, params):
+        cursor.execute(to_qmark(sql), tuple(params or ()))
+        return _result(cursor)
+
+    def deallocate(self, raw, cursor):
+        cursor.close()
+
+
+DRIVERS = {driver.name: driver for driver in (PyMySQLDriver(), ConnectorDriver())}
+
+
+def available_drivers():
+    return [name for name in DRIVERS if name != "mysql-connector" or mysql_connector is not None]
+
+
+# ------------------------------------------------------------
+# Session: One Connection + Its Prepared-Statement Cache
+# ------------------------------------------------------------
+class Session:
+    """
+    A connection on either driver with one interface: query() returns dict
+    rows, execute() returns the row count. With `prepare=True` every distinct
+    SQL text is prepared once on the server and re-executed with new
+    arguments; the least recently used statement is closed beyond MAX_PREPARED.
+    Statements are per connection, so this only pays off for long-lived
+    sessions that repeat the same queries.
+    """
+
+    def __init__(self, driver, raw, prepare=PREPARE_STATEMENTS, max_prepared=MAX_PREPARED):
+        self.driver = driver
+        self.raw = raw
+        self.prepare = prepare
+        self.max_prepared = max_prepared
+        self.rowcount = 0
+        self.lastrowid = None
+        self._statements = OrderedDict()     # sql -> driver handle, least recently used first
+        self._next_id = 0
+
+    @property
+    def Error(self):
+        return self.driver.Error
+
+    def _statement(self, sql):
+        handle = self._statements.get(sql)
+        if handle is not None:
+            self._statements.move_to_end(sql)
+            return handle
+        if len(self._statements) >= self.max_prepared:
+            _, oldest = self._statements.popitem(last=False)
+            self.driver.deallocate(self.raw, oldest)
+        self._next_id += 1
+        handle = self._statements[sql] = self.driver.prepare(self.raw, f"stmt_{self._next_id}", sql)
+        return handle
+
+    def _run(self, sql, params):
+        if self.prepare:
+            result = self.driver.run_prepared(self.raw, self._statement(sql), sql, params)
+        else:
+            result = self.driver.run(self.raw, sql, params)
+        columns, rows, self.rowcount, self.lastrowid = result
+        return columns, rows
+
+    def query(self, sql, params=()):
+        columns, rows = self._run(sql, params)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def execute(self, sql, params=()):
+        self._run(sql, params)
+        return self.rowcount
+
+    @property
+    def prepared_count(self):
+        return len(self._statements)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        try:
+            for handle in self._statements.values():
+                self.driver.deallocate(self.raw, handle)
+        except self.driver.Error:
+            pass                       # the server frees them with the connection anyway
+        finally:
+            self._statements.clear()
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def connect(driver=None, prepare=None, **overrides):
+    """
+    Open a Session on `driver` ('pymysql' or 'mysql-connector'; default
+    REALESTATE_DB_DRIVER). Overrides select another database as in
+    create_connection(). Returns None if the connection fails.
+    """
+    drv = DRIVERS[driver or DEFAULT_DRIVER]
+    try:
+        raw = drv.connect({**DB_CONFIG, **overrides})
+    except Exception as e:
+        print(f"Error while connecting ({drv.name}): {e}")
+        return None
+    return Session(drv, raw, PREPARE_STATEMENTS if prepare is None else prepare)
@@ -0,0 +1,124 @@
+import sys
+from collections.abc import Mapping
+
+import pymysql
+
+# ENUM columns whose few distinct values are interned and shared by every row
+ENUM_COLUMNS = frozenset({"type", "status", "role", "source", "action", "entity"})
+
+
+# ------------------------------------------------------------
+# Shared Schema + Slotted Row
+# ------------------------------------------------------------
+class RowSchema:
+    """Column names and their positions, created once per result set and shared by all its rows."""
+
+    __slots__ = ("columns", "index", "enum_positions")
+
+    def __init__(self, columns, enum_columns=ENUM_COLUMNS):
+        self.columns = tuple(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.enum_positions = tuple(i for i, name in enumerate(self.columns) if name in enum_columns)
+
+    def row(self, values, pool=None):
+        """
+        Build a row. ENUM columns are always interned; with a `pool` dict every
+        repeated string (city, agent name/phone/email, ...) is stored once per
+        result set instead of once per row.
+        """
+        values = list(values)
+        for i in self.enum_positions:
+            if isinstance(values[i], str):
+                values[i] = sys.intern(values[i])
+        if pool is not None:
+            for i, v in enumerate(values):
+                if isinstance(v, str):
+                    values[i] = pool.setdefault(v, v)
+        return CompactRow(self, tuple(values))
+
+
+class CompactRow(Mapping):
+    """
+    Read-only mapping over a values tuple. Supports row["col"], row.get(),
+    keys/items/values, `in`, dict(row) and pandas.DataFrame(rows), so it can
+    stand in for DictCursor rows, at a fraction of a dict's size.
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._schema.index[key]]
+
+    def __iter__(self):
+        return iter(self._schema.columns)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._schema.index
+
+    def get(self, key, default=None):
+        i = self._schema.index.get(key)
+        return default if i is None else self._values[i]
+
+    def __eq__(self, other):
+        if isinstance(other, CompactRow):
+            return self._schema.columns == other._schema.columns and self._values == other._values
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"CompactRow({dict(self)!r})"
+
+
+def compact_rows(rows, enum_columns=ENUM_COLUMNS):
+    """Convert a list of dict rows (all sharing the same keys) into CompactRows with one shared schema."""
+    if not rows or not isinstance(rows, list) or not isinstance(rows[0], dict):
+        return rows
+    schema = RowSchema(rows[0].keys(), enum_columns)
+    columns = schema.columns
+    pool = {}
+    return [schema.row([r[c] for c in columns], pool) for r in rows]
+
+
+# ------------------------------------------------------------
+# Cursors Producing Compact Rows
+# ------------------------------------------------------------
+class CompactCursorMixin:
+    """Like pymysql's DictCursorMixin, but rows share one RowSchema instead of each carrying its keys."""
+
+    enum_columns = ENUM_COLUMNS
+
+    def _do_get_result(self):
+        super()._do_get_result()
+        self._schema = None
+        if self.description:
+            fields = []
+            for f in self._result.fields:
+                name = f.name
+                if name in fields:
+                    name = f"{f.table_name}.{name}"
+                fields.append(name)
+            self._schema = RowSchema(fields, self.enum_columns)
+        if self._schema and self._rows:
+            pool = {}
+            self._rows = [self._schema.row(r, pool) for r in self._rows]
+
+    def _conv_row(self, row):
+        if row is None:
+            return None
+        return self._schema.row(row)
+
+
+class CompactCursor(CompactCursorMixin, pymysql.cursors.Cursor):
+    """Buffered cursor returning CompactRows."""
+
+
+class SSCompactCursor(CompactCursorMixin, pymysql.cursors.SSCursor):
+    """Unbuffered (streaming) cursor returning CompactRows."""
@@ -0,0 +1,260 @@
+import heapq
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+from db.admission import admission, admitted, ANALYTICS, INTERACTIVE, WRITE
+from db.connection import create_connection
+
+USER_COLUMNS = ("user_id", "name", "email", "phone", "role", "password")
+
+
+# ------------------------------------------------------------
+# Shard Map
+# ------------------------------------------------------------
+class ShardMap:
+    """
+    City -> shard routing. `config` is {"shards": {name: create_connection()
+    overrides}, "cities": {city: name}, "default": name}; an empty override
+    set is the main database, which also holds the Users directory. Without
+    a config there is a single shard, the main database.
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.shards = config.get("shards") or {"main": {}}
+        self.names = list(self.shards)
+        self.cities = {shard_key(c): s for c, s in (config.get("cities") or {}).items()}
+        self.default = config.get("default") or self.names[0]
+        unknown = ({self.default} | set(self.cities.values())) - set(self.shards)
+        if unknown:
+            raise ValueError(f"Shard map references undefined shard(s): {', '.join(sorted(unknown))}")
+
+    @property
+    def sharded(self):
+        return len(self.names) > 1
+
+    def shard_for_location(self, location):
+        return self.cities.get(shard_key(location), self.default)
+
+    def is_directory(self, name):
+        # A shard with no overrides is the main database, which holds the directory itself
+        return not self.shards[name]
+
+
+def shard_key(location):
+    """Normalised city used as the shard key: 'Bangalore, Whitefield' -> 'bangalore'."""
+    return (location or "").split(",")[0].strip().lower()
+
+
+# Only the single main-database shard is used for now: the client, agent,
+# booking, photo and catalog paths still read and write create_connection(),
+# so listings placed on another shard would be invisible there. The fan-out,
+# merge and directory helpers below already iterate shard_names().
+_shard_map = ShardMap()
+
+
+def load_shard_map():
+    return _shard_map
+
+
+def shard_names():
+    return load_shard_map().names
+
+
+def shard_for_location(location):
+    return load_shard_map().shard_for_location(location)
+
+
+# ------------------------------------------------------------
+# Connections
+# ------------------------------------------------------------
+def connect_shard(name):
+    """
+    Open a connection to shard `name`. AUTO_INCREMENT values are interleaved
+    across shards (increment = shard count, offset = shard position) so
+    property, appointment and review ids stay globally unique when merged.
+    """
+    shard_map = load_shard_map()
+    overrides = dict(shard_map.shards[name])
+    if shard_map.sharded:
+        overrides["init_command"] = (
+            f"SET SESSION auto_increment_increment = {len(shard_map.names)}, "
+            f"auto_increment_offset = {shard_map.names.index(name) + 1}"
+        )
+    return create_connection(**overrides)
+
+
+def connect_directory():
+    """The global directory (Users) lives in the main database."""
+    return create_connection()
+
+
+@admitted(WRITE)
+def route_execute(location, query, params=()):
+    """Run a write on the shard owning `location`; returns (shard, lastrowid)."""
+    shard = shard_for_location(location)
+    conn = connect_shard(shard)
+    if not conn:
+        raise pymysql.err.OperationalError(f"Could not connect to shard '{shard}'.")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            row_id = cursor.lastrowid
+        conn.commit()
+        return shard, row_id
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Fan-Out Queries
+# ------------------------------------------------------------
+def each_shard(fn, shards=None, priority=INTERACTIVE):
+    """
+    Call fn(connect) once per shard concurrently, where connect() opens that
+    shard's connection. Each call holds its own admission slot, so a fan-out
+    over N shards counts as N connections. Returns {shard: result}; any
+    shard's error is raised.
+    """
+    names = shards or shard_names()
+
+    def run(name):
+        with admission.slot(priority):
+            return fn(lambda: connect_shard(name))
+
+    if len(names) == 1 or admission.held():
+        # A caller already holding a slot visits the shards one by one under it
+        # rather than waiting on worker slots while keeping its own
+        return {name: run(name) for name in names}
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        futures = {name: pool.submit(run, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def fan_out(query, params=(), shards=None, priority=ANALYTICS):
+    """Run one read-only query on every shard. Returns {shard: rows}."""
+    def run(connect):
+        conn = connect()
+        if not conn:
+            raise pymysql.err.OperationalError("Could not connect to shard.")
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(query, params)
+                return list(cursor.fetchall())
+        finally:
+            conn.close()
+    return each_shard(run, shards, priority)
+
+
+def merge_sorted(results, key, reverse=False, limit=None):
+    """Merge per-shard row lists that are already ordered by `key`."""
+    merged = heapq.merge(*results.values(), key=lambda r: r[key], reverse=reverse)
+    return [row for _, row in zip(range(limit), merged)] if limit else list(merged)
+
+
+def merge_grouped(results, group_by, sums):
+    """Combine per-shard GROUP BY rows by re-summing the `sums` columns per group."""
+    merged = {}
+    for rows in results.values():
+        for row in rows:
+            group = tuple(row[k] for k in group_by)
+            if group not in merged:
+                merged[group] = dict(row)
+            else:
+                for col in sums:
+                    merged[group][col] = (merged[group][col] or 0) + (row[col] or 0)
+    return list(merged.values())
+
+
+# ------------------------------------------------------------
+# Global User Directory
+# ------------------------------------------------------------
+def sync_users(user_ids=None, emails=None):
+    """
+    Copy Users rows from the directory into every other shard so local joins
+    and foreign keys keep working there. With no filter the whole (small)
+    table is synchronised. Returns the number of rows copied.
+    """
+    shard_map = load_shard_map()
+    targets = [n for n in shard_map.names if not shard_map.is_directory(n)]
+    if not targets:
+        return 0
+    clauses, params = [], []
+    if user_ids:
+        clauses.append(f"user_id IN ({', '.join(['%s'] * len(user_ids))})")
+        params += list(user_ids)
+    if emails:
+        clauses.append(f"email IN ({', '.join(['%s'] * len(emails))})")
+        params += list(emails)
+    where = f"WHERE {' OR '.join(clauses)}" if clauses else ""
+
+    # The directory slot is released before the per-shard copies take their own
+    with admission.slot(WRITE):
+        conn = connect_directory()
+        if not conn:
+            raise pymysql.err.OperationalError("Could not connect to the user directory.")
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(f"SELECT {', '.join(USER_COLUMNS)} FROM Users {where};", tuple(params))
+                rows = [tuple(r[c] for c in USER_COLUMNS) for r in cursor.fetchall()]
+        finally:
+            conn.close()
+    if not rows:
+        return 0
+
+    def copy(connect):
+        shard = connect()
+        if not shard:
+            raise pymysql.err.OperationalError("Could not connect to shard.")
+        try:
+            with shard.cursor() as cursor:
+                updates = ", ".join(f"{c} = VALUES({c})" for c in USER_COLUMNS[1:])
+                cursor.executemany(f"""
+                    INSERT INTO Users ({', '.join(USER_COLUMNS)})
+                    VALUES ({', '.join(['%s'] * len(USER_COLUMNS))})
+                    ON DUPLICATE KEY UPDATE {updates};
+                """, rows)
+            shard.commit()
+        except pymysql.Error:
+            shard.rollback()
+            raise
+        finally:
+            shard.close()
+
+    each_shard(copy, targets, WRITE)
+    return len(rows)
+
+
+def remove_user(user_id):
+    """Delete a user from every non-directory shard (the caller deletes the directory row)."""
+    shard_map = load_shard_map()
+    targets = [n for n in shard_map.names if not shard_map.is_directory(n)]
+
+    def delete(connect):
+        shard = connect()
+        if not shard:
+            raise pymysql.err.OperationalError("Could not connect to shard.")
+        try:
+            with shard.cursor() as cursor:
+                cursor.execute("DELETE FROM Users WHERE user_id = %s;", (user_id,))
+            shard.commit()
+        finally:
+            shard.close()
+
+    if targets:
+        each_shard(delete, targets, WRITE)
+
+
+if __name__ == "__main__":
+    shard_map = load_shard_map()
+    if "--sync-users" in sys.argv:
+        print(f"Synchronised {sync_users()} user(s) to {len(shard_map.names)} shard(s).")
+    counts = fan_out("SELECT COUNT(*) AS properties FROM Properties;")
+    for name in shard_map.names:
+        cities = sorted(c for c, s in shard_map.cities.items() if s == name)
+        default = " (default)" if name == shard_map.default else ""
+        print(f"{name}{default}: {counts[name][0]['properties']} properties; cities: {', '.join(cities) or '-'}")
@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+
+import pymysql
+from db.admission import admitted, INTERACTIVE
+from db.connection import create_connection
+from db.rows import compact_rows
+
+# Tables whose writes bump a row in TableVersions (see func_trig_proc.sql)
+TRACKED_TABLES = ("Users", "Properties", "Appointments", "Buys", "Rents", "Reviews")
+
+MAX_CACHED_RESULTS = 256
+MAX_IDLE_CONNECTIONS = 4     # version reads reuse these instead of connecting per call
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_idle = []
+_idle_lock = threading.Lock()
+
+
+# ------------------------------------------------------------
+# Version Reads
+# ------------------------------------------------------------
+def _borrow_connection():
+    with _idle_lock:
+        if _idle:
+            return _idle.pop(), True
+    # autocommit: every lookup is its own transaction, so a reused session never reads an old snapshot
+    return create_connection(autocommit=True), False
+
+
+def _return_connection(conn):
+    with _idle_lock:
+        if len(_idle) < MAX_IDLE_CONNECTIONS:
+            _idle.append(conn)
+            return
+    conn.close()
+
+
+@admitted(INTERACTIVE, busy=None)
+def fetch_versions(tables=TRACKED_TABLES):
+    """
+    Return {table_name: version}, or None on error. Each table's version is
+    the sum of its counter rows (one short index range per table), read on
+    a pooled connection.
+    """
+    placeholders = ", ".join(["%s"] * len(tables))
+    while True:
+        conn, reused = _borrow_connection()
+        if not conn:
+            return None
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(f"""
+                    SELECT table_name, SUM(version) AS version
+                    FROM TableVersions
+                    WHERE table_name IN ({placeholders})
+                    GROUP BY table_name;
+                """, tuple(tables))
+                versions = {row["table_name"]: int(row["version"]) for row in cursor.fetchall()}
+        except pymysql.Error as e:
+            conn.close()
+            if reused:
+                continue             # the server dropped an idle connection; try another
+            print(f"Error reading table versions: {e}")
+            return None
+        _return_connection(conn)
+        return versions
+
+
+def version_stamp(tables):
+    versions = fetch_versions(tables)
+    if versions is None:
+        return None
+    return tuple(versions.get(t, 0) for t in tables)
+
+
+# ------------------------------------------------------------
+# Version-Checked Result Cache
+# ------------------------------------------------------------
+def cached_query(key, tables, loader):
+    """
+    Return loader() for `key`, re-running it only when one of `tables`
+    has been written since the cached result was produced. Row lists are
+    stored as CompactRows (see db/rows.py) so long-lived entries stay small.
+    """
+    stamp = version_stamp(tables)
+    if stamp is None:
+        return loader()
+
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None and hit[0] == stamp:
+            _cache.move_to_end(key)
+            return hit[1]
+
+    result = loader()
+    if result is None:
+        return result
+    result = compact_rows(result)
+
+    with _cache_lock:
+        _cache[key] = (stamp, result)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_RESULTS:
+            _cache.popitem(last=False)
+    return result
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -1,6 +1,25 @@
 import streamlit as st
 import pymysql
 from db.connection import create_connection
+from db.admission import admission, admitted_connection, DatabaseBusy, ANALYTICS, WRITE
+from db.versions import cached_query
+from db.sharding import each_shard, fan_out, merge_grouped, merge_sorted, remove_user, sync_users
+from utils.audit import audit, audit_writer, fetch_audit_events, ENTITIES
+from utils.geo import geocode_properties, import_city_coordinates
+from utils.recommend import refresh_recommendations
+from utils.leases import end_current_lease
+from utils.review_stats import refresh_queued_review_stats
+from frontend.agent import display_bulk_repricing, display_price_trend
+from utils.assignment import auto_assign_unassigned
+from utils.digests import build_schedule_digests, DIGEST_HORIZON_DAYS
+from utils.ledger import (fetch_rent_ledger, fetch_ledger_totals, fetch_lease_dues, record_rent_payment,
+                          monthly_rental_income, LEDGER_PAGE_SIZE)
+from utils.user_search import search_users
+from utils.saved_searches import match_listing
+from utils.dedup import find_duplicate_clusters_all_shards, index_listing, DUPLICATE_THRESHOLD
+from utils.price_trends import fetch_price_trends, fetch_trend_cities
+from utils.auth import hash_password, AuthBusy
+from utils.archive import archive_closed_appointments, fetch_archive_stats, ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE
 import re
 
 def is_valid_email(email):
@@ -13,18 +32,64 @@ def is_valid_email(email):
 # Helper Function: Execute Queries
 # ------------------------------------------------------------
 def run_query(query, params=(), fetch=False):
-    conn = create_connection()
+    # Take a database slot first so a traffic spike queues here instead of exhausting MySQL connections
     try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(query, params)
-            if fetch:
-                return cursor.fetchall()
-            conn.commit()
+        with admission.slot(ANALYTICS if fetch else WRITE):
+            conn = create_connection()
+            if conn is None:
+                st.error("❌ Could not connect to the database.")
+                return None
+            try:
+                with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                    cursor.execute(query, params)
+                    if fetch:
+                        return cursor.fetchall()
+                    conn.commit()
+                    return True
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+                conn.rollback()
+            finally:
+                conn.close()
+    except DatabaseBusy as e:
+        st.warning(f"⏳ {e}")
+        return None
+
+
+def run_fan_out(query, params=()):
+    """Run a read on every shard; returns {shard: rows}, or {} after reporting the error."""
+    try:
+        # fan_out() takes one ANALYTICS slot per shard connection
+        return fan_out(query, params, priority=ANALYTICS)
+    except DatabaseBusy as e:
+        st.warning(f"⏳ {e}")
+        return {}
     except pymysql.Error as e:
         st.error(f"❌ Database Error: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        return {}
+
+
+def sync_directory(user_ids=None, emails=None):
+    try:
+        sync_users(user_ids, emails)
+    except pymysql.Error as e:
+        st.warning(f"⚠️ Saved, but copying the user to every office shard failed: {e}")
+
+
+def select_users(key, role=None):
+    """Typeahead over name/email/phone prefixes; returns only the users the admin picks."""
+    query = st.text_input("🔍 Search by name, email or phone (prefix)", key=f"{key}_search")
+    if not query.strip():
+        st.caption("Start typing to find users.")
+        return []
+    matches, elapsed_ms = search_users(query, role)
+    if not matches:
+        st.info("No matching users.")
+        return []
+    st.caption(f"Top {len(matches)} match(es) in {elapsed_ms:.1f} ms")
+    labels = {m["user_id"]: f"{m['name']} · {m['email']} · {m['phone'] or '—'}" for m in matches}
+    picked = st.multiselect("Select users to manage", list(labels), format_func=labels.get, key=f"{key}_pick")
+    return [m for m in matches if m["user_id"] in picked]
 
 
 # ------------------------------------------------------------
@@ -37,7 +102,9 @@ def admin_dashboard(user):
         "👥 Manage Users",
         "📅 View All Appointments",
         "📑 View All Transactions",
+        "📒 Rent Ledger",
         "💰 System Insights",
+        "🧾 Audit Log",
         "⚙️ Maintenance",
     ])
 
@@ -47,15 +114,16 @@ def admin_dashboard(user):
     if menu.startswith("🏡"):
         st.markdown("## 🏠 Property Management")
 
-        props = run_query("""
+        props = cached_query(("admin_properties",), ("Properties", "Users"), lambda: run_query("""
             SELECT p.property_id, p.title, p.price, p.location, p.type, p.status,
                    u.name AS agent_name, u.user_id AS agent_id
             FROM Properties p
             LEFT JOIN Users u ON p.agent_id = u.user_id
             ORDER BY p.status DESC, p.property_id ASC;
-        """, fetch=True)
+        """, fetch=True))
 
-        agents = run_query("SELECT user_id, name FROM Users WHERE role='Agent';", fetch=True)
+        agents = cached_query(("admin_agents",), ("Users",), lambda: run_query(
+            "SELECT user_id, name FROM Users WHERE role='Agent';", fetch=True))
 
         # --- UNASSIGNED PROPERTIES ---
         st.subheader("🏠 Unassigned Properties")
@@ -63,6 +131,23 @@ def admin_dashboard(user):
         if not unassigned:
             st.info("✅ No unassigned properties.")
         else:
+            with st.container():
+                st.markdown(f"**{len(unassigned)}** listing(s) without an agent.")
+                col1, col2, col3 = st.columns([1, 1, 1])
+                with col1: prefer_city = st.checkbox("Prefer agents in the same city", value=True)
+                with col2: rating_weight = st.slider("Rating weight", 0.0, 2.0, 0.5, 0.25)
+                with col3: auto_btn = st.button("⚡ Auto-Assign All")
+                if auto_btn:
+                    try:
+                        assigned = auto_assign_unassigned(prefer_city=prefer_city, rating_weight=rating_weight)
+                        if assigned:
+                            audit(user["user_id"], "Property", None, "auto_assign", count=len(assigned))
+                            st.success(f"✅ {len(assigned)} listing(s) assigned across agents.")
+                            st.rerun()
+                        else:
+                            st.warning("⚠️ No agents available to assign.")
+                    except pymysql.Error as e:
+                        st.error(f"❌ Database Error: {e}")
             for p in unassigned:
                 st.markdown(f"""
                 <div style='background-color:#252525;padding:15px;border-radius:12px;margin-bottom:10px;'>
@@ -81,10 +166,20 @@ def admin_dashboard(user):
                 )
                 if st.button("Assign Agent", key=f"assign_{p['property_id']}"):
                     agent_id = next(a["user_id"] for a in agents if a["name"] == new_agent)
-                    run_query("UPDATE Properties SET agent_id=%s WHERE property_id=%s", (agent_id, p["property_id"]))
+                    if run_query("UPDATE Properties SET agent_id=%s WHERE property_id=%s", (agent_id, p["property_id"])):
+                        audit(user["user_id"], "Property", p["property_id"], "assign_agent", new_agent_id=agent_id)
                     st.success(f"✅ Property '{p['title']}' assigned to {new_agent}.")
                     st.rerun()
 
+        st.divider()
+        with st.expander("📈 Bulk Repricing"):
+            agent_filter = st.selectbox("Agent", ["All Agents"] + [f"{a['user_id']} - {a['name']}" for a in agents], key="reprice_agent")
+            display_bulk_repricing(
+                user,
+                agent_id=None if agent_filter == "All Agents" else int(agent_filter.split(" - ")[0]),
+                key_prefix="admin",
+            )
+
         st.divider()
         st.subheader("🏘️ All Properties")
 
@@ -129,29 +224,50 @@ def admin_dashboard(user):
 
                 if st.button("💾 Update Property", key=f"update_{p['property_id']}"):
                     try:
-                        conn = create_connection()
-                        with conn.cursor() as cursor:
-                            agent_id = None if new_agent == "Unassigned" else next(
-                                (a["user_id"] for a in agents if a["name"] == new_agent), None
-                            )
-                            cursor.execute("""
-                                UPDATE Properties
-                                SET price=%s, status=%s, agent_id=%s
-                                WHERE property_id=%s;
-                            """, (new_price, new_status, agent_id, p["property_id"]))
-
-                            # Clean up Buys/Rents if reset to Available
-                            if new_status == "Available":
-                                cursor.execute("DELETE FROM Buys WHERE property_id=%s", (p["property_id"],))
-                                cursor.execute("DELETE FROM Rents WHERE property_id=%s", (p["property_id"],))
-                        conn.commit()
+                        with admitted_connection(WRITE) as conn:
+                            try:
+                                with conn.cursor() as cursor:
+                                    agent_id = None if new_agent == "Unassigned" else next(
+                                        (a["user_id"] for a in agents if a["name"] == new_agent), None
+                                    )
+                                    cursor.execute("""
+                                        UPDATE Properties
+                                        SET price=%s, status=%s, agent_id=%s
+                                        WHERE property_id=%s;
+                                    """, (new_price, new_status, agent_id, p["property_id"]))
+                                    if float(new_price) != float(p["price"]):
+                                        index_listing(cursor, p["property_id"], p["title"], p["location"], new_price)
+
+                                    # Reset to Available: undo the sale, or end only the lease running today
+                                    # (future bookings, past leases and their payments stay)
+                                    if new_status == "Available":
+                                        if p["type"] == "For_Rent":
+                                            end_current_lease(cursor, p["property_id"])
+                                        else:
+                                            cursor.execute("DELETE FROM Buys WHERE property_id=%s", (p["property_id"],))
+                                        # Back on the market: tell clients whose saved searches it now satisfies
+                                        if p["status"] != "Available":
+                                            match_listing(cursor, p["property_id"], p["type"], new_price,
+                                                          p["location"], p["title"])
+                                conn.commit()
+                            except Exception:
+                                conn.rollback()
+                                raise
+                        changes = {}
+                        if float(new_price) != float(p["price"]):
+                            changes.update(old_price=p["price"], new_price=new_price)
+                        if new_status != p["status"]:
+                            changes.update(old_status=p["status"], new_status=new_status)
+                        if agent_id != p["agent_id"]:
+                            changes.update(old_agent_id=p["agent_id"], new_agent_id=agent_id)
+                        if changes:
+                            audit(user["user_id"], "Property", p["property_id"], "update", **changes)
                         st.success(f"✅ '{p['title']}' updated successfully!")
                         st.rerun()
+                    except ValueError as e:
+                        st.error(f"❌ {e}")
                     except pymysql.Error as e:
-                        conn.rollback()
                         st.error(f"❌ Database Error: {e}")
-                    finally:
-                        conn.close()
 
     # =========================================================
     # 👥 USER MANAGEMENT
@@ -162,7 +278,7 @@ def admin_dashboard(user):
 
         # --- AGENTS TAB ---
         with tabs[0]:
-            agents = run_query("SELECT user_id, name, email, phone FROM Users WHERE role='Agent' ORDER BY user_id;", fetch=True)
+            agents = select_users("agents", "Agent")
             if agents:
                 for a in agents:
                     st.markdown(f"""
@@ -173,20 +289,32 @@ def admin_dashboard(user):
                     """, unsafe_allow_html=True)
 
                     delete_confirm = st.checkbox(f"Confirm delete {a['name']}", key=f"confirm_del_agent_{a['user_id']}")
+                    reassign = st.checkbox("Reassign their listings to other agents", value=True, key=f"reassign_agent_{a['user_id']}")
                     if st.button("🗑️ Delete Agent", key=f"delete_agent_{a['user_id']}"):
                         if delete_confirm:
+                            portfolio = run_query("SELECT property_id FROM Properties WHERE agent_id=%s", (a["user_id"],), fetch=True) or []
                             run_query("UPDATE Properties SET agent_id=NULL WHERE agent_id=%s", (a["user_id"],))
-                            run_query("DELETE FROM Users WHERE user_id=%s", (a["user_id"],))
-                            st.success(f"✅ Agent '{a['name']}' deleted and their properties unassigned.")
+                            if run_query("DELETE FROM Users WHERE user_id=%s", (a["user_id"],)):
+                                remove_user(a["user_id"])
+                                refresh_queued_review_stats()
+                                audit(user["user_id"], "User", a["user_id"], "delete", role="Agent", name=a["name"])
+                            if reassign and portfolio:
+                                try:
+                                    assigned = auto_assign_unassigned(property_ids=[r["property_id"] for r in portfolio])
+                                    audit(user["user_id"], "Property", None, "auto_assign", count=len(assigned),
+                                          from_agent_id=a["user_id"])
+                                    st.success(f"✅ Agent '{a['name']}' deleted; {len(assigned)} listing(s) reassigned.")
+                                except pymysql.Error as e:
+                                    st.error(f"❌ Agent deleted but reassignment failed: {e}")
+                            else:
+                                st.success(f"✅ Agent '{a['name']}' deleted and their properties unassigned.")
                             st.rerun()
                         else:
                             st.warning("⚠️ Please confirm deletion using the checkbox first.")
-            else:
-                st.info("No agents yet.")
 
         # --- CLIENTS TAB ---
         with tabs[1]:
-            clients = run_query("SELECT user_id, name, email, phone FROM Users WHERE role='Client';", fetch=True)
+            clients = select_users("clients", "Client")
             if clients:
                 for c in clients:
                     st.markdown(f"""
@@ -199,17 +327,18 @@ def admin_dashboard(user):
                     delete_confirm = st.checkbox(f"Confirm delete {c['name']}", key=f"confirm_del_client_{c['user_id']}")
                     if st.button("🗑️ Delete Client", key=f"delete_client_{c['user_id']}"):
                         if delete_confirm:
-                            run_query("DELETE FROM Users WHERE user_id=%s", (c["user_id"],))
+                            if run_query("DELETE FROM Users WHERE user_id=%s", (c["user_id"],)):
+                                remove_user(c["user_id"])
+                                refresh_queued_review_stats()
+                                audit(user["user_id"], "User", c["user_id"], "delete", role="Client", name=c["name"])
                             st.success(f"✅ Client '{c['name']}' deleted successfully.")
                             st.rerun()
                         else:
                             st.warning("⚠️ Please confirm deletion using the checkbox first.")
-            else:
-                st.info("No clients found.")
 
         # --- ALL USERS TAB ---
         with tabs[2]:
-            users = run_query("SELECT user_id, name, email, phone, role FROM Users;", fetch=True)
+            users = select_users("all_users")
             if users:
                 for u in users:
                     st.markdown(f"""
@@ -229,11 +358,12 @@ def admin_dashboard(user):
 
                     if new_role != u["role"]:
                         if st.button(f"Update Role for {u['name']}", key=f"update_{u['user_id']}"):
-                            run_query("UPDATE Users SET role=%s WHERE user_id=%s", (new_role, u["user_id"]))
+                            if run_query("UPDATE Users SET role=%s WHERE user_id=%s", (new_role, u["user_id"])):
+                                sync_directory(user_ids=[u["user_id"]])
+                                audit(user["user_id"], "User", u["user_id"], "role_change",
+                                      old_role=u["role"], new_role=new_role)
                             st.success(f"✅ Role updated for {u['name']} → {new_role}")
                             st.rerun()
-            else:
-                st.info("No users found.")
 
         # --- CREATE NEW USER TAB ---
         with tabs[3]:
@@ -251,13 +381,16 @@ def admin_dashboard(user):
                         st.error("❌ Please enter a valid email address (e.g., name@domain.ext).")
                 else:
                     try:
-                        run_query(
+                        if run_query(
                             "INSERT INTO Users (name, email, phone, role, password) VALUES (%s, %s, %s, %s, %s)",
-                            (name.strip(), email.strip().lower(), phone.strip(), role, password)
-                        )
+                            (name.strip(), email.strip().lower(), phone.strip(), role, hash_password(password))
+                        ):
+                            sync_directory(emails=[email.strip().lower()])
                         st.success(f"✅ {role} '{name}' created successfully!")
                     except pymysql.err.IntegrityError:
                         st.error("🚫 This email is already registered. Use a different email.")
+                    except AuthBusy as e:
+                        st.warning(f"⏳ {e}")
                     except Exception as e:
                         st.error(f"❌ Error creating user: {e}")
 
@@ -294,14 +427,25 @@ def admin_dashboard(user):
     # =========================================================
     elif menu.startswith("📅"):
         st.markdown("## 📋 All Appointments Overview")
-        appts = run_query("""
+        include_archived = st.checkbox("🗄️ Include archived appointments")
+        archived = """
+            UNION ALL
+            SELECT a.appointment_id, a.datetime, a.status,
+                   u.name AS client, ag.name AS agent, p.title AS property
+            FROM AppointmentsArchive a
+            LEFT JOIN Users u ON a.user_id = u.user_id
+            LEFT JOIN Users ag ON a.agent_id = ag.user_id
+            LEFT JOIN Properties p ON a.property_id = p.property_id
+        """ if include_archived else ""
+        appts = run_query(f"""
             SELECT a.appointment_id, a.datetime, a.status,
                    u.name AS client, ag.name AS agent, p.title AS property
             FROM Appointments a
             JOIN Users u ON a.user_id = u.user_id
             JOIN Users ag ON a.agent_id = ag.user_id
             JOIN Properties p ON a.property_id = p.property_id
-            ORDER BY a.datetime DESC;
+            {archived}
+            ORDER BY datetime DESC;
         """, fetch=True)
 
         if not appts:
@@ -325,7 +469,8 @@ def admin_dashboard(user):
         st.markdown("## 📑 All Transactions")
 
         st.subheader("🏠 Sales Transactions")
-        sales = run_query("""
+        # Each office shard returns its rows already ordered; merge them by date
+        sales = merge_sorted(run_fan_out("""
             SELECT b.property_id, p.title, u.name AS buyer, ag.name AS agent,
                    b.amount, b.date, CalculateAgentCommission(b.amount) AS commission
             FROM Buys b
@@ -333,7 +478,7 @@ def admin_dashboard(user):
             JOIN Users u ON b.buyer_id = u.user_id
             LEFT JOIN Users ag ON p.agent_id = ag.user_id
             ORDER BY b.date DESC;
-        """, fetch=True)
+        """), key="date", reverse=True)
 
         if sales:
             for s in sales:
@@ -351,7 +496,7 @@ def admin_dashboard(user):
             st.info("No sales transactions found.")
 
         st.subheader("🏡 Rental Transactions")
-        rentals = run_query("""
+        rentals = merge_sorted(run_fan_out("""
             SELECT r.property_id, p.title, u.name AS tenant, ag.name AS agent,
                    r.rent_amount, r.start_date, r.end_date
             FROM Rents r
@@ -359,7 +504,7 @@ def admin_dashboard(user):
             JOIN Users u ON r.tenant_id = u.user_id
             LEFT JOIN Users ag ON p.agent_id = ag.user_id
             ORDER BY r.start_date DESC;
-        """, fetch=True)
+        """), key="start_date", reverse=True)
 
         if rentals:
             for r in rentals:
@@ -375,22 +520,105 @@ def admin_dashboard(user):
         else:
             st.info("No rental transactions found.")
 
+    # =========================================================
+    # 📒 RENT LEDGER
+    # =========================================================
+    elif menu.startswith("📒"):
+        st.markdown("## 📒 Rent Ledger")
+
+        only_overdue = st.checkbox("Show only leases with overdue rent")
+        page = st.session_state.get("ledger_page", 0)
+        try:
+            totals = fetch_ledger_totals()
+            ledger, total = fetch_rent_ledger(page, only_overdue)
+            if not ledger and total:
+                # The filter shrank the list below the remembered page
+                page = st.session_state.ledger_page = 0
+                ledger, total = fetch_rent_ledger(page, only_overdue)
+        except pymysql.Error as e:
+            st.error(f"❌ Database Error: {e}")
+            ledger, total = [], 0
+
+        if not ledger:
+            st.info("No leases found.")
+        else:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("💰 Outstanding", f"₹{totals['outstanding']:,}")
+            col2.metric("⏰ Overdue", f"₹{totals['overdue']:,}")
+            col3.metric("🏠 Leases in Arrears", totals["leases_in_arrears"])
+
+            pages = (total + LEDGER_PAGE_SIZE - 1) // LEDGER_PAGE_SIZE
+            st.caption(f"Page {page + 1} of {pages} · {total} lease(s)")
+            for l in ledger:
+                status = (f"🔴 ₹{l['overdue']:,} overdue ({l['overdue_instalments']} instalment(s), "
+                          f"{l['days_overdue']} days)" if l["overdue"] else "🟢 Up to date")
+                with st.expander(f"{l['title']} — {l['tenant']} · {status}"):
+                    st.markdown(f"""
+                        💰 Rent: ₹{l['rent_amount']:,} / month<br>
+                        🗓️ {l['start_date']} → {l['end_date'] or 'Open-ended'}<br>
+                        ✅ Paid to date: ₹{l['paid_to_date']:,}<br>
+                        📌 Outstanding: ₹{l['outstanding']:,}<br>
+                        📆 Next due: {l['next_due'] or '—'}
+                    """, unsafe_allow_html=True)
+
+                    dues = fetch_lease_dues(l["rent_id"])
+                    if dues:
+                        st.dataframe([{
+                            "Due": d["due_date"], "Period End": d["period_end"],
+                            "Amount": d["amount"], "Paid": d["paid_amount"],
+                        } for d in dues])
+
+                    pay_amount = st.number_input("Payment amount", min_value=0.0, step=1000.0,
+                                                 key=f"pay_amount_{l['rent_id']}")
+                    pay_date = st.date_input("Paid on", key=f"pay_date_{l['rent_id']}")
+                    if st.button("💳 Record Payment", key=f"pay_{l['rent_id']}"):
+                        try:
+                            payment_id = record_rent_payment(l["rent_id"], pay_amount, pay_date, user["user_id"])
+                            audit(user["user_id"], "Rent", l["property_id"], "payment",
+                                  rent_id=l["rent_id"], amount=pay_amount, paid_on=pay_date, payment_id=payment_id)
+                            st.success("✅ Payment recorded.")
+                            st.rerun()
+                        except ValueError as e:
+                            st.warning(f"⚠️ {e}")
+                        except pymysql.Error as e:
+                            st.error(f"❌ Database Error: {e}")
+
+            col_prev, col_next = st.columns(2)
+            with col_prev:
+                if page > 0 and st.button("⬅️ Previous"):
+                    st.session_state.ledger_page = page - 1
+                    st.rerun()
+            with col_next:
+                if page + 1 < pages and st.button("Next ➡️"):
+                    st.session_state.ledger_page = page + 1
+                    st.rerun()
+
     # =========================================================
     # 💰 SYSTEM INSIGHTS
     # =========================================================
     elif menu.startswith("💰"):
         st.markdown("## 💰 System Insights")
-        avg_rating = run_query("SELECT GetAverageGlobalRating() AS avg;", fetch=True)[0]["avg"]
+        # Per-shard sums and counts merge exactly; per-shard averages would not
+        ratings = merge_grouped(run_fan_out(
+            "SELECT 1 AS g, COALESCE(SUM(rating), 0) AS rating_sum, COUNT(*) AS rating_count FROM Reviews;"
+        ), ("g",), ("rating_sum", "rating_count"))
+        rating_count = ratings[0]["rating_count"] if ratings else 0
+        avg_rating = round(ratings[0]["rating_sum"] / rating_count, 2) if rating_count else 0.00
         st.metric("🌟 Global Average Rating", f"{avg_rating} / 5")
 
         totals = run_query("""
             SELECT 
-                (SELECT COUNT(*) FROM Properties) AS total_properties,
                 (SELECT COUNT(*) FROM Users WHERE role='Agent') AS total_agents,
-                (SELECT COUNT(*) FROM Users WHERE role='Client') AS total_clients,
+                (SELECT COUNT(*) FROM Users WHERE role='Client') AS total_clients;
+        """, fetch=True)[0]
+        shard_totals = merge_grouped(run_fan_out("""
+            SELECT 1 AS g,
+                (SELECT COUNT(*) FROM Properties) AS total_properties,
                 (SELECT COUNT(*) FROM Buys) AS total_sales,
                 (SELECT COUNT(*) FROM Rents) AS total_rentals;
-        """, fetch=True)[0]
+        """), ("g",), ("total_properties", "total_sales", "total_rentals"))
+        totals.update(shard_totals[0] if shard_totals else
+                      {"total_properties": 0, "total_sales": 0, "total_rentals": 0})
 
         col1, col2, col3 = st.columns(3)
         col1.metric("🏘️ Total Properties", totals["total_properties"])
@@ -411,19 +639,22 @@ def admin_dashboard(user):
         # Query 2: Top Performing Agents
         # ----------------------------
         st.subheader("🏆 Top 5 Performing Agents by Total Sales")
-        top_agents = run_query("""
+        # An agent can sell in several cities, so totals are re-summed across shards before ranking
+        agent_sales = sorted(merge_grouped(run_fan_out("""
             SELECT 
                 u.user_id,
                 u.name AS agent_name,
-                SUM(b.amount) AS total_sales,
-                RANK() OVER (ORDER BY SUM(b.amount) DESC) AS rank_position
+                SUM(b.amount) AS total_sales
             FROM Buys b
             JOIN Properties p ON b.property_id = p.property_id
             JOIN Users u ON p.agent_id = u.user_id
-            GROUP BY u.user_id, u.name
-            ORDER BY total_sales DESC
-            LIMIT 5;
-        """, fetch=True)
+            GROUP BY u.user_id, u.name;
+        """), ("user_id", "agent_name"), ("total_sales",)), key=lambda r: r["total_sales"], reverse=True)
+        top_agents = []
+        for i, row in enumerate(agent_sales[:5]):
+            same = top_agents and top_agents[-1]["total_sales"] == row["total_sales"]
+            row["rank_position"] = top_agents[-1]["rank_position"] if same else i + 1
+            top_agents.append(row)
 
         if top_agents:
             import pandas as pd
@@ -445,16 +676,15 @@ def admin_dashboard(user):
         # Query 3: Property Status Summary by City
         # ----------------------------
         st.subheader("🏙️ Property Status Summary by City")
-        city_summary = run_query("""
+        city_summary = sorted(merge_grouped(run_fan_out("""
             SELECT 
                 location,
                 SUM(CASE WHEN status = 'Available' THEN 1 ELSE 0 END) AS available_count,
                 SUM(CASE WHEN status = 'Sold' THEN 1 ELSE 0 END) AS sold_count,
                 SUM(CASE WHEN status = 'Rented' THEN 1 ELSE 0 END) AS rented_count
             FROM Properties
-            GROUP BY location
-            ORDER BY location;
-        """, fetch=True)
+            GROUP BY location;
+        """), ("location",), ("available_count", "sold_count", "rented_count")), key=lambda r: r["location"] or "")
 
         if city_summary:
             import pandas as pd
@@ -483,29 +713,48 @@ def admin_dashboard(user):
             st.info("No property data available yet.")
 
 
+        # ----------------------------
+        # Price Trends (from the monthly rollups, never PriceHistory)
+        # ----------------------------
+        st.subheader("📈 Price Trends")
+        col1, col2, col3 = st.columns(3)
+        with col1: trend_city = st.selectbox("City", ["All cities"] + fetch_trend_cities())
+        with col2: trend_type = st.selectbox("Type", ["For_Sale", "For_Rent"], key="trend_type")
+        with col3: trend_months = st.slider("Months", min_value=3, max_value=36, value=12)
+        try:
+            trend = fetch_price_trends(None if trend_city == "All cities" else trend_city, trend_type, trend_months)
+        except pymysql.Error as e:
+            st.error(f"❌ Database Error: {e}")
+            trend = []
+        display_price_trend(trend)
+
         # ----------------------------
         # Query 5: Monthly Revenue Report (Text-Based Stylish UI)
         # ----------------------------
         st.subheader("📊 Monthly Revenue Report (Sales + Rentals)")
 
-        revenue_data = run_query("""
+        revenue_data = merge_grouped(run_fan_out("""
             SELECT 
                 DATE_FORMAT(date, '%%Y-%%m') AS month,
                 SUM(amount) AS total_revenue,
                 'Sales' AS source
             FROM Buys
-            GROUP BY month
-
-            UNION ALL
-
-            SELECT 
-                DATE_FORMAT(start_date, '%%Y-%%m') AS month,
-                SUM(rent_amount) AS total_revenue,
-                'Rentals' AS source
-            FROM Rents
-            GROUP BY month
-            ORDER BY month DESC;
-        """, fetch=True)
+            GROUP BY month;
+        """), ("month", "source"), ("total_revenue",))
+        # Rentals are accrued month by month from each shard's rent ledger, not booked in the lease's start month
+        try:
+            rental_income = {}
+            for shard_income in each_shard(lambda connect: monthly_rental_income(connect=connect), priority=ANALYTICS).values():
+                for month, total in shard_income.items():
+                    rental_income[month] = rental_income.get(month, 0) + total
+        except pymysql.Error as e:
+            st.error(f"❌ Database Error: {e}")
+            rental_income = {}
+        revenue_data += [
+            {"month": month, "total_revenue": total, "source": "Rentals"}
+            for month, total in rental_income.items()
+        ]
+        revenue_data.sort(key=lambda r: r["month"], reverse=True)
 
         if revenue_data:
             st.markdown("""
@@ -538,6 +787,49 @@ def admin_dashboard(user):
 
 
         
+    # =========================================================
+    # 🧾 AUDIT LOG
+    # =========================================================
+    elif menu.startswith("🧾"):
+        st.markdown("## 🧾 Audit Log")
+
+        metrics = audit_writer.metrics()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("📥 Queue Depth", f"{metrics['queue_depth']} / {metrics['queue_capacity']}")
+        col2.metric("✍️ Events Written", metrics["written"])
+        col3.metric("⏳ Blocked Enqueues", metrics["blocked"])
+        col4.metric("🗑️ Dropped Events", metrics["dropped"])
+        if st.button("💾 Flush Pending Events"):
+            audit_writer.flush()
+            st.rerun()
+
+        with st.form("audit_filters"):
+            col1, col2, col3 = st.columns(3)
+            with col1: entity_sel = st.selectbox("Entity", ["All"] + list(ENTITIES))
+            with col2: entity_id_sel = st.text_input("Entity ID")
+            with col3: actor_sel = st.text_input("Actor (User ID)")
+            from datetime import date, timedelta
+            col4, col5 = st.columns(2)
+            with col4: since_sel = st.date_input("From", value=date.today() - timedelta(days=30))
+            with col5: until_sel = st.date_input("To (inclusive)", value=date.today())
+            st.form_submit_button("🔍 Filter")
+
+        if (entity_id_sel and not entity_id_sel.isdigit()) or (actor_sel and not actor_sel.isdigit()):
+            st.error("❌ Entity ID and Actor must be numeric.")
+        else:
+            events = fetch_audit_events(
+                entity=None if entity_sel == "All" else entity_sel,
+                entity_id=int(entity_id_sel) if entity_id_sel else None,
+                actor_id=int(actor_sel) if actor_sel else None,
+                since=since_sel,
+                until=until_sel + timedelta(days=1) if until_sel else None,
+            )
+            if not events:
+                st.info("No audit events match these filters.")
+            else:
+                import pandas as pd
+                st.dataframe(pd.DataFrame(events), use_container_width=True)
+
     # =========================================================
     # ⚙️ MAINTENANCE
     # =========================================================
@@ -546,12 +838,106 @@ def admin_dashboard(user):
         st.info("Run cleanup or maintenance procedures.")
         if st.button("🔄 Run MarkPastAppointmentsCompleted()"):
             try:
-                conn = create_connection()
-                with conn.cursor() as cursor:
-                    cursor.execute("CALL MarkPastAppointmentsCompleted();")
-                conn.commit()
+                with admitted_connection(WRITE) as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("CALL MarkPastAppointmentsCompleted();")
+                    conn.commit()
                 st.success("✅ Procedure executed successfully! Past appointments marked as completed.")
             except pymysql.Error as e:
                 st.error(f"❌ Database Error: {e}")
-            finally:
-                conn.close()
+
+        st.divider()
+        st.markdown("### 📍 Geocoding")
+        st.caption("Listings without coordinates are placed using the CityCoordinates lookup table.")
+        city_csv = st.file_uploader("Import city coordinates (CSV: city,latitude,longitude)", type=["csv"])
+        if city_csv is not None and st.button("📥 Import Cities"):
+            try:
+                import pandas as pd
+                df_cities = pd.read_csv(city_csv)
+                written = import_city_coordinates(df_cities[["city", "latitude", "longitude"]].itertuples(index=False))
+                st.success(f"✅ {written} cities imported.")
+            except (KeyError, ValueError) as e:
+                st.error(f"❌ Invalid CSV: {e}")
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+        if st.button("🌐 Geocode Properties From City Names"):
+            try:
+                updated = geocode_properties()
+                st.success(f"✅ {updated} properties geocoded.")
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+
+        st.divider()
+        st.markdown("### ✨ Similar-Property Recommendations")
+        st.caption("Recomputes neighbours only for listings changed since the last run, unless a full rebuild is requested.")
+        full_rebuild = st.checkbox("Full rebuild")
+        if st.button("🔁 Refresh Recommendations"):
+            try:
+                result = refresh_recommendations(full=full_rebuild)
+                if result:
+                    st.success(f"✅ {result['mode'].title()} refresh: {result['recomputed']} listings recomputed in {result['seconds']}s.")
+                else:
+                    st.error("❌ Could not connect to the database.")
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+
+        st.divider()
+        st.markdown("### 🧬 Duplicate Listings")
+        st.caption("Groups likely duplicate listings across the whole catalog with MinHash/LSH, and backfills the "
+                   "index used by the agent Add Property duplicate check.")
+        dup_threshold = st.slider("Similarity threshold", 0.3, 0.95, DUPLICATE_THRESHOLD, 0.05)
+        if st.button("🔎 Find Duplicate Clusters"):
+            try:
+                with admission.slot(ANALYTICS):
+                    st.session_state.duplicate_clusters = find_duplicate_clusters_all_shards(dup_threshold)
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+        clusters = st.session_state.get("duplicate_clusters")
+        if clusters is not None:
+            st.info(f"{len(clusters)} cluster(s) covering {sum(len(c) for c in clusters)} listing(s).")
+            for c in clusters[:50]:
+                with st.expander(f"{c[0]['title']} · {c[0]['location']} ({len(c)} listings)"):
+                    st.dataframe([{k: p[k] for k in ("property_id", "title", "price", "location", "status", "agent_id")}
+                                  for p in c], use_container_width=True)
+
+        st.divider()
+        st.markdown("### 🗄️ Appointment Archive")
+        stats = fetch_archive_stats()
+        if stats:
+            col1, col2 = st.columns(2)
+            col1.metric("🔥 Live Appointments", stats["hot_rows"])
+            col2.metric("🗄️ Archived Appointments", stats["archived_rows"])
+        col1, col2 = st.columns(2)
+        with col1: archive_days = st.number_input("Archive closed appointments older than (days)", min_value=0, value=ARCHIVE_AFTER_DAYS, step=30)
+        with col2: archive_chunk = st.number_input("Rows per transaction", min_value=50, max_value=5000, value=ARCHIVE_CHUNK_SIZE, step=50)
+        if st.button("📦 Archive Closed Appointments"):
+            try:
+                moved = archive_closed_appointments(int(archive_days), int(archive_chunk))
+                st.success(f"✅ {moved} appointments moved to the archive.")
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+
+        st.divider()
+        st.markdown("### 🗓️ Agent Schedule Digests")
+        digest_days = st.number_input("Days ahead", min_value=1, max_value=60, value=DIGEST_HORIZON_DAYS)
+        write_files = st.checkbox("Also write per-agent text files (digests/)")
+        if st.button("📨 Generate Schedule Digests"):
+            try:
+                count = build_schedule_digests(int(digest_days), "digests" if write_files else None)
+                st.success(f"✅ Digests generated for {count} agent(s).")
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+
+        st.divider()
+        st.markdown("### 🚦 Database Admission")
+        adm = admission.metrics()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Active / Slots", f"{adm['active']} / {adm['capacity']}")
+        col2.metric("Queue Depth", adm["queue_depth"], help=f"Peak {adm['max_queue_depth']}")
+        col3.metric("Rejected", sum(adm["rejected"].values()) + sum(adm["timed_out"].values()))
+        col4.metric("Avg Wait", f"{adm['avg_wait_ms']} ms", help=f"Max {adm['max_wait_ms']} ms")
+        st.dataframe([
+            {"Class": name, "Admitted": adm["admitted"][name], "Waiting": adm["waiting"][name],
+             "Rejected (queue full)": adm["rejected"][name], "Timed Out": adm["timed_out"][name]}
+            for name in adm["admitted"]
+        ])
@@ -1,6 +1,16 @@
 import streamlit as st
 import pymysql
 from db.connection import create_connection
+from db.admission import admission, admitted_connection, DatabaseBusy, INTERACTIVE, WRITE
+from db.versions import cached_query
+from utils.dedup import check_duplicates, flag_batch_duplicates, index_listing, insert_listings
+from utils.audit import audit
+from utils.photos import save_photo
+from utils.pricing import bulk_reprice
+from utils.digests import fetch_schedule_digest
+from utils.auth import hash_password, sync_user, AuthBusy
+from utils.saved_searches import notify_matches
+from utils.review_stats import fetch_review_stats
 from datetime import datetime
 
 
@@ -8,17 +18,211 @@ from datetime import datetime
 # Helper Function: Execute Queries
 # ------------------------------------------------------------
 def run_query(query, params=(), fetch=False):
-    conn = create_connection()
+    # Take a database slot first so a traffic spike queues here instead of exhausting MySQL connections
     try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(query, params)
-            if fetch:
-                return cursor.fetchall()
-            conn.commit()
+        with admission.slot(INTERACTIVE if fetch else WRITE):
+            conn = create_connection()
+            if conn is None:
+                st.error("❌ Could not connect to the database.")
+                return None
+            try:
+                with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                    cursor.execute(query, params)
+                    if fetch:
+                        return cursor.fetchall()
+                    conn.commit()
+                    return True
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+            finally:
+                conn.close()
+    except DatabaseBusy as e:
+        st.warning(f"⏳ {e}")
+        return None
+
+
+# ------------------------------------------------------------
+# Bulk Repricing Form (shared with the admin dashboard)
+# ------------------------------------------------------------
+def display_bulk_repricing(user, agent_id=None, key_prefix="reprice"):
+    import pandas as pd
+
+    with st.form(f"{key_prefix}_reprice_form"):
+        col1, col2, col3 = st.columns(3)
+        with col1: type_sel = st.selectbox("Type", ["All", "For_Sale", "For_Rent"], key=f"{key_prefix}_type")
+        with col2: status_sel = st.selectbox("Status", ["All", "Available", "Sold", "Rented"], key=f"{key_prefix}_status")
+        with col3: location_sel = st.text_input("Location contains", key=f"{key_prefix}_location")
+        percent = st.number_input("Change (%)", min_value=-100.0, max_value=1000.0, value=5.0, step=0.5, key=f"{key_prefix}_pct")
+        col_preview, col_apply = st.columns(2)
+        with col_preview: preview = st.form_submit_button("👀 Preview")
+        with col_apply: apply = st.form_submit_button("💾 Apply")
+
+    if not (preview or apply):
+        return
+    try:
+        accepted, rejected = bulk_reprice(
+            agent_id=agent_id,
+            prop_type=None if type_sel == "All" else type_sel,
+            status=None if status_sel == "All" else status_sel,
+            location=location_sel.strip() or None,
+            percent=percent,
+            dry_run=preview,
+        )
+    except pymysql.Error as e:
+        st.error(f"❌ Database Error: {e}")
+        return
+
+    if apply and accepted:
+        audit(user["user_id"], "Property", None, "bulk_reprice", percent=percent, type=type_sel,
+              status=status_sel, location=location_sel, accepted=len(accepted), rejected=len(rejected))
+        st.success(f"✅ {len(accepted)} listing(s) repriced.")
+    elif preview:
+        st.info(f"👀 Preview: {len(accepted)} listing(s) would be repriced, {len(rejected)} rejected.")
+    if not accepted and not rejected:
+        st.info("No listings match these filters.")
+    if accepted:
+        st.markdown("#### ✅ Accepted")
+        st.dataframe(pd.DataFrame(accepted)[["property_id", "title", "old_price", "new_price"]], use_container_width=True)
+    if rejected:
+        st.markdown("#### ⛔ Rejected")
+        st.dataframe(pd.DataFrame(rejected)[["property_id", "title", "old_price", "new_price", "reason"]], use_container_width=True)
+
+
+# ------------------------------------------------------------
+# Bulk Import with Duplicate Flags
+# ------------------------------------------------------------
+IMPORT_COLUMNS = ("title", "type", "price", "location")
+
+
+def _parse_import(df):
+    """Valid listing dicts from an uploaded CSV, plus (row number, reason) for rejected rows."""
+    import pandas as pd
+
+    df = df.astype(object).where(pd.notna(df), None)
+    listings, errors = [], []
+    for n, row in enumerate(df.to_dict("records"), start=2):
+        title, location = str(row.get("title") or "").strip(), str(row.get("location") or "").strip()
+        prop_type = str(row.get("type") or "").strip()
+        try:
+            price = float(row.get("price"))
+            building_age = None if row.get("building_age") is None else int(row["building_age"])
+            lat, lng = (None if row.get(c) is None else float(row[c]) for c in ("latitude", "longitude"))
+        except (TypeError, ValueError):
+            errors.append((n, "price, building_age, latitude and longitude must be numbers"))
+            continue
+        if not title or not location:
+            errors.append((n, "title and location are required"))
+        elif prop_type not in ("For_Sale", "For_Rent"):
+            errors.append((n, "type must be For_Sale or For_Rent"))
+        elif not price > 0:
+            errors.append((n, "price must be a positive number"))
+        else:
+            listings.append({"row": n, "title": title, "type": prop_type, "price": price, "location": location,
+                             "building_age": building_age, "latitude": lat, "longitude": lng})
+    return listings, errors
+
+
+def display_bulk_import(user):
+    import pandas as pd
+
+    st.markdown("### 📥 Bulk Import (CSV)")
+    st.caption("Columns: title, type (For_Sale/For_Rent), price, location; optional building_age, latitude, longitude.")
+    upload = st.file_uploader("Listings CSV", type=["csv"], key="bulk_import_csv")
+    if not upload:
+        return
+    try:
+        df = pd.read_csv(upload)
+    except Exception as e:
+        st.error(f"❌ Could not read the CSV: {e}")
+        return
+    missing = [c for c in IMPORT_COLUMNS if c not in df.columns]
+    if missing:
+        st.error(f"❌ Missing column(s): {', '.join(missing)}")
+        return
+
+    listings, errors = _parse_import(df)
+    for n, reason in errors:
+        st.warning(f"⚠️ Row {n} skipped: {reason}")
+    if not listings:
+        return
+    try:
+        existing = check_duplicates(listings)
     except pymysql.Error as e:
         st.error(f"❌ Database Error: {e}")
-    finally:
-        conn.close()
+        return
+    in_batch = flag_batch_duplicates(listings)
+
+    preview = pd.DataFrame([{k: l[k] for k in ("row", "title", "type", "price", "location")} for l in listings])
+    preview["possible_duplicate_of"] = [
+        ", ".join([f"#{d['property_id']}" for d in existing.get(i, [])] +
+                  [f"row {listings[j]['row']}" for j in in_batch.get(i, [])])
+        for i in range(len(listings))
+    ]
+    st.dataframe(preview, use_container_width=True)
+    flagged = set(existing) | set(in_batch)
+    if flagged:
+        st.warning(f"⚠️ {len(flagged)} row(s) look like listings that already exist.")
+    skip_flagged = st.checkbox("Skip rows flagged as possible duplicates", value=True, key="bulk_import_skip")
+    to_import = [l for i, l in enumerate(listings) if not (skip_flagged and i in flagged)]
+    if st.button(f"📤 Import {len(to_import)} listing(s)", key="bulk_import_go", disabled=not to_import):
+        try:
+            added = insert_listings(user["user_id"], [{k: v for k, v in l.items() if k != "row"} for l in to_import])
+        except pymysql.Error as e:
+            st.error(f"❌ Database Error: {e}")
+            return
+        for a in added:
+            notify_matches(a["property_id"], a["type"], a["price"], a["location"], a["title"])
+        st.success(f"✅ Imported {len(added)} listing(s).")
+
+
+# ------------------------------------------------------------
+# Review Analytics
+# ------------------------------------------------------------
+def display_review_stats(stats, key_prefix="reviews"):
+    import pandas as pd
+
+    if not stats:
+        st.info("No review analytics yet.")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Reviews", stats["review_count"])
+    col2.metric("Average Rating", f"{stats['average']:.2f} / 5")
+    last = stats["monthly"][-1][3] if stats["monthly"] else None
+    prev = stats["monthly"][-2][3] if len(stats["monthly"]) > 1 else None
+    if last is None:
+        col3.metric("Rolling Avg (3 mo)", "—")
+    elif prev is None:
+        col3.metric("Rolling Avg (3 mo)", f"{last:.2f}")
+    else:
+        col3.metric("Rolling Avg (3 mo)", f"{last:.2f}", f"{last - prev:+.2f}")
+
+    col_hist, col_trend = st.columns(2)
+    with col_hist:
+        st.markdown("**Rating distribution**")
+        st.bar_chart(pd.DataFrame({"Reviews": stats["histogram"]}, index=[f"{i}⭐" for i in range(1, 6)]))
+    with col_trend:
+        st.markdown("**Monthly average**")
+        trend = pd.DataFrame(stats["monthly"], columns=["Month", "Reviews", "Average", "Rolling Avg"]).set_index("Month")
+        st.line_chart(trend[["Average", "Rolling Avg"]])
+    if stats["keywords"]:
+        st.markdown("**Recurring themes:** " + " · ".join(f"`{w}` ({n})" for w, n in stats["keywords"]))
+
+
+def display_price_trend(trend, empty_message="No price data for this selection yet."):
+    import pandas as pd
+
+    if not trend:
+        st.info(empty_message)
+        return
+    df = pd.DataFrame(trend)
+    medians = df.pivot(index="month", columns="kind", values="median").add_prefix("Median ")
+    averages = df.pivot(index="month", columns="kind", values="average").add_prefix("Average ")
+    st.line_chart(medians.join(averages))
+    latest = df.groupby("kind").last()
+    cols = st.columns(len(latest))
+    for col, (kind, row) in zip(cols, latest.iterrows()):
+        col.metric(f"Median {kind.lower()} ({row['month']})", f"₹{row['median']:,.0f}",
+                   help=f"{row['samples']} price point(s) that month; average ₹{row['average']:,.0f}")
 
 
 # ------------------------------------------------------------
@@ -29,6 +233,8 @@ def agent_dashboard(user):
     menu = st.sidebar.radio("Navigation", [
         "🏡 My Properties",
         "➕ Add Property",
+        "📈 Bulk Repricing",
+        "🗓️ My Schedule",
         "📅 Appointments",
         "💰 Sales & Rentals Overview",
         "⭐ Client Reviews",
@@ -47,7 +253,11 @@ def agent_dashboard(user):
             price = st.number_input("Price (₹)", min_value=0.0, step=10000.0)
             location = st.text_input("Location *")
             building_age = st.number_input("Building Age (years)", min_value=0, step=1)
-            status = "Available"
+            st.caption("📍 Coordinates are optional — leave at 0 to place the listing by its city.")
+            col_lat, col_lng = st.columns(2)
+            with col_lat: latitude = st.number_input("Latitude", min_value=-90.0, max_value=90.0, value=0.0, format="%.6f")
+            with col_lng: longitude = st.number_input("Longitude", min_value=-180.0, max_value=180.0, value=0.0, format="%.6f")
+            add_anyway = st.checkbox("Add even if it looks like an existing listing")
 
             submit = st.form_submit_button("📤 Add Property")
 
@@ -55,12 +265,30 @@ def agent_dashboard(user):
                 if not title or not location:
                     st.warning("⚠️ Please fill in all required fields (Title and Location).")
                 else:
-                    run_query("""
-                        INSERT INTO Properties 
-                        (agent_id, title, type, price, location, building_age, status)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s);
-                    """, (user["user_id"], title, prop_type, price, location, building_age, status))
-                    st.success("✅ Property added successfully!")
+                    has_coords = latitude != 0.0 or longitude != 0.0
+                    listing = {"title": title, "type": prop_type, "price": price, "location": location,
+                               "building_age": building_age, "latitude": latitude if has_coords else None,
+                               "longitude": longitude if has_coords else None}
+                    try:
+                        duplicates = {} if add_anyway else check_duplicates([listing])
+                        if duplicates:
+                            st.warning("⚠️ This looks like a listing that already exists. Review it, or tick "
+                                       "'Add even if it looks like an existing listing' and submit again.")
+                            for d in duplicates[0]:
+                                st.markdown(f"- #{d['property_id']} **{d['title']}** · {d['location']} · "
+                                            f"₹{d['price']:,.0f} · {d['status']} ({d['similarity']:.0%} similar)")
+                        else:
+                            # Indexed for duplicate checks in the same transaction
+                            added = insert_listings(user["user_id"], [listing])[0]
+                            st.success("✅ Property added successfully!")
+                            matched = notify_matches(added["property_id"], prop_type, price, location, title)
+                            if matched:
+                                st.info("🔔 Clients with a matching saved search have been notified.")
+                    except pymysql.Error as e:
+                        st.error(f"❌ Database Error: {e}")
+
+        st.divider()
+        display_bulk_import(user)
 
     # =========================================================
     # 🏡 MY PROPERTIES
@@ -68,11 +296,11 @@ def agent_dashboard(user):
     elif menu.startswith("🏡"):
         st.markdown("## 🏠 Properties You Manage")
 
-        props = run_query("""
+        props = cached_query(("agent_properties", user["user_id"]), ("Properties",), lambda: run_query("""
             SELECT property_id, title, type, price, location, status
             FROM Properties
             WHERE agent_id = %s;
-        """, (user["user_id"],), fetch=True)
+        """, (user["user_id"],), fetch=True))
 
         if not props:
             st.info("No properties added yet. Use the 'Add Property' tab to list one.")
@@ -97,22 +325,79 @@ def agent_dashboard(user):
                     )
                     if st.button("💾 Update Price", key=f"update_{p['property_id']}"):
                         try:
-                            conn = create_connection()
-                            with conn.cursor() as cursor:
-                                cursor.execute(
-                                    "UPDATE Properties SET price = %s WHERE property_id = %s",
-                                    (new_price, p["property_id"])
-                                )
-                            conn.commit()
+                            with admitted_connection(WRITE) as conn:
+                                try:
+                                    with conn.cursor() as cursor:
+                                        cursor.execute(
+                                            "UPDATE Properties SET price = %s WHERE property_id = %s",
+                                            (new_price, p["property_id"])
+                                        )
+                                        index_listing(cursor, p["property_id"], p["title"], p["location"], new_price)
+                                    conn.commit()
+                                except pymysql.Error:
+                                    conn.rollback()
+                                    raise
+                            audit(user["user_id"], "Property", p["property_id"], "price_change",
+                                  old_price=p["price"], new_price=new_price)
                             st.success(f"✅ Price updated for {p['title']}!")
                         except pymysql.Error as e:
-                            conn.rollback()
                             if "Price reduction exceeds" in str(e):
                                 st.warning("⚠️ Price update blocked: cannot reduce price by more than 10%.")
                             else:
                                 st.error(f"❌ Database Error: {e}")
-                        finally:
-                            conn.close()
+
+                    with st.expander(f"📷 Photos for {p['title']}"):
+                        uploads = st.file_uploader(
+                            "Upload images",
+                            type=["jpg", "jpeg", "png", "webp"],
+                            accept_multiple_files=True,
+                            key=f"photos_{p['property_id']}"
+                        )
+                        make_primary = st.checkbox("Use first image as cover photo", key=f"cover_{p['property_id']}")
+                        if uploads and st.button("📤 Upload Photos", key=f"upload_{p['property_id']}"):
+                            saved = 0
+                            for i, f in enumerate(uploads):
+                                try:
+                                    save_photo(p["property_id"], f.getvalue(), make_primary=make_primary and i == 0)
+                                    saved += 1
+                                except ValueError as e:
+                                    st.warning(f"⚠️ {f.name}: {e}")
+                                except pymysql.Error as e:
+                                    st.error(f"❌ Database Error: {e}")
+                            if saved:
+                                st.success(f"✅ {saved} photo(s) uploaded. Thumbnails are being generated.")
+
+    # =========================================================
+    # 📈 BULK REPRICING
+    # =========================================================
+    elif menu.startswith("📈"):
+        st.markdown("## 📈 Bulk Repricing")
+        st.caption("Changes are checked against the 10% price-drop rule first; only accepted listings are updated.")
+        display_bulk_repricing(user, agent_id=user["user_id"], key_prefix="agent")
+
+    # =========================================================
+    # 🗓️ SCHEDULE DIGEST
+    # =========================================================
+    elif menu.startswith("🗓️"):
+        st.markdown("## 🗓️ My Upcoming Schedule")
+        digest = fetch_schedule_digest(user["user_id"])
+        if not digest or not digest["digest"]:
+            st.info("No upcoming appointments in your latest schedule digest.")
+        else:
+            st.caption(f"Next {digest['horizon_days']} days · {digest['appointment_count']} appointment(s) · "
+                       f"generated {digest['generated_at']}")
+            current_day = None
+            for a in digest["digest"]:
+                day = a["datetime"][:10]
+                if day != current_day:
+                    st.markdown(f"#### 📆 {day}")
+                    current_day = day
+                st.markdown(f"""
+                <div style='background-color:#1e1e1e;padding:10px;border-radius:10px;margin-bottom:6px;'>
+                    🕒 <b>{a['datetime'][11:16]}</b> — {a['property']} ({a['location']})<br>
+                    👤 {a['client_name']} ({a['client_phone']}) · 📌 {a['status']}
+                </div>
+                """, unsafe_allow_html=True)
 
     # =========================================================
     # 📅 MANAGE APPOINTMENTS
@@ -122,26 +407,35 @@ def agent_dashboard(user):
 
         if st.button("🔄 Refresh Appointments (Run Procedure)"):
             try:
-                conn = create_connection()
-                with conn.cursor() as cursor:
-                    cursor.execute("CALL MarkPastAppointmentsCompleted();")
-                conn.commit()
+                with admitted_connection(WRITE) as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("CALL MarkPastAppointmentsCompleted();")
+                    conn.commit()
                 st.success("✅ Past appointments automatically marked as 'Completed'!")
                 st.rerun()
             except pymysql.Error as e:
                 st.error(f"❌ Error running procedure: {e}")
-            finally:
-                conn.close()
 
-        appts = run_query("""
+        include_archived = st.checkbox("🗄️ Include archived appointments")
+        archived = """
+            UNION ALL
             SELECT a.appointment_id, a.datetime, a.status,
-                   p.title AS property, u.name AS client_name, u.phone AS client_phone
+                   p.title AS property, u.name AS client_name, u.phone AS client_phone, 1 AS archived
+            FROM AppointmentsArchive a
+            LEFT JOIN Properties p ON a.property_id = p.property_id
+            LEFT JOIN Users u ON a.user_id = u.user_id
+            WHERE a.agent_id = %s
+        """ if include_archived else ""
+        appts = run_query(f"""
+            SELECT a.appointment_id, a.datetime, a.status,
+                   p.title AS property, u.name AS client_name, u.phone AS client_phone, 0 AS archived
             FROM Appointments a
             JOIN Properties p ON a.property_id = p.property_id
             JOIN Users u ON a.user_id = u.user_id
             WHERE a.agent_id = %s
-            ORDER BY a.datetime ASC;
-        """, (user["user_id"],), fetch=True)
+            {archived}
+            ORDER BY datetime ASC;
+        """, (user["user_id"],) * (2 if include_archived else 1), fetch=True)
 
         if not appts:
             st.info("No appointments found.")
@@ -156,7 +450,9 @@ def agent_dashboard(user):
                 </div>
                 """, unsafe_allow_html=True)
 
-                if a["status"] in ["Pending", "Confirmed", "Cancelled"]:
+                if a["archived"]:
+                    st.info("🗄️ Archived appointment (read-only).")
+                elif a["status"] in ["Pending", "Confirmed", "Cancelled"]:
                     new_status = st.selectbox(
                         f"Update status for '{a['property']}'",
                         ["Pending", "Confirmed", "Completed", "Cancelled"],
@@ -165,8 +461,10 @@ def agent_dashboard(user):
                     )
                     if new_status != a["status"]:
                         if st.button("Update Status", key=f"update_{a['appointment_id']}"):
-                            run_query("UPDATE Appointments SET status = %s WHERE appointment_id = %s",
-                                      (new_status, a["appointment_id"]))
+                            if run_query("UPDATE Appointments SET status = %s WHERE appointment_id = %s",
+                                         (new_status, a["appointment_id"])):
+                                audit(user["user_id"], "Appointment", a["appointment_id"], "status_change",
+                                      old_status=a["status"], new_status=new_status)
                             st.success(f"✅ Status updated to {new_status}")
                             st.rerun()
                 else:
@@ -251,17 +549,24 @@ def agent_dashboard(user):
     # =========================================================
     elif menu.startswith("⭐"):
         st.markdown("## ⭐ Client Reviews")
+        display_review_stats(fetch_review_stats("agent", user["user_id"]))
         reviews = run_query("""
-            SELECT u.name AS client_name, p.title AS property, r.rating, r.comments
+            SELECT u.name AS client_name, p.property_id, p.title AS property, r.rating, r.comments
             FROM Reviews r
             JOIN Users u ON r.user_id = u.user_id
             JOIN Properties p ON r.property_id = p.property_id
-            WHERE r.agent_id = %s;
+            WHERE r.agent_id = %s
+            ORDER BY r.created_at DESC;
         """, (user["user_id"],), fetch=True)
 
         if not reviews:
             st.info("No reviews received yet.")
         else:
+            reviewed = {r["property_id"]: r["property"] for r in reviews}
+            st.markdown("### 🏠 By Property")
+            chosen = st.selectbox("Property", list(reviewed), format_func=lambda pid: reviewed[pid])
+            display_review_stats(fetch_review_stats("property", chosen))
+            st.markdown("### 💬 All Reviews")
             for r in reviews:
                 st.markdown(f"""
                 <div style='background-color:#1e1e1e;padding:15px;border-radius:12px;margin-bottom:10px;'>
@@ -290,9 +595,14 @@ def agent_dashboard(user):
                 params = [name, email, phone]
                 if password:
                     query += ", password=%s"
-                    params.append(password)
+                    try:
+                        params.append(hash_password(password))
+                    except AuthBusy as e:
+                        st.warning(f"⏳ {e}")
+                        st.stop()
                 query += " WHERE user_id=%s"
                 params.append(user["user_id"])
 
-                run_query(query, tuple(params))
-                st.success("✅ Profile updated successfully!")
+                if run_query(query, tuple(params)):
+                    sync_user(user_id=user["user_id"])
+                    st.success("✅ Profile updated successfully!")
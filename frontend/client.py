@@ -2,8 +2,24 @@ import streamlit as st
 import pymysql
 from PIL import Image
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from db.connection import create_connection
+from db.admission import admission, admitted_connection, DatabaseBusy, INTERACTIVE, WRITE
+from db.versions import cached_query
+from db.sharding import remove_user
+from utils.audit import audit
+from utils.auth import sync_user
+from utils.geo import bounding_box, box_to_wkt, geohash_prefixes, lookup_city, MAX_GEO_RESULTS
+from utils.facets import FACET_COMBINATIONS_SQL, AGENT_FACET_SQL, compute_facets
+from utils.recommend import fetch_similar_properties
+from utils.photos import fetch_primary_photos, thumbnail_bytes
+from utils.catalog import fresh_snapshot
+from utils.review_stats import add_review as record_review, fetch_review_stats, refresh_queued_review_stats
+from frontend.agent import display_review_stats, display_price_trend
+from utils.price_trends import fetch_price_trends, city_of
+from utils.leases import BOOKABLE_SQL, available_from, first_clash, create_lease, fetch_lease_calendars
+from utils.saved_searches import (save_search, delete_search, fetch_saved_searches, fetch_inbox,
+                                  mark_inbox_seen)
 import re
 
 
@@ -11,52 +27,144 @@ import re
 # Helper: Execute Queries
 # ============================================================
 def run_query(query, params=(), fetch=False):
-    conn = create_connection()
+    # Take a database slot first so a traffic spike queues here instead of exhausting MySQL connections
     try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute(query, params)
-            if fetch:
-                return cursor.fetchall()
-            conn.commit()
-    except pymysql.Error as e:
-        st.error(f"❌ Database Error: {e}")
-    finally:
-        conn.close()
+        with admission.slot(INTERACTIVE if fetch else WRITE):
+            conn = create_connection()
+            if conn is None:
+                st.error("❌ Could not connect to the database.")
+                return None
+            try:
+                with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                    cursor.execute(query, params)
+                    if fetch:
+                        return cursor.fetchall()
+                    conn.commit()
+                    return True
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
+            finally:
+                conn.close()
+    except DatabaseBusy as e:
+        st.warning(f"⏳ {e}")
+        return None
 
 # ============================================================
 # Fetch Data
 # ============================================================
+# Catalog reads are re-run only when Properties/Users change (see db/versions.py).
+# When the shared snapshot (utils/catalog.py) is mapped and matches the version stamp the background
+# refreshers publish every second, they are answered from it without a MySQL round trip.
+CATALOG_TABLES = ("Properties", "Users")
+CATALOG_PAGE_SIZE = 20
+
 def fetch_properties(prop_type, location, budget):
-    return run_query("""
+    snap = fresh_snapshot()
+    if snap is not None:
+        return snap.property_rows(snap.search(prop_type, location, budget))
+    return cached_query(("search", prop_type, location, budget), CATALOG_TABLES, lambda: run_query(f"""
         SELECT p.property_id, p.title, p.price, p.location, p.type, p.status,
                u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email, u.user_id AS agent_id
         FROM Properties p
         JOIN Users u ON p.agent_id = u.user_id
-        WHERE p.type=%s AND p.price<=%s AND p.location LIKE %s AND p.status='Available';
-    """, (prop_type, budget, f"%{location}%"), fetch=True)
+        WHERE p.type=%s AND p.price<=%s AND p.location LIKE %s AND {BOOKABLE_SQL};
+    """, (prop_type, budget, f"%{location}%"), fetch=True))
+
+def _fetch_properties_within(prop_type, budget, center_lat, center_lng, box, max_km=None):
+    # MBRContains on the bounding box is answered by the SPATIAL index on geo_point;
+    # the geohash prefixes covering the box are B-tree ranges on idx_prop_geohash,
+    # so the optimizer can pick either. Exact great-circle distance is only
+    # computed for rows inside the box.
+    prefixes = geohash_prefixes(*box)
+    geohash_filter = ("AND (" + " OR ".join(["p.geohash LIKE %s"] * len(prefixes)) + ")") if prefixes else ""
+    distance_filter = "HAVING distance_km <= %s" if max_km is not None else ""
+    params = [center_lng, center_lat, prop_type, budget, box_to_wkt(*box)]
+    params += [f"{prefix}%" for prefix in prefixes]
+    if max_km is not None:
+        params.append(max_km)
+    params.append(MAX_GEO_RESULTS)
+    return run_query(f"""
+        SELECT p.property_id, p.title, p.price, p.location, p.type, p.status,
+               u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email, u.user_id AS agent_id,
+               ROUND(ST_Distance_Sphere(p.geo_point, POINT(%s, %s)) / 1000, 2) AS distance_km
+        FROM Properties p
+        JOIN Users u ON p.agent_id = u.user_id
+        WHERE p.type=%s AND p.price<=%s AND {BOOKABLE_SQL}
+          AND p.latitude IS NOT NULL
+          AND MBRContains(ST_GeomFromText(%s), p.geo_point)
+          {geohash_filter}
+        {distance_filter}
+        ORDER BY distance_km ASC
+        LIMIT %s;
+    """, tuple(params), fetch=True)
+
+def fetch_properties_near(prop_type, budget, lat, lng, radius_km):
+    box = bounding_box(lat, lng, radius_km)
+    return cached_query(("near", prop_type, budget, lat, lng, radius_km), CATALOG_TABLES,
+                        lambda: _fetch_properties_within(prop_type, budget, lat, lng, box, radius_km))
+
+def fetch_properties_in_box(prop_type, budget, min_lat, min_lng, max_lat, max_lng):
+    center_lat, center_lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    box = (min_lat, min_lng, max_lat, max_lng)
+    return cached_query(("box", prop_type, budget) + box, CATALOG_TABLES,
+                        lambda: _fetch_properties_within(prop_type, budget, center_lat, center_lng, box))
+
+def fetch_search_facets(prop_type, location, budget):
+    combos = cached_query(("facets", location, budget), CATALOG_TABLES, lambda: run_query(
+        FACET_COMBINATIONS_SQL, (budget, f"%{location}%"), fetch=True))
+    agents = cached_query(("agent_facet", prop_type, location, budget), CATALOG_TABLES, lambda: run_query(
+        AGENT_FACET_SQL, (prop_type, budget, f"%{location}%"), fetch=True))
+    return compute_facets(combos, prop_type, agents)
 
 def fetch_all_properties():
-    return run_query("""
+    snap = fresh_snapshot()
+    if snap is not None:
+        return snap.property_rows()
+    return cached_query(("all_properties",), CATALOG_TABLES, lambda: run_query(f"""
         SELECT p.property_id, p.title, p.price, p.location, p.type, p.status,
                u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email, u.user_id AS agent_id
         FROM Properties p
         JOIN Users u ON p.agent_id = u.user_id
-        WHERE p.status='Available';
-    """, fetch=True)
+        WHERE {BOOKABLE_SQL};
+    """, fetch=True))
+
+def fetch_catalog_page(page):
+    """One page of bookable listings plus the total count; only the page's rows are materialised."""
+    snap = fresh_snapshot()
+    start = page * CATALOG_PAGE_SIZE
+    if snap is not None:
+        rows = snap.search()
+        return snap.property_rows(rows[start:start + CATALOG_PAGE_SIZE]), len(rows)
+    props = fetch_all_properties() or []
+    return props[start:start + CATALOG_PAGE_SIZE], len(props)
 
 def fetch_all_agents():
-    return run_query("SELECT user_id, name, phone, email FROM Users WHERE role='Agent';", fetch=True)
-
-def fetch_appointments(client_id):
-    appts = run_query("""
+    snap = fresh_snapshot()
+    if snap is not None:
+        return snap.agent_rows()
+    return cached_query(("all_agents",), ("Users",), lambda: run_query(
+        "SELECT user_id, name, phone, email FROM Users WHERE role='Agent';", fetch=True))
+
+def fetch_appointments(client_id, include_archived=False):
+    archived = """
+        UNION ALL
+        SELECT a.appointment_id, a.datetime, a.status, p.title AS property,
+               u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email
+        FROM AppointmentsArchive a
+        LEFT JOIN Properties p ON a.property_id = p.property_id
+        LEFT JOIN Users u ON a.agent_id = u.user_id
+        WHERE a.user_id=%s
+    """ if include_archived else ""
+    appts = run_query(f"""
         SELECT a.appointment_id, a.datetime, a.status, p.title AS property,
                u.name AS agent_name, u.phone AS agent_phone, u.email AS agent_email
         FROM Appointments a
         JOIN Properties p ON a.property_id = p.property_id
         JOIN Users u ON a.agent_id = u.user_id
         WHERE a.user_id=%s
-        ORDER BY a.datetime DESC;
-    """, (client_id,), fetch=True)
+        {archived}
+        ORDER BY datetime DESC;
+    """, (client_id, client_id) if include_archived else (client_id,), fetch=True)
 
     if not appts:
         return pd.DataFrame()
@@ -73,35 +181,64 @@ def fetch_appointments(client_id):
     })
     return df
 
-def fetch_purchases_rentals(client_id):
-    conn = create_connection()
-    try:
-        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-            cursor.execute("""
-                SELECT 'Buy' AS type, p.property_id, p.title, p.location, b.amount AS price, b.date,
-                       u.name AS agent_name, u.phone AS agent_phone
-                FROM Buys b
-                JOIN Properties p ON b.property_id = p.property_id
-                JOIN Users u ON p.agent_id = u.user_id
-                WHERE b.buyer_id = %s
-                ORDER BY b.date DESC;
-            """, (client_id,))
-            buys = cursor.fetchall()
-
-            cursor.execute("""
-                SELECT 'Rent' AS type, p.property_id, p.title, p.location, r.rent_amount AS price,
-                       r.start_date AS start_date, r.end_date AS end_date,
-                       u.name AS agent_name, u.phone AS agent_phone
-                FROM Rents r
-                JOIN Properties p ON r.property_id = p.property_id
-                JOIN Users u ON p.agent_id = u.user_id
-                WHERE r.tenant_id = %s
-                ORDER BY r.start_date DESC;
-            """, (client_id,))
-            rents = cursor.fetchall()
-            return buys + rents
-    finally:
-        conn.close()
+HISTORY_PAGE_SIZE = 20
+
+def fetch_purchases_rentals(client_id, after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    One page of the client's buys and rents, newest first, ordered by
+    (txn_date, type, txn_id) DESC. Pass the last row's `history_cursor(row)`
+    as `after` to get the next page.
+    """
+    keyset_buy = keyset_rent = ""
+    buy_params, rent_params = [client_id], [client_id]
+    if after is not None:
+        keyset_buy = "AND (b.date, 'Buy', b.property_id) < (%s, %s, %s)"
+        keyset_rent = "AND (r.start_date, 'Rent', r.rent_id) < (%s, %s, %s)"
+        buy_params += list(after)
+        rent_params += list(after)
+
+    # Each branch walks its (client, date) index and stops after `limit` rows,
+    # so a page never reads more than 2 * limit transactions.
+    return run_query(f"""
+        SELECT * FROM (
+            (SELECT 'Buy' AS type, b.property_id AS txn_id, p.property_id, p.title, p.location,
+                    b.amount AS price, b.date AS txn_date, NULL AS start_date, NULL AS end_date,
+                    u.name AS agent_name, u.phone AS agent_phone
+             FROM Buys b
+             JOIN Properties p ON b.property_id = p.property_id
+             LEFT JOIN Users u ON p.agent_id = u.user_id
+             WHERE b.buyer_id = %s {keyset_buy}
+             ORDER BY b.date DESC, b.property_id DESC
+             LIMIT %s)
+            UNION ALL
+            (SELECT 'Rent' AS type, r.rent_id AS txn_id, p.property_id, p.title, p.location,
+                    r.rent_amount AS price, r.start_date AS txn_date, r.start_date, r.end_date,
+                    u.name AS agent_name, u.phone AS agent_phone
+             FROM Rents r
+             JOIN Properties p ON r.property_id = p.property_id
+             LEFT JOIN Users u ON p.agent_id = u.user_id
+             WHERE r.tenant_id = %s {keyset_rent}
+             ORDER BY r.start_date DESC, r.rent_id DESC
+             LIMIT %s)
+        ) history
+        ORDER BY txn_date DESC, type DESC, txn_id DESC
+        LIMIT %s;
+    """, tuple(buy_params + [limit] + rent_params + [limit, limit]), fetch=True)
+
+def history_cursor(row):
+    return (row["txn_date"], row["type"], row["txn_id"])
+
+def fetch_reviewable_properties(client_id):
+    return run_query("""
+        SELECT p.property_id, p.title, p.agent_id
+        FROM Properties p
+        WHERE p.property_id IN (
+            SELECT property_id FROM Buys WHERE buyer_id = %s
+            UNION
+            SELECT property_id FROM Rents WHERE tenant_id = %s
+        )
+        ORDER BY p.title;
+    """, (client_id, client_id), fetch=True)
 
 # ============================================================
 # Core Operations
@@ -113,39 +250,65 @@ def book_appointment(user_id, property_id, agent_id, appt_datetime):
     """, (user_id, property_id, agent_id, appt_datetime))
     st.success("✅ Appointment booked successfully!")
 
-def cancel_appointment(appt_id):
-    run_query("UPDATE Appointments SET status='Cancelled' WHERE appointment_id=%s;", (appt_id,))
+def cancel_appointment(appt_id, user_id=None):
+    if run_query("UPDATE Appointments SET status='Cancelled' WHERE appointment_id=%s;", (appt_id,)):
+        audit(user_id, "Appointment", appt_id, "cancel")
     st.success("❌ Appointment cancelled.")
 
 def buy_property(user_id, property_id, amount):
-    run_query("""
-        INSERT INTO Buys (buyer_id, property_id, amount, date)
-        VALUES (%s, %s, %s, NOW());
-    """, (user_id, property_id, amount))
-    run_query("UPDATE Properties SET status='Sold' WHERE property_id=%s;", (property_id,))
+    # The status flip is conditional and shares the Buys insert's transaction,
+    # so two buyers (or a stale listing) can never both succeed
+    try:
+        with admitted_connection(WRITE) as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE Properties SET status='Sold'
+                        WHERE property_id=%s AND type='For_Sale' AND status='Available';
+                    """, (property_id,))
+                    if cursor.rowcount != 1:
+                        conn.rollback()
+                        st.warning("⚠️ This property is no longer available.")
+                        return
+                    cursor.execute("""
+                        INSERT INTO Buys (buyer_id, property_id, amount, date)
+                        VALUES (%s, %s, %s, NOW());
+                    """, (user_id, property_id, amount))
+                conn.commit()
+            except pymysql.Error:
+                conn.rollback()
+                raise
+    except DatabaseBusy as e:
+        st.warning(f"⏳ {e}")
+        return
+    except pymysql.Error as e:
+        st.error(f"❌ Database Error: {e}")
+        return
+    audit(user_id, "Buy", property_id, "buy", amount=amount)
     st.success("🏡 Property purchased successfully!")
 
 def rent_property(user_id, property_id, rent_amount, start_date, end_date):
-    if start_date < date.today():
-        st.error("❌ Start date cannot be in the past.")
+    try:
+        with admission.slot(WRITE):
+            rent_id = create_lease(user_id, property_id, rent_amount, start_date, end_date)
+    except DatabaseBusy as e:
+        st.warning(f"⏳ {e}")
         return
-    if end_date <= start_date:
-        st.error("❌ End date must be after start date.")
+    except ValueError as e:
+        st.error(f"❌ {e}")
         return
-
-    run_query("""
-        INSERT INTO Rents (tenant_id, property_id, rent_amount, start_date, end_date)
-        VALUES (%s, %s, %s, %s, %s);
-    """, (user_id, property_id, rent_amount, start_date, end_date))
-    run_query("UPDATE Properties SET status='Rented' WHERE property_id=%s;", (property_id,))
-    st.success("🏠 Property rented successfully!")
+    except pymysql.Error as e:
+        st.error(f"❌ Database Error: {e}")
+        return
+    audit(user_id, "Rent", property_id, "rent", rent_id=rent_id, rent_amount=rent_amount,
+          start_date=start_date, end_date=end_date)
+    st.success("🏠 Lease booked successfully!" if start_date > date.today() else "🏠 Property rented successfully!")
 
 def add_review(user_id, property_id, agent_id, rating, comments):
     try:
-        run_query("""
-            INSERT INTO Reviews (user_id, property_id, agent_id, rating, comments)
-            VALUES (%s, %s, %s, %s, %s);
-        """, (user_id, property_id, agent_id, rating, comments))
+        # The review and its agent/property analytics rows are written in one transaction
+        with admission.slot(WRITE):
+            record_review(user_id, property_id, agent_id, rating, comments)
         st.success("⭐ Review submitted successfully!")
     except pymysql.Error as e:
         if "Duplicate entry" in str(e):
@@ -155,19 +318,31 @@ def add_review(user_id, property_id, agent_id, rating, comments):
 
 def fetch_my_reviews(user_id):
     return run_query("""
-        SELECT r.rating, r.comments, p.title, u.name AS agent_name
+        SELECT r.rating, r.comments, r.property_id, p.title, u.name AS agent_name
         FROM Reviews r
         JOIN Properties p ON r.property_id = p.property_id
         JOIN Users u ON r.agent_id = u.user_id
-        WHERE r.user_id=%s;
+        WHERE r.user_id=%s
+        ORDER BY r.created_at DESC;
     """, (user_id,), fetch=True)
 
 def update_user_details(user_id, name, email, phone):
-    run_query("UPDATE Users SET name=%s, email=%s, phone=%s WHERE user_id=%s;", (name, email, phone, user_id))
-    st.success("✅ Profile updated successfully!")
+    if run_query("UPDATE Users SET name=%s, email=%s, phone=%s WHERE user_id=%s;", (name, email, phone, user_id)):
+        sync_user(user_id=user_id)
+        st.success("✅ Profile updated successfully!")
 
 def delete_account(user_id):
-    run_query("DELETE FROM Users WHERE user_id=%s;", (user_id,))
+    if run_query("DELETE FROM Users WHERE user_id=%s;", (user_id,)):
+        try:
+            remove_user(user_id)
+        except pymysql.Error as e:
+            print("Error removing user from shards:", e)
+        try:
+            # Their reviews cascaded away; the agents and listings they rated are rebuilt
+            refresh_queued_review_stats()
+        except pymysql.Error as e:
+            print("Error refreshing review stats:", e)
+        audit(user_id, "User", user_id, "delete_self")
     st.success("🗑️ Your account has been deleted. Transaction and review records are retained.")
     
     # Clear session and show message
@@ -178,13 +353,25 @@ def delete_account(user_id):
 # ============================================================
 # Display Helpers
 # ============================================================
+def display_similar(similar):
+    if not similar:
+        return
+    with st.expander("✨ Similar properties"):
+        for s in similar:
+            st.caption(f"🏠 {s['title']} — 📍 {s['location']} — 🏷️ {s['type']} — 💰 ₹{s['price']:,}")
+
 def display_properties(props, user):
+    similar = fetch_similar_properties([p["property_id"] for p in props])
+    photos = fetch_primary_photos([p["property_id"] for p in props])
+    calendars = fetch_lease_calendars([p["property_id"] for p in props if p["type"] == "For_Rent"])
     for p in props:
         col_img, col_info = st.columns([1, 3])
         with col_img:
-            try:
-                st.image("house.jpg", width=120)
-            except:
+            # Pre-sized thumbnail bytes from the in-memory cache; originals are never decoded here
+            image = thumbnail_bytes(photos.get(p["property_id"]))
+            if image:
+                st.image(image, width=120)
+            else:
                 st.write("🏠")
         with col_info:
             st.markdown(f"""
@@ -197,17 +384,49 @@ def display_properties(props, user):
             - ☎️ Contact: {p['agent_phone']}
             - ✉️ Email: {p['agent_email']}
             """)
+            if p.get("distance_km") is not None:
+                st.caption(f"📏 {p['distance_km']} km away")
             if p["type"] == "For_Sale" and p["status"] == "Available":
                 if st.button(f"💵 Buy {p['title']}", key=f"buy_{p['property_id']}"):
                     buy_property(user["user_id"], p["property_id"], p["price"])
-            elif p["type"] == "For_Rent" and p["status"] == "Available":
+            elif p["type"] == "For_Rent" and p["status"] in ("Available", "Rented"):
+                booked = calendars.get(p["property_id"], [])
+                free_from = available_from(booked)
+                st.caption(f"📅 Available from: {free_from}" if free_from else "📅 Leased with no end date")
                 with st.expander(f"🏠 Rent {p['title']}"):
-                    start_date = st.date_input("Start Date", min_value=date.today(), key=f"start_{p['property_id']}")
+                    if booked:
+                        st.caption("Booked: " + ", ".join(f"{s} → {e or 'open-ended'}" for s, e in booked))
+                    start_date = st.date_input("Start Date", value=free_from or date.today(), min_value=date.today(),
+                                               key=f"start_{p['property_id']}")
                     end_date = st.date_input("End Date", min_value=start_date, key=f"end_{p['property_id']}")
-                    if st.button(f"📅 Confirm Rent for {p['title']}", key=f"rent_{p['property_id']}"):
+                    clash = first_clash(booked, start_date, end_date)
+                    if clash:
+                        st.caption(f"⚠️ Overlaps the booking {clash[0]} → {clash[1] or 'open-ended'}.")
+                    if st.button(f"📅 Confirm Rent for {p['title']}", key=f"rent_{p['property_id']}",
+                                 disabled=bool(clash)):
                         rent_property(user["user_id"], p["property_id"], p["price"], start_date, end_date)
+            display_similar(similar.get(p["property_id"]))
         st.divider()
 
+def display_facets(facets):
+    labels = [
+        ("type", "🏷️ Type"),
+        ("city", "📍 City"),
+        ("price_bucket", "💰 Price"),
+        ("age_bucket", "🏗️ Building Age"),
+        ("agent_name", "👨‍💼 Agent"),
+    ]
+    with st.expander("📊 Refine your search", expanded=True):
+        cols = st.columns(len(labels))
+        for col, (name, title) in zip(cols, labels):
+            with col:
+                st.markdown(f"**{title}**")
+                values = facets.get(name, [])
+                if not values:
+                    st.caption("—")
+                for value, count in values[:8]:
+                    st.caption(f"{value} ({count})")
+
 # ============================================================
 # Main Client Dashboard
 # ============================================================
@@ -221,26 +440,95 @@ def client_dashboard(user):
         "💼 My Purchases & Rentals",
         "⭐ Write a Review",
         "💬 My Reviews",
+        "🔔 Saved Searches",
         "👤 My Account"
     ])
 
     if menu.startswith("🏡"):
         st.markdown("## 🔍 Search for Properties")
+        mode = st.radio("Search by", ["Location", "📍 Radius", "🗺️ Map Area"], horizontal=True)
         with st.form("search_form"):
             col1, col2, col3 = st.columns(3)
             with col1: type_sel = st.selectbox("Type", ["For_Sale", "For_Rent"])
-            with col2: location_sel = st.text_input("Location", placeholder="Enter city or area")
-            with col3: budget_sel = st.number_input("Max Budget", min_value=0, value=1000000, step=10000)
+            with col2: budget_sel = st.number_input("Max Budget", min_value=0, value=1000000, step=10000)
+            with col3:
+                if mode == "Location":
+                    location_sel = st.text_input("Location", placeholder="Enter city or area")
+                elif mode == "📍 Radius":
+                    radius_sel = st.number_input("Radius (km)", min_value=1.0, max_value=500.0, value=10.0, step=1.0)
+            if mode == "📍 Radius":
+                center_city = st.text_input("Near city", placeholder="e.g. Bangalore (or leave blank and use coordinates)")
+                c1, c2 = st.columns(2)
+                with c1: center_lat = st.number_input("Latitude", min_value=-90.0, max_value=90.0, value=0.0, format="%.6f")
+                with c2: center_lng = st.number_input("Longitude", min_value=-180.0, max_value=180.0, value=0.0, format="%.6f")
+            elif mode == "🗺️ Map Area":
+                c1, c2, c3, c4 = st.columns(4)
+                with c1: min_lat = st.number_input("Min Latitude", min_value=-90.0, max_value=90.0, value=12.8, format="%.6f")
+                with c2: max_lat = st.number_input("Max Latitude", min_value=-90.0, max_value=90.0, value=13.1, format="%.6f")
+                with c3: min_lng = st.number_input("Min Longitude", min_value=-180.0, max_value=180.0, value=77.4, format="%.6f")
+                with c4: max_lng = st.number_input("Max Longitude", min_value=-180.0, max_value=180.0, value=77.8, format="%.6f")
             search_btn = st.form_submit_button("Search")
+        if mode == "Location":
+            display_facets(fetch_search_facets(type_sel, location_sel, budget_sel))
         if search_btn:
-            props = fetch_properties(type_sel, location_sel, budget_sel)
+            props = None
+            if mode == "Location":
+                props = fetch_properties(type_sel, location_sel, budget_sel)
+            elif mode == "📍 Radius":
+                try:
+                    center = lookup_city(center_city) if center_city.strip() else (center_lat, center_lng)
+                except DatabaseBusy as e:
+                    st.warning(f"⏳ {e}")
+                    return
+                if center is None:
+                    st.error(f"❌ Unknown city '{center_city}'. Enter coordinates instead.")
+                    return
+                props = fetch_properties_near(type_sel, budget_sel, center[0], center[1], radius_sel)
+            else:
+                if min_lat >= max_lat or min_lng >= max_lng:
+                    st.error("❌ Minimum latitude/longitude must be below the maximum.")
+                    return
+                props = fetch_properties_in_box(type_sel, budget_sel, min_lat, min_lng, max_lat, max_lng)
             st.markdown("### 🏡 Search Results" if props else "No matching properties found.")
             if props: display_properties(props, user)
+            if mode == "Location" and city_of(location_sel):
+                with st.expander(f"📈 Price trend in {city_of(location_sel)}"):
+                    try:
+                        display_price_trend(fetch_price_trends(location_sel, type_sel))
+                    except pymysql.Error as e:
+                        st.error(f"❌ Database Error: {e}")
+        if mode == "Location" and st.button("🔔 Save this search", help="Get new matching listings in your inbox"):
+            try:
+                if save_search(user["user_id"], type_sel, location_sel, budget_sel):
+                    st.success("✅ Search saved. New matching listings will appear under 🔔 Saved Searches.")
+            except ValueError as e:
+                st.warning(f"⚠️ {e}")
+            except pymysql.Error as e:
+                st.error(f"❌ Database Error: {e}")
 
     elif menu.startswith("🏘️"):
         st.markdown("## 🏘️ All Available Properties")
-        props = fetch_all_properties()
-        display_properties(props, user) if props else st.info("No properties currently available.")
+        page = st.session_state.get("catalog_page", 0)
+        props, total = fetch_catalog_page(page)
+        if not props and total:
+            # The catalog shrank below the remembered page
+            page = st.session_state.catalog_page = 0
+            props, total = fetch_catalog_page(page)
+        if not props:
+            st.info("No properties currently available.")
+        else:
+            pages = (total + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE
+            st.caption(f"Page {page + 1} of {pages} · {total} listing(s)")
+            display_properties(props, user)
+            col_prev, col_next = st.columns(2)
+            with col_prev:
+                if page > 0 and st.button("⬅️ Previous"):
+                    st.session_state.catalog_page = page - 1
+                    st.rerun()
+            with col_next:
+                if page + 1 < pages and st.button("Next ➡️"):
+                    st.session_state.catalog_page = page + 1
+                    st.rerun()
 
     elif menu.startswith("📅"):
         st.markdown("## 📅 Book an Appointment")
@@ -261,7 +549,8 @@ def client_dashboard(user):
         st.markdown("## 🗓️ My Appointments (Past & Upcoming)")
         # ✅ Auto-update past appointments before fetching
         run_query("CALL MarkPastAppointmentsCompleted();")
-        df = fetch_appointments(user["user_id"])
+        include_archived = st.checkbox("🗄️ Include archived appointments")
+        df = fetch_appointments(user["user_id"], include_archived)
         if df.empty:
             st.info("No appointments found.")
         else:
@@ -270,31 +559,50 @@ def client_dashboard(user):
                     st.markdown(f"**Property:** {row['Property']}  \n**Agent:** {row['Agent']}  \n📅 {row['Date/Time']}  \n📌 Status: {row['Status']}")
                     if row["Status"] not in ["Cancelled", "Completed"]:
                         if st.button("Cancel", key=f"cancel_{row['Appointment ID']}"):
-                            cancel_appointment(row["Appointment ID"])
+                            cancel_appointment(row["Appointment ID"], user["user_id"])
                 st.divider()
 
     elif menu.startswith("💼"):
         st.markdown("## 💼 My Purchases & Rentals")
-        history = fetch_purchases_rentals(user["user_id"])
+        # Stack of keyset cursors; the top is the start of the current page
+        if "history_cursors" not in st.session_state:
+            st.session_state.history_cursors = [None]
+        history = fetch_purchases_rentals(user["user_id"], after=st.session_state.history_cursors[-1])
         if not history:
             st.info("No transactions found.")
         else:
+            similar = fetch_similar_properties([h["property_id"] for h in history])
             for h in history:
                 st.markdown(f"""
                 **Property:** {h['title']}  
                 **Location:** {h['location']}  
-                **Transaction:** {h['type']}  
+                **Transaction:** {h['type']} on {h['txn_date']}  
                 **Amount:** ₹{h['price']:,}  
                 **Agent:** {h['agent_name']}  
                 **Contact:** {h['agent_phone']}
                 """)
                 if h["type"] == "Rent":
                     st.write(f"🗓️ {h['start_date']} → {h['end_date']}")
+                    if h["end_date"] and st.button("🔁 Renew for the same term", key=f"renew_{h['txn_id']}"):
+                        # The next lease starts the day after this one ends; overlaps are rejected by the calendar
+                        renew_from = max(h["end_date"] + timedelta(days=1), date.today())
+                        rent_property(user["user_id"], h["property_id"], h["price"], renew_from,
+                                      renew_from + (h["end_date"] - h["start_date"]))
+                display_similar(similar.get(h["property_id"]))
                 st.divider()
+        col_prev, col_next = st.columns(2)
+        with col_prev:
+            if len(st.session_state.history_cursors) > 1 and st.button("⬅️ Newer"):
+                st.session_state.history_cursors.pop()
+                st.rerun()
+        with col_next:
+            if history and len(history) == HISTORY_PAGE_SIZE and st.button("Older ➡️"):
+                st.session_state.history_cursors.append(history_cursor(history[-1]))
+                st.rerun()
 
     elif menu.startswith("⭐"):
         st.markdown("## ⭐ Write a Review")
-        trans = fetch_purchases_rentals(user["user_id"])
+        trans = fetch_reviewable_properties(user["user_id"])
         if not trans:
             st.info("You can only review properties you've bought or rented.")
             return
@@ -304,8 +612,7 @@ def client_dashboard(user):
         rating = st.slider("Rating (1-5)", 1, 5, 5)
         comments = st.text_area("Comments")
         if st.button("Submit Review"):
-            agent_id = run_query("SELECT agent_id FROM Properties WHERE property_id=%s;", (selected_item["property_id"],), fetch=True)[0]["agent_id"]
-            add_review(user["user_id"], selected_item["property_id"], agent_id, rating, comments)
+            add_review(user["user_id"], selected_item["property_id"], selected_item["agent_id"], rating, comments)
 
     elif menu.startswith("💬"):
         st.markdown("## 💬 My Reviews")
@@ -316,8 +623,41 @@ def client_dashboard(user):
             for r in reviews:
                 stars = "⭐" * r["rating"]
                 st.markdown(f"**{r['title']}** ({stars})  \n👨‍💼 Agent: {r['agent_name']}  \n💬 {r['comments']}")
+                with st.expander("📊 How everyone rated this property"):
+                    display_review_stats(fetch_review_stats("property", r["property_id"]))
                 st.divider()
 
+    elif menu.startswith("🔔"):
+        st.markdown("## 🔔 Saved Searches")
+        inbox = fetch_inbox(user["user_id"])
+        unseen = sum(1 for m in inbox if not m["seen"])
+        st.markdown(f"### 📬 Inbox ({unseen} new)")
+        if not inbox:
+            st.info("No matches yet. Save a search from 🏡 Search Properties and new listings will show up here.")
+        else:
+            for m in inbox:
+                badge = "🆕 " if not m["seen"] else ""
+                st.markdown(f"{badge}**{m['title']}** · {m['type'].replace('_', ' ')} · ₹{m['price']:,.0f}  \n"
+                            f"📍 {m['location']} · matched {m['matched_at']:%Y-%m-%d %H:%M}")
+            if unseen and st.button("✔️ Mark all as read"):
+                mark_inbox_seen(user["user_id"])
+                st.rerun()
+
+        st.divider()
+        st.markdown("### 💾 My Saved Searches")
+        searches = fetch_saved_searches(user["user_id"])
+        if not searches:
+            st.info("You have no saved searches.")
+        for saved in searches:
+            col_info, col_delete = st.columns([5, 1])
+            with col_info:
+                st.markdown(f"**{saved['type'].replace('_', ' ')}** in **{saved['location'] or 'any location'}** "
+                            f"up to ₹{saved['max_budget']:,.0f} · {saved['matches']} match(es), {saved['unseen']} new")
+            with col_delete:
+                if st.button("🗑️", key=f"delete_search_{saved['search_id']}"):
+                    delete_search(user["user_id"], saved["search_id"])
+                    st.rerun()
+
     elif menu.startswith("👤"):
         st.markdown("## 👤 My Account")
 
@@ -337,9 +677,10 @@ def client_dashboard(user):
                     st.error("❌ Please enter a valid email address (e.g., name@domain.ext).")
                 else:
                     try:
-                        run_query("UPDATE Users SET name=%s, email=%s, phone=%s WHERE user_id=%s",
-                                (name.strip(), email.strip().lower(), phone.strip(), user["user_id"]))
-                        st.success("✅ Profile updated successfully!")
+                        if run_query("UPDATE Users SET name=%s, email=%s, phone=%s WHERE user_id=%s",
+                                     (name.strip(), email.strip().lower(), phone.strip(), user["user_id"])):
+                            sync_user(user_id=user["user_id"])
+                            st.success("✅ Profile updated successfully!")
                     except pymysql.err.IntegrityError:
                         st.error("🚫 That email is already in use. Choose another one.")
                     except Exception as e:
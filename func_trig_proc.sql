@@ -74,3 +74,604 @@ BEGIN
 END //
 
 DELIMITER ;
+
+-- ==============================================
+-- TABLE VERSION BUMPS (change polling)
+-- ==============================================
+-- Note: rows removed or updated by ON DELETE CASCADE / SET NULL do not fire
+-- triggers, so the parent DELETE triggers also bump their dependent tables.
+
+DELIMITER //
+
+CREATE PROCEDURE BumpTableVersion (
+    IN tbl VARCHAR(64)
+)
+BEGIN
+    -- Bulk restores (utils/backup.py) bump each table once at the end instead
+    IF @bulk_restore IS NULL THEN
+        -- One of 8 counter rows per table: writers on different connections rarely share a row lock
+        INSERT INTO TableVersions (table_name, slot, version)
+        VALUES (tbl, CONNECTION_ID() % 8, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1;
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterUserInsert_BumpVersion
+AFTER INSERT ON Users
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Users');
+END //
+
+CREATE TRIGGER trg_AfterUserUpdate_BumpVersion
+AFTER UPDATE ON Users
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Users');
+END //
+
+CREATE TRIGGER trg_AfterUserDelete_BumpVersion
+AFTER DELETE ON Users
+FOR EACH ROW
+BEGIN
+    -- Cascades into every other tracked table (Properties via SET NULL)
+    CALL BumpTableVersion('Users');
+    CALL BumpTableVersion('Properties');
+    CALL BumpTableVersion('Appointments');
+    CALL BumpTableVersion('Buys');
+    CALL BumpTableVersion('Rents');
+    CALL BumpTableVersion('Reviews');
+END //
+
+CREATE TRIGGER trg_AfterPropertyInsert_BumpVersion
+AFTER INSERT ON Properties
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Properties');
+END //
+
+CREATE TRIGGER trg_AfterPropertyUpdate_BumpVersion
+AFTER UPDATE ON Properties
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Properties');
+END //
+
+CREATE TRIGGER trg_AfterPropertyDelete_BumpVersion
+AFTER DELETE ON Properties
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Properties');
+    CALL BumpTableVersion('Appointments');
+    CALL BumpTableVersion('Buys');
+    CALL BumpTableVersion('Rents');
+    CALL BumpTableVersion('Reviews');
+END //
+
+CREATE TRIGGER trg_AfterAppointmentInsert_BumpVersion
+AFTER INSERT ON Appointments
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Appointments');
+END //
+
+CREATE TRIGGER trg_AfterAppointmentUpdate_BumpVersion
+AFTER UPDATE ON Appointments
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Appointments');
+END //
+
+CREATE TRIGGER trg_AfterAppointmentDelete_BumpVersion
+AFTER DELETE ON Appointments
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Appointments');
+END //
+
+CREATE TRIGGER trg_AfterBuyInsert_BumpVersion
+AFTER INSERT ON Buys
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Buys');
+END //
+
+CREATE TRIGGER trg_AfterBuyUpdate_BumpVersion
+AFTER UPDATE ON Buys
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Buys');
+END //
+
+CREATE TRIGGER trg_AfterBuyDelete_BumpVersion
+AFTER DELETE ON Buys
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Buys');
+END //
+
+CREATE TRIGGER trg_AfterRentInsert_BumpVersion
+AFTER INSERT ON Rents
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Rents');
+END //
+
+CREATE TRIGGER trg_AfterRentUpdate_BumpVersion
+AFTER UPDATE ON Rents
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Rents');
+END //
+
+CREATE TRIGGER trg_AfterRentDelete_BumpVersion
+AFTER DELETE ON Rents
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Rents');
+END //
+
+CREATE TRIGGER trg_AfterReviewInsert_BumpVersion
+AFTER INSERT ON Reviews
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Reviews');
+END //
+
+CREATE TRIGGER trg_AfterReviewUpdate_BumpVersion
+AFTER UPDATE ON Reviews
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Reviews');
+END //
+
+CREATE TRIGGER trg_AfterReviewDelete_BumpVersion
+AFTER DELETE ON Reviews
+FOR EACH ROW
+BEGIN
+    CALL BumpTableVersion('Reviews');
+END //
+
+DELIMITER ;
+
+-- ==============================================
+-- PROPERTY GEO SYNC AND GEOCODING
+-- ==============================================
+
+DELIMITER //
+
+CREATE TRIGGER trg_BeforePropertyInsert_SyncGeo
+BEFORE INSERT ON Properties
+FOR EACH ROW
+BEGIN
+    -- Fall back to the city lookup table when no coordinates were supplied
+    IF NEW.latitude IS NULL OR NEW.longitude IS NULL THEN
+        SELECT c.latitude, c.longitude INTO NEW.latitude, NEW.longitude
+        FROM CityCoordinates c
+        WHERE NEW.location LIKE CONCAT('%', c.city, '%')
+        ORDER BY CHAR_LENGTH(c.city) DESC
+        LIMIT 1;
+    END IF;
+
+    IF NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL THEN
+        SET NEW.geo_point = POINT(NEW.longitude, NEW.latitude);
+        SET NEW.geohash = ST_GeoHash(NEW.longitude, NEW.latitude, 9);
+    ELSE
+        SET NEW.geo_point = POINT(0, 0);
+        SET NEW.geohash = NULL;
+    END IF;
+END //
+
+CREATE TRIGGER trg_BeforePropertyUpdate_SyncGeo
+BEFORE UPDATE ON Properties
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.latitude <=> OLD.latitude) OR NOT (NEW.longitude <=> OLD.longitude) THEN
+        IF NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL THEN
+            SET NEW.geo_point = POINT(NEW.longitude, NEW.latitude);
+            SET NEW.geohash = ST_GeoHash(NEW.longitude, NEW.latitude, 9);
+        ELSE
+            SET NEW.geo_point = POINT(0, 0);
+            SET NEW.geohash = NULL;
+        END IF;
+    END IF;
+END //
+
+CREATE PROCEDURE GeocodePropertiesFromCities ()
+BEGIN
+    -- Places every un-geocoded listing whose location mentions a known city;
+    -- the longest matching city name wins ("New Delhi" over "Delhi").
+    UPDATE Properties p
+    JOIN CityCoordinates c ON c.city = (
+        SELECT c2.city
+        FROM CityCoordinates c2
+        WHERE p.location LIKE CONCAT('%', c2.city, '%')
+        ORDER BY CHAR_LENGTH(c2.city) DESC
+        LIMIT 1
+    )
+    SET p.latitude = c.latitude,
+        p.longitude = c.longitude
+    WHERE p.latitude IS NULL OR p.longitude IS NULL;
+END //
+
+DELIMITER ;
+
+-- Geocode the seed listings now that the sync triggers exist
+CALL GeocodePropertiesFromCities();
+
+-- ==============================================
+-- RECOMMENDATION REFRESH QUEUE
+-- ==============================================
+
+DELIMITER //
+
+CREATE PROCEDURE QueueRecommendationRefresh (
+    IN pid INT
+)
+BEGIN
+    -- Bulk restores recompute every neighbour list at the end instead
+    IF @bulk_restore IS NULL THEN
+        INSERT INTO RecommendationQueue (property_id, queued_at)
+        VALUES (pid, CURRENT_TIMESTAMP(6))
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterPropertyInsert_QueueRecommendation
+AFTER INSERT ON Properties
+FOR EACH ROW
+BEGIN
+    CALL QueueRecommendationRefresh(NEW.property_id);
+END //
+
+CREATE TRIGGER trg_AfterPropertyUpdate_QueueRecommendation
+AFTER UPDATE ON Properties
+FOR EACH ROW
+BEGIN
+    -- Only the columns that feed the feature vector matter
+    IF NOT (NEW.price <=> OLD.price)
+       OR NOT (NEW.type <=> OLD.type)
+       OR NOT (NEW.location <=> OLD.location)
+       OR NOT (NEW.building_age <=> OLD.building_age)
+       OR NOT (NEW.agent_id <=> OLD.agent_id)
+       OR NOT (NEW.status <=> OLD.status) THEN
+        CALL QueueRecommendationRefresh(NEW.property_id);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterPropertyDelete_QueueRecommendation
+AFTER DELETE ON Properties
+FOR EACH ROW
+BEGIN
+    CALL QueueRecommendationRefresh(OLD.property_id);
+END //
+
+CREATE TRIGGER trg_AfterReviewInsert_QueueRecommendation
+AFTER INSERT ON Reviews
+FOR EACH ROW
+BEGIN
+    -- A new rating shifts the agent rating feature of all their listings
+    IF @bulk_restore IS NULL THEN
+        INSERT INTO RecommendationQueue (property_id, queued_at)
+        SELECT property_id, CURRENT_TIMESTAMP(6) FROM Properties WHERE agent_id = NEW.agent_id
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterReviewUpdate_QueueRecommendation
+AFTER UPDATE ON Reviews
+FOR EACH ROW
+BEGIN
+    -- An edited rating (or a review moved to another agent) shifts both agents' averages
+    IF @bulk_restore IS NULL AND NOT (NEW.rating <=> OLD.rating AND NEW.agent_id <=> OLD.agent_id) THEN
+        INSERT INTO RecommendationQueue (property_id, queued_at)
+        SELECT property_id, CURRENT_TIMESTAMP(6) FROM Properties WHERE agent_id IN (OLD.agent_id, NEW.agent_id)
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterReviewDelete_QueueRecommendation
+AFTER DELETE ON Reviews
+FOR EACH ROW
+BEGIN
+    IF @bulk_restore IS NULL THEN
+        INSERT INTO RecommendationQueue (property_id, queued_at)
+        SELECT property_id, CURRENT_TIMESTAMP(6) FROM Properties WHERE agent_id = OLD.agent_id
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+DELIMITER ;
+
+-- ==============================================
+-- REVIEW STATS REPAIR QUEUE
+-- ==============================================
+-- AgentReviewStats/PropertyReviewStats are folded forward by add_review()
+-- (utils/review_stats.py). A review that is edited or deleted queues the rows
+-- it counted in, and utils/review_stats.py rebuilds them from Reviews (the
+-- keyword sketch cannot be decremented). Reviews removed by ON DELETE CASCADE
+-- fire no triggers, so deleting a user or listing queues the rows its reviews
+-- counted in beforehand; the deleted subject's own row cascades away.
+
+DELIMITER //
+
+CREATE PROCEDURE QueueReviewStatsRebuild (
+    IN review_scope VARCHAR(8),
+    IN sid INT
+)
+BEGIN
+    -- Bulk restores rebuild every stats row at the end instead
+    IF @bulk_restore IS NULL AND sid IS NOT NULL THEN
+        INSERT INTO ReviewStatsQueue (scope, subject_id, queued_at)
+        VALUES (review_scope, sid, CURRENT_TIMESTAMP(6))
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterReviewUpdate_QueueReviewStats
+AFTER UPDATE ON Reviews
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.rating <=> OLD.rating AND NEW.comments <=> OLD.comments
+            AND NEW.agent_id <=> OLD.agent_id AND NEW.property_id <=> OLD.property_id
+            AND NEW.created_at <=> OLD.created_at) THEN
+        CALL QueueReviewStatsRebuild('agent', OLD.agent_id);
+        CALL QueueReviewStatsRebuild('property', OLD.property_id);
+        CALL QueueReviewStatsRebuild('agent', NEW.agent_id);
+        CALL QueueReviewStatsRebuild('property', NEW.property_id);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterReviewDelete_QueueReviewStats
+AFTER DELETE ON Reviews
+FOR EACH ROW
+BEGIN
+    CALL QueueReviewStatsRebuild('agent', OLD.agent_id);
+    CALL QueueReviewStatsRebuild('property', OLD.property_id);
+END //
+
+CREATE TRIGGER trg_BeforeUserDelete_QueueReviewStats
+BEFORE DELETE ON Users
+FOR EACH ROW
+BEGIN
+    -- Reviews written by the user, or about them as an agent, cascade away
+    IF @bulk_restore IS NULL THEN
+        INSERT INTO ReviewStatsQueue (scope, subject_id, queued_at)
+        SELECT DISTINCT 'agent', agent_id, CURRENT_TIMESTAMP(6) FROM Reviews
+        WHERE user_id = OLD.user_id AND agent_id IS NOT NULL AND agent_id <> OLD.user_id
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+        INSERT INTO ReviewStatsQueue (scope, subject_id, queued_at)
+        SELECT DISTINCT 'property', property_id, CURRENT_TIMESTAMP(6) FROM Reviews
+        WHERE (user_id = OLD.user_id OR agent_id = OLD.user_id) AND property_id IS NOT NULL
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+CREATE TRIGGER trg_BeforePropertyDelete_QueueReviewStats
+BEFORE DELETE ON Properties
+FOR EACH ROW
+BEGIN
+    IF @bulk_restore IS NULL THEN
+        INSERT INTO ReviewStatsQueue (scope, subject_id, queued_at)
+        SELECT DISTINCT 'agent', agent_id, CURRENT_TIMESTAMP(6) FROM Reviews
+        WHERE property_id = OLD.property_id AND agent_id IS NOT NULL
+        ON DUPLICATE KEY UPDATE queued_at = CURRENT_TIMESTAMP(6);
+    END IF;
+END //
+
+DELIMITER ;
+
+-- ==============================================
+-- PRICE HISTORY AND CITY PRICE ROLLUPS
+-- ==============================================
+-- The city is the part of the location before the first comma (the same key
+-- db/sharding.py routes on). Buckets are FLOOR(LN(price) / LN(1.02)), so a
+-- median read from them is within about 1% (utils/price_trends.py).
+-- Transactions are counted on insert and uncounted on update/delete (admin
+-- "back to Available" deletes the Buys row, or cancels a lease starting that
+-- day). Bulk loads set
+-- @bulk_restore = 1 on their session to skip these triggers and call
+-- RebuildPriceRollups() once at the end (utils/backup.py).
+
+DELIMITER //
+
+CREATE PROCEDURE RecordPricePoint (
+    IN loc VARCHAR(255),
+    IN ptype VARCHAR(16),
+    IN pkind VARCHAR(16),
+    IN at_date DATE,
+    IN amount DECIMAL(12,2),
+    IN delta INT
+)
+BEGIN
+    DECLARE city_key VARCHAR(255) DEFAULT TRIM(SUBSTRING_INDEX(COALESCE(loc, ''), ',', 1));
+    DECLARE month_start DATE DEFAULT DATE_SUB(at_date, INTERVAL DAYOFMONTH(at_date) - 1 DAY);
+
+    IF amount IS NOT NULL AND amount > 0 AND ptype IS NOT NULL AND at_date IS NOT NULL THEN
+        INSERT INTO PriceRollups (city, type, kind, month, samples, total)
+        VALUES (city_key, ptype, pkind, month_start, GREATEST(delta, 0), GREATEST(delta, 0) * amount)
+        ON DUPLICATE KEY UPDATE samples = GREATEST(samples + delta, 0), total = total + delta * amount;
+
+        INSERT INTO PriceRollupBuckets (city, type, kind, month, bucket, samples)
+        VALUES (city_key, ptype, pkind, month_start, FLOOR(LN(amount) / LN(1.02)), GREATEST(delta, 0))
+        ON DUPLICATE KEY UPDATE samples = GREATEST(samples + delta, 0);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterPropertyInsert_PriceHistory
+AFTER INSERT ON Properties
+FOR EACH ROW
+BEGIN
+    IF @bulk_restore IS NULL THEN
+        INSERT INTO PriceHistory (property_id, old_price, new_price) VALUES (NEW.property_id, NULL, NEW.price);
+        CALL RecordPricePoint(NEW.location, NEW.type, 'Asking', CURDATE(), NEW.price, 1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterPropertyUpdate_PriceHistory
+AFTER UPDATE ON Properties
+FOR EACH ROW
+BEGIN
+    IF @bulk_restore IS NULL AND NOT (NEW.price <=> OLD.price) THEN
+        INSERT INTO PriceHistory (property_id, old_price, new_price) VALUES (NEW.property_id, OLD.price, NEW.price);
+        CALL RecordPricePoint(NEW.location, NEW.type, 'Asking', CURDATE(), NEW.price, 1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterBuyInsert_PriceRollup
+AFTER INSERT ON Buys
+FOR EACH ROW
+BEGIN
+    DECLARE loc VARCHAR(255);
+    IF @bulk_restore IS NULL THEN
+        SELECT location INTO loc FROM Properties WHERE property_id = NEW.property_id;
+        CALL RecordPricePoint(loc, 'For_Sale', 'Transaction', NEW.date, NEW.amount, 1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterBuyUpdate_PriceRollup
+AFTER UPDATE ON Buys
+FOR EACH ROW
+BEGIN
+    DECLARE loc VARCHAR(255);
+    IF @bulk_restore IS NULL AND NOT (NEW.amount <=> OLD.amount AND NEW.date <=> OLD.date
+                                      AND NEW.property_id <=> OLD.property_id) THEN
+        SELECT location INTO loc FROM Properties WHERE property_id = OLD.property_id;
+        CALL RecordPricePoint(loc, 'For_Sale', 'Transaction', OLD.date, OLD.amount, -1);
+        SELECT location INTO loc FROM Properties WHERE property_id = NEW.property_id;
+        CALL RecordPricePoint(loc, 'For_Sale', 'Transaction', NEW.date, NEW.amount, 1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterBuyDelete_PriceRollup
+AFTER DELETE ON Buys
+FOR EACH ROW
+BEGIN
+    DECLARE loc VARCHAR(255);
+    IF @bulk_restore IS NULL THEN
+        SELECT location INTO loc FROM Properties WHERE property_id = OLD.property_id;
+        CALL RecordPricePoint(loc, 'For_Sale', 'Transaction', OLD.date, OLD.amount, -1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterRentInsert_PriceRollup
+AFTER INSERT ON Rents
+FOR EACH ROW
+BEGIN
+    DECLARE loc VARCHAR(255);
+    IF @bulk_restore IS NULL THEN
+        SELECT location INTO loc FROM Properties WHERE property_id = NEW.property_id;
+        CALL RecordPricePoint(loc, 'For_Rent', 'Transaction', NEW.start_date, NEW.rent_amount, 1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterRentUpdate_PriceRollup
+AFTER UPDATE ON Rents
+FOR EACH ROW
+BEGIN
+    DECLARE loc VARCHAR(255);
+    IF @bulk_restore IS NULL AND NOT (NEW.rent_amount <=> OLD.rent_amount AND NEW.start_date <=> OLD.start_date
+                                      AND NEW.property_id <=> OLD.property_id) THEN
+        SELECT location INTO loc FROM Properties WHERE property_id = OLD.property_id;
+        CALL RecordPricePoint(loc, 'For_Rent', 'Transaction', OLD.start_date, OLD.rent_amount, -1);
+        SELECT location INTO loc FROM Properties WHERE property_id = NEW.property_id;
+        CALL RecordPricePoint(loc, 'For_Rent', 'Transaction', NEW.start_date, NEW.rent_amount, 1);
+    END IF;
+END //
+
+CREATE TRIGGER trg_AfterRentDelete_PriceRollup
+AFTER DELETE ON Rents
+FOR EACH ROW
+BEGIN
+    DECLARE loc VARCHAR(255);
+    IF @bulk_restore IS NULL THEN
+        SELECT location INTO loc FROM Properties WHERE property_id = OLD.property_id;
+        CALL RecordPricePoint(loc, 'For_Rent', 'Transaction', OLD.start_date, OLD.rent_amount, -1);
+    END IF;
+END //
+
+-- Rebuild both rollup tables set-based from PriceHistory, Buys and Rents
+-- (first install, or after bulk changes made with triggers bypassed).
+-- Listings without any history get their current price recorded first.
+CREATE PROCEDURE RebuildPriceRollups ()
+BEGIN
+    INSERT INTO PriceHistory (property_id, old_price, new_price)
+    SELECT p.property_id, NULL, p.price
+    FROM Properties p
+    WHERE NOT EXISTS (SELECT 1 FROM PriceHistory h WHERE h.property_id = p.property_id);
+
+    DELETE FROM PriceRollups;
+    DELETE FROM PriceRollupBuckets;
+
+    INSERT INTO PriceRollups (city, type, kind, month, samples, total)
+    SELECT city, type, kind, month, COUNT(*), SUM(amount)
+    FROM (
+        SELECT TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)) AS city, p.type, 'Asking' AS kind,
+               DATE_FORMAT(h.changed_at, '%Y-%m-01') AS month, h.new_price AS amount
+        FROM PriceHistory h JOIN Properties p ON p.property_id = h.property_id
+        UNION ALL
+        SELECT TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)), 'For_Sale', 'Transaction',
+               DATE_FORMAT(b.date, '%Y-%m-01'), b.amount
+        FROM Buys b JOIN Properties p ON p.property_id = b.property_id
+        UNION ALL
+        SELECT TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)), 'For_Rent', 'Transaction',
+               DATE_FORMAT(r.start_date, '%Y-%m-01'), r.rent_amount
+        FROM Rents r JOIN Properties p ON p.property_id = r.property_id
+    ) points
+    WHERE amount > 0
+    GROUP BY city, type, kind, month;
+
+    INSERT INTO PriceRollupBuckets (city, type, kind, month, bucket, samples)
+    SELECT city, type, kind, month, FLOOR(LN(amount) / LN(1.02)) AS bucket, COUNT(*)
+    FROM (
+        SELECT TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)) AS city, p.type, 'Asking' AS kind,
+               DATE_FORMAT(h.changed_at, '%Y-%m-01') AS month, h.new_price AS amount
+        FROM PriceHistory h JOIN Properties p ON p.property_id = h.property_id
+        UNION ALL
+        SELECT TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)), 'For_Sale', 'Transaction',
+               DATE_FORMAT(b.date, '%Y-%m-01'), b.amount
+        FROM Buys b JOIN Properties p ON p.property_id = b.property_id
+        UNION ALL
+        SELECT TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)), 'For_Rent', 'Transaction',
+               DATE_FORMAT(r.start_date, '%Y-%m-01'), r.rent_amount
+        FROM Rents r JOIN Properties p ON p.property_id = r.property_id
+    ) points
+    WHERE amount > 0
+    GROUP BY city, type, kind, month, bucket;
+END //
+
+DELIMITER ;
+
+-- Record the listings and transactions that existed before the triggers
+CALL RebuildPriceRollups();
+
+-- ==============================================
+-- RENTAL STATUS FROM THE LEASE CALENDAR
+-- ==============================================
+-- A For_Rent listing is 'Rented' exactly while one of its leases covers
+-- today, and 'Available' otherwise (future bookings keep it bookable for
+-- other windows). Booking a lease that starts today sets the status at once;
+-- leases starting and ending are caught by the app's first page of each day
+-- (utils/leases.py refresh_statuses_if_due), which also matches listings put
+-- back to Available against saved searches. `python -m utils.leases --refresh`
+-- does the same from cron. No MySQL event: it could not notify saved searches.
+
+DELIMITER //
+
+CREATE PROCEDURE RefreshRentalStatuses ()
+BEGIN
+    UPDATE Properties p
+    LEFT JOIN (
+        SELECT DISTINCT property_id
+        FROM Rents
+        WHERE lease_end >= CURDATE() AND start_date <= CURDATE()
+    ) cur ON cur.property_id = p.property_id
+    SET p.status = IF(cur.property_id IS NULL, 'Available', 'Rented')
+    WHERE p.type = 'For_Rent'
+      AND p.status IN ('Available', 'Rented')
+      AND p.status <> IF(cur.property_id IS NULL, 'Available', 'Rented');
+END //
+
+DELIMITER ;
+
+CALL RefreshRentalStatuses();
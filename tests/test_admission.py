@@ -0,0 +1,195 @@
+import threading
+import time
+
+import pymysql
+import pytest
+
+import db.admission as admission_module
+from db.admission import (AdmissionController, DatabaseBusy, admitted, admitted_connection, ANALYTICS,
+                          INTERACTIVE, WRITE)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.001)
+
+
+def queued(controller, n):
+    wait_until(lambda: controller.metrics()["queue_depth"] == n)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    """A one-slot controller installed as the process-wide one."""
+    c = AdmissionController(capacity=1, timeouts={INTERACTIVE: 5.0, WRITE: 5.0, ANALYTICS: 5.0})
+    monkeypatch.setattr(admission_module, "admission", c)
+    return c
+
+
+# ------------------------------------------------------------
+# Ordering
+# ------------------------------------------------------------
+def test_waiters_are_admitted_by_priority_then_arrival(controller):
+    order = []
+
+    def worker(name, priority):
+        with controller.slot(priority):
+            order.append(name)
+
+    controller.acquire(INTERACTIVE)
+    threads = []
+    for n, (name, priority) in enumerate([("report", ANALYTICS), ("save-1", WRITE), ("page", INTERACTIVE),
+                                          ("save-2", WRITE)], start=1):
+        threads.append(threading.Thread(target=worker, args=(name, priority)))
+        threads[-1].start()
+        queued(controller, n)
+    controller.release()
+    for t in threads:
+        t.join()
+    assert order == ["page", "save-1", "save-2", "report"]
+
+
+# ------------------------------------------------------------
+# Re-entrancy
+# ------------------------------------------------------------
+def test_nested_slots_on_one_thread_share_one_slot(controller):
+    with controller.slot(WRITE):
+        with controller.slot(INTERACTIVE):
+            assert controller.metrics()["active"] == 1
+            assert controller.held()
+        assert controller.held()
+    assert not controller.held()
+    assert controller.metrics()["active"] == 0
+
+
+def test_slots_are_not_shared_across_threads(controller):
+    errors = []
+
+    def other():
+        try:
+            controller.acquire(INTERACTIVE, timeout=0.01)
+        except DatabaseBusy as e:
+            errors.append(e)
+
+    with controller.slot(INTERACTIVE):
+        t = threading.Thread(target=other)
+        t.start()
+        t.join()
+    assert len(errors) == 1
+
+
+def test_slot_is_released_when_the_block_raises(controller):
+    with pytest.raises(RuntimeError):
+        with controller.slot(WRITE):
+            raise RuntimeError("boom")
+    assert controller.metrics()["active"] == 0 and not controller.held()
+
+
+# ------------------------------------------------------------
+# Timeouts and rejection
+# ------------------------------------------------------------
+def test_waiting_past_the_timeout_raises_busy(controller):
+    controller.acquire(INTERACTIVE)
+    with pytest.raises(DatabaseBusy):
+        controller.acquire(INTERACTIVE, timeout=0.01)
+    m = controller.metrics()
+    assert m["timed_out"]["interactive"] == 1 and m["queue_depth"] == 0
+    controller.release()
+
+
+def test_timed_out_head_does_not_block_the_next_waiter(controller):
+    controller.acquire(INTERACTIVE)
+    results = {}
+
+    def waiter(name, priority, timeout):
+        try:
+            controller.acquire(priority, timeout)
+            results[name] = "admitted"
+            controller.release()
+        except DatabaseBusy:
+            results[name] = "busy"
+
+    head = threading.Thread(target=waiter, args=("head", INTERACTIVE, 0.05))
+    head.start()
+    queued(controller, 1)
+    tail = threading.Thread(target=waiter, args=("tail", WRITE, 5.0))
+    tail.start()
+    queued(controller, 2)
+    head.join()
+    controller.release()
+    tail.join()
+    assert results == {"head": "busy", "tail": "admitted"}
+
+
+def test_full_class_queue_is_rejected_without_waiting():
+    c = AdmissionController(capacity=1, max_waiting={INTERACTIVE: 0, WRITE: 1, ANALYTICS: 1})
+    c.acquire(WRITE)
+    started = time.monotonic()
+    with pytest.raises(DatabaseBusy):
+        c.acquire(INTERACTIVE, timeout=5.0)
+    assert time.monotonic() - started < 1.0
+    assert c.metrics()["rejected"]["interactive"] == 1
+    c.release()
+
+
+# ------------------------------------------------------------
+# Wrappers
+# ------------------------------------------------------------
+def test_admitted_returns_the_busy_value_when_saturated(controller):
+    @admitted(INTERACTIVE, busy=list)
+    def read():
+        return ["row"]
+
+    controller.acquire(WRITE)
+    controller.timeouts[INTERACTIVE] = 0.01
+    assert read() == []
+    controller.release()
+    assert read() == ["row"]
+
+
+def test_admitted_without_busy_value_raises(controller):
+    @admitted(WRITE)
+    def write():
+        return True
+
+    controller.acquire(INTERACTIVE)
+    controller.timeouts[WRITE] = 0.01
+    with pytest.raises(DatabaseBusy):
+        write()
+    controller.release()
+
+
+def test_admitted_functions_nest_under_one_slot(controller):
+    @admitted(INTERACTIVE)
+    def inner():
+        return controller.metrics()["active"]
+
+    @admitted(WRITE)
+    def outer():
+        return inner()
+
+    assert outer() == 1
+
+
+def test_admitted_connection_closes_and_releases(controller):
+    conn = FakeConnection()
+    with admitted_connection(WRITE, connect=lambda: conn) as c:
+        assert c is conn and controller.held()
+    assert conn.closed and controller.metrics()["active"] == 0
+
+
+def test_admitted_connection_releases_the_slot_when_connecting_fails(controller):
+    with pytest.raises(pymysql.err.OperationalError):
+        with admitted_connection(WRITE, connect=lambda: None):
+            pass
+    assert controller.metrics()["active"] == 0
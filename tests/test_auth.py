@@ -0,0 +1,135 @@
+import pytest
+
+import db.admission as admission_module
+import utils.auth as auth
+from db.admission import AdmissionController
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.db.executed.append((sql, params))
+        if sql.startswith("UPDATE"):
+            new_hash, user_id, old_hash = params
+            self.rowcount = int(self.db.user["password"] == old_hash)
+            if self.rowcount:
+                self.db.user["password"] = new_hash
+
+    def fetchone(self):
+        return dict(self.db.user) if self.db.user else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeDirectory:
+    """Users table with one row; counts open connections."""
+
+    def __init__(self, user):
+        self.user = user
+        self.executed = []
+        self.open = 0
+
+    def connect(self):
+        self.open += 1
+        return self
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.open -= 1
+
+
+@pytest.fixture
+def directory(monkeypatch):
+    controller = AdmissionController(capacity=1)
+    monkeypatch.setattr(admission_module, "admission", controller)
+    monkeypatch.setattr(auth, "SCRYPT_LOG2_N", 10)
+    monkeypatch.setattr(auth, "sync_user", lambda *a, **k: None)
+    db = FakeDirectory(None)
+    monkeypatch.setattr(auth, "connect_directory", db.connect)
+
+    real_verify = auth._verify_now
+    db.during_verify = []
+
+    def verify(password, stored):
+        # No slot and no connection may be held while hashing
+        db.during_verify.append((controller.held(), controller.metrics()["active"], db.open))
+        return real_verify(password, stored)
+
+    monkeypatch.setattr(auth, "_verify_now", verify)
+    return db
+
+
+def user_row(password):
+    return {"user_id": 1, "email": "a@example.com", "name": "A", "role": "Client", "password": password}
+
+
+# ------------------------------------------------------------
+# Hash format
+# ------------------------------------------------------------
+def test_hash_round_trip(monkeypatch):
+    monkeypatch.setattr(auth, "SCRYPT_LOG2_N", 10)
+    stored = auth._hash_now("secret", log2_n=10)
+    assert stored.startswith("scrypt$v1$10$")
+    assert auth._verify_now("secret", stored) == (True, False)
+    assert auth._verify_now("wrong", stored) == (False, False)
+
+
+def test_older_cost_asks_for_a_rehash(monkeypatch):
+    monkeypatch.setattr(auth, "SCRYPT_LOG2_N", 11)
+    assert auth._verify_now("secret", auth._hash_now("secret", log2_n=10)) == (True, True)
+
+
+def test_malformed_hash_never_matches():
+    assert auth._verify_now("secret", "scrypt$v1$x") == (False, False)
+
+
+# ------------------------------------------------------------
+# authenticate_user
+# ------------------------------------------------------------
+def test_password_is_checked_outside_any_slot_or_connection(directory):
+    directory.user = user_row(auth._hash_now("secret", log2_n=10))
+    user = auth.authenticate_user("a@example.com", "secret")
+    assert user["user_id"] == 1 and "password" not in user
+    assert directory.during_verify == [(False, 0, 0)]
+
+
+def test_wrong_password_and_unknown_email_fail(directory):
+    directory.user = user_row(auth._hash_now("secret", log2_n=10))
+    assert auth.authenticate_user("a@example.com", "wrong") is None
+    directory.user = None
+    assert auth.authenticate_user("nobody@example.com", "secret") is None
+    # The unknown email still paid for one verification
+    assert len(directory.during_verify) == 2
+
+
+def test_plaintext_password_is_upgraded_with_compare_and_swap(directory):
+    directory.user = user_row("secret")
+    assert auth.authenticate_user("a@example.com", "secret")["user_id"] == 1
+    assert directory.user["password"].startswith("scrypt$v1$")
+    assert directory.executed[-1][1][2] == "secret"
+    assert directory.open == 0
+
+
+def test_concurrent_password_change_is_not_overwritten(directory, monkeypatch):
+    directory.user = user_row("secret")
+    real_replace = auth._replace_hash
+
+    def changed_meanwhile(user_id, old_hash, new_hash):
+        directory.user["password"] = "changed-elsewhere"
+        return real_replace(user_id, old_hash, new_hash)
+
+    monkeypatch.setattr(auth, "_replace_hash", changed_meanwhile)
+    assert auth.authenticate_user("a@example.com", "secret")
+    assert directory.user["password"] == "changed-elsewhere"
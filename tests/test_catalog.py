@@ -0,0 +1,81 @@
+import json
+import time
+from decimal import Decimal
+
+import pytest
+
+import utils.catalog as catalog
+from utils.catalog import CatalogSnapshot, _serialize, fresh_snapshot, publish_stamp, published_stamp
+
+PROPERTIES = [
+    {"property_id": 1, "agent_id": 10, "title": "Lake View Flat", "price": Decimal("4500000.00"),
+     "location": "Bangalore, Whitefield", "type": "For_Sale", "status": "Available"},
+    {"property_id": 2, "agent_id": 11, "title": "Studio", "price": Decimal("18000.50"),
+     "location": "Mumbai, Andheri", "type": "For_Rent", "status": "Rented"},
+]
+AGENTS = [{"user_id": 10, "name": "Asha", "phone": "1", "email": "asha@example.com"}]
+# Agent 11 has since become a client, but their listing must stay joinable
+EXTRA = [{"user_id": 11, "name": "Ravi", "phone": None, "email": "ravi@example.com"}]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, monkeypatch):
+    def no_mysql(*args, **kwargs):
+        raise AssertionError("fresh_snapshot() must not query MySQL")
+
+    monkeypatch.setattr(catalog, "version_stamp", no_mysql)
+    path = str(tmp_path / "catalog.bin")
+    _serialize(path, (3, 7), PROPERTIES, AGENTS, EXTRA)
+    return path
+
+
+# ------------------------------------------------------------
+# Freshness against the published stamp
+# ------------------------------------------------------------
+def test_snapshot_at_the_published_stamp_is_served(snapshot_path):
+    publish_stamp((3, 7), snapshot_path)
+    snap = fresh_snapshot(snapshot_path)
+    assert snap is not None and snap.stamp == (3, 7)
+
+
+def test_snapshot_behind_the_published_stamp_is_not_served(snapshot_path):
+    publish_stamp((4, 7), snapshot_path)
+    assert fresh_snapshot(snapshot_path) is None
+
+
+def test_without_a_published_stamp_nothing_is_served(snapshot_path):
+    assert fresh_snapshot(snapshot_path) is None
+
+
+def test_old_published_stamp_is_not_trusted(snapshot_path):
+    publish_stamp((3, 7), snapshot_path)
+    assert published_stamp(snapshot_path, now=time.time() + catalog.STAMP_MAX_AGE + 1) is None
+
+
+def test_a_newer_stamp_from_another_worker_is_picked_up(snapshot_path):
+    publish_stamp((3, 7), snapshot_path)
+    assert published_stamp(snapshot_path) == (3, 7)
+    # Another process replaces the sidecar
+    with open(f"{snapshot_path}.stamp", "w", encoding="utf-8") as f:
+        json.dump({"stamp": [5, 7], "observed_at": time.time() + 1}, f)
+    assert published_stamp(snapshot_path) == (5, 7)
+
+
+# ------------------------------------------------------------
+# Mapped reads
+# ------------------------------------------------------------
+def test_search_and_rows_round_trip(snapshot_path):
+    snap = CatalogSnapshot(snapshot_path)
+    rows = snap.property_rows(snap.search("For_Rent", "mumbai", 20000))
+    assert [dict(r) for r in rows] == [{
+        "property_id": 2, "title": "Studio", "price": Decimal("18000.50"), "location": "Mumbai, Andheri",
+        "type": "For_Rent", "status": "Rented", "agent_name": "Ravi", "agent_phone": None,
+        "agent_email": "ravi@example.com", "agent_id": 11,
+    }]
+    assert len(snap.search("For_Sale", None, 1000)) == 0
+    assert len(snap.search("Unknown")) == 0
+
+
+def test_only_agents_are_listed_as_agents(snapshot_path):
+    snap = CatalogSnapshot(snapshot_path)
+    assert [a["user_id"] for a in snap.agent_rows()] == [10]
@@ -0,0 +1,37 @@
+from utils.dedup import BANDS, band_buckets, listing_signature, similarity
+
+TITLE = "2BHK Apartment near Metro"
+
+
+# ------------------------------------------------------------
+# LSH buckets salted with the city
+# ------------------------------------------------------------
+def test_same_listing_in_another_city_shares_no_bucket():
+    # Same title and price; only the city differs
+    pune = band_buckets(listing_signature(TITLE, "Pune, Baner", 5_000_000), "Pune, Baner")
+    delhi = band_buckets(listing_signature(TITLE, "Delhi, Baner", 5_000_000), "Delhi, Baner")
+    assert len(pune) == len(delhi) == BANDS
+    assert not set(pune) & set(delhi)
+
+
+def test_identical_rows_hash_apart_under_different_cities():
+    sig = listing_signature(TITLE, "Pune, Baner", 5_000_000)
+    assert not set(band_buckets(sig, "Pune, Baner")) & set(band_buckets(sig, "Mumbai, Baner"))
+
+
+def test_the_locality_does_not_change_the_salt():
+    sig = listing_signature(TITLE, "Pune, Baner", 5_000_000)
+    assert band_buckets(sig, "Pune, Baner") == band_buckets(sig, " pune , Baner Road")
+
+
+def test_near_duplicates_in_one_city_still_pair_up():
+    a = listing_signature("2BHK Flat, MG Road", "Pune, Baner", 5_000_000)
+    b = listing_signature("2 BHK flat MG road", "Pune, Baner Road", 5_100_000)
+    assert similarity(a, b) >= 0.6
+    assert set(band_buckets(a, "Pune, Baner")) & set(band_buckets(b, "Pune, Baner Road"))
+
+
+def test_buckets_fit_an_unsigned_64_bit_column():
+    buckets = band_buckets(listing_signature(TITLE, "Pune", 1), "Pune")
+    assert [band for band, _ in buckets] == list(range(BANDS))
+    assert all(0 <= bucket < 2 ** 64 for _, bucket in buckets)
@@ -0,0 +1,79 @@
+import pytest
+
+from db.driver import ConnectorDriver, PyMySQLDriver, Session, to_qmark
+
+
+# ------------------------------------------------------------
+# to_qmark
+# ------------------------------------------------------------
+def test_placeholders_become_question_marks():
+    assert to_qmark("SELECT * FROM Users WHERE email=%s AND role=%s;") == \
+        "SELECT * FROM Users WHERE email=? AND role=?;"
+
+
+def test_escaped_percent_is_unescaped_everywhere():
+    assert to_qmark("SELECT 100 %% 7, x LIKE 'a%%' FROM t WHERE id=%s;") == \
+        "SELECT 100 % 7, x LIKE 'a%' FROM t WHERE id=?;"
+
+
+def test_placeholder_inside_quotes_stays_text():
+    assert to_qmark("SELECT '%s', \"%s\", `%s` FROM t WHERE a=%s;") == \
+        "SELECT '%s', \"%s\", `%s` FROM t WHERE a=?;"
+
+
+@pytest.mark.parametrize("literal", [r"'it\'s %s'", "'it''s %s'", r'"say \"%s\""', '"say ""%s"""', "`odd``%s`"])
+def test_escaped_quotes_do_not_end_the_literal(literal):
+    assert to_qmark(f"SELECT {literal}, %s;") == f"SELECT {literal}, ?;"
+
+
+def test_qmark_text_matches_what_pymysql_sends():
+    # pymysql always %-formats (params are always a tuple), so %% reaches the server as %
+    sql = "SELECT CONCAT('%%', location, '%%') FROM Properties WHERE price %% 2 = 0;"
+    assert to_qmark(sql) == sql % ()
+
+
+# ------------------------------------------------------------
+# Parameters are always passed as a tuple
+# ------------------------------------------------------------
+class RecordingCursor:
+    description = None
+    rowcount = 1
+    lastrowid = None
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.calls = []
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self.calls)
+
+
+@pytest.mark.parametrize("driver", [PyMySQLDriver(), ConnectorDriver()], ids=lambda d: d.name)
+@pytest.mark.parametrize("params, sent", [(None, ()), ((), ()), ([1, "a"], (1, "a")), ((2,), (2,))])
+def test_run_always_sends_a_tuple(driver, params, sent):
+    raw = RecordingConnection()
+    driver.run(raw, "SELECT %s;", params)
+    assert raw.calls == [("SELECT %s;", sent)]
+    assert type(raw.calls[0][1]) is tuple
+
+
+def test_session_execute_without_params_still_formats():
+    raw = RecordingConnection()
+    assert Session(PyMySQLDriver(), raw, prepare=False).execute("DELETE FROM t WHERE a LIKE 'x%%';") == 1
+    assert raw.calls == [("DELETE FROM t WHERE a LIKE 'x%%';", ())]
@@ -0,0 +1,46 @@
+from utils.geo import bounding_box, geohash_encode, geohash_prefixes
+
+BANGALORE = (12.9716, 77.5946)
+
+
+# ------------------------------------------------------------
+# geohash_encode (must agree with ST_GeoHash in the sync triggers)
+# ------------------------------------------------------------
+def test_known_geohash():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_default_length_matches_the_stored_column():
+    assert len(geohash_encode(*BANGALORE)) == 9
+
+
+def test_shorter_hash_is_a_prefix_of_the_longer_one():
+    assert geohash_encode(*BANGALORE).startswith(geohash_encode(*BANGALORE, 4))
+
+
+# ------------------------------------------------------------
+# geohash_prefixes
+# ------------------------------------------------------------
+def test_prefixes_cover_every_point_in_the_box():
+    box = bounding_box(*BANGALORE, 10)
+    prefixes = geohash_prefixes(*box)
+    min_lat, min_lng, max_lat, max_lng = box
+    for i in range(11):
+        for j in range(11):
+            lat = min_lat + (max_lat - min_lat) * i / 10
+            lng = min_lng + (max_lng - min_lng) * j / 10
+            assert any(geohash_encode(lat, lng).startswith(p) for p in prefixes)
+
+
+def test_prefixes_respect_the_cell_cap():
+    assert 0 < len(geohash_prefixes(12.8, 77.4, 13.1, 77.8, max_cells=4)) <= 4
+
+
+def test_small_box_gets_long_prefixes():
+    small = geohash_prefixes(*bounding_box(*BANGALORE, 0.5))
+    large = geohash_prefixes(*bounding_box(*BANGALORE, 50))
+    assert min(map(len, small)) > max(map(len, large))
+
+
+def test_whole_world_has_no_prefix_filter():
+    assert geohash_prefixes(-90, -180, 90, 180) == []
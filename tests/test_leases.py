@@ -0,0 +1,134 @@
+from datetime import date
+
+import pytest
+
+from utils.leases import available_from, end_current_lease, first_clash, windows_overlap
+
+TODAY = date(2025, 3, 10)
+
+
+# ------------------------------------------------------------
+# available_from
+# ------------------------------------------------------------
+def test_available_today_without_leases():
+    assert available_from([], TODAY) == TODAY
+
+
+def test_past_lease_does_not_block():
+    assert available_from([(date(2024, 1, 1), date(2025, 3, 9))], TODAY) == TODAY
+
+
+def test_running_lease_frees_the_day_after_it_ends():
+    assert available_from([(date(2025, 1, 1), date(2025, 3, 31))], TODAY) == date(2025, 4, 1)
+
+
+def test_lease_ending_today_still_covers_today():
+    assert available_from([(date(2025, 1, 1), TODAY)], TODAY) == date(2025, 3, 11)
+
+
+def test_back_to_back_leases_are_chained():
+    windows = [(date(2025, 1, 1), date(2025, 3, 31)), (date(2025, 4, 1), date(2025, 6, 30))]
+    assert available_from(windows, TODAY) == date(2025, 7, 1)
+
+
+def test_gap_before_a_future_lease_is_available():
+    windows = [(date(2025, 1, 1), date(2025, 3, 31)), (date(2025, 5, 1), date(2025, 6, 30))]
+    assert available_from(windows, TODAY) == date(2025, 4, 1)
+
+
+def test_open_ended_running_lease_blocks():
+    assert available_from([(date(2025, 1, 1), None)], TODAY) is None
+
+
+def test_open_ended_future_lease_leaves_today_free():
+    assert available_from([(date(2025, 6, 1), None)], TODAY) == TODAY
+
+
+# ------------------------------------------------------------
+# Overlap predicate (mirrors the SQL clash check in book_lease)
+# ------------------------------------------------------------
+def test_disjoint_windows_do_not_overlap():
+    assert not windows_overlap(date(2025, 1, 1), date(2025, 1, 31), date(2025, 2, 1), date(2025, 2, 28))
+
+
+def test_shared_end_day_overlaps():
+    # end_date is inclusive, so a lease ending on the 31st clashes with one starting that day
+    assert windows_overlap(date(2025, 1, 1), date(2025, 1, 31), date(2025, 1, 31), date(2025, 2, 28))
+
+
+def test_contained_window_overlaps():
+    assert windows_overlap(date(2025, 1, 1), date(2025, 12, 31), date(2025, 3, 1), date(2025, 3, 31))
+
+
+def test_open_ended_windows_overlap_everything_after_their_start():
+    assert windows_overlap(date(2025, 1, 1), None, date(2030, 1, 1), date(2030, 1, 31))
+    assert windows_overlap(date(2025, 1, 1), date(2025, 1, 31), date(2024, 1, 1), None)
+    assert not windows_overlap(date(2025, 2, 1), None, date(2025, 1, 1), date(2025, 1, 31))
+
+
+def test_overlap_is_symmetric():
+    a, b = (date(2025, 1, 10), date(2025, 2, 10)), (date(2025, 2, 1), None)
+    assert windows_overlap(*a, *b) == windows_overlap(*b, *a)
+
+
+def test_first_clash_returns_the_earliest_overlapping_booking():
+    booked = [(date(2025, 1, 1), date(2025, 1, 31)), (date(2025, 3, 1), date(2025, 3, 31)),
+              (date(2025, 5, 1), None)]
+    assert first_clash(booked, date(2025, 2, 1), date(2025, 2, 28)) is None
+    assert first_clash(booked, date(2025, 2, 15), date(2025, 3, 5)) == booked[1]
+    assert first_clash(booked, date(2025, 4, 1)) == booked[2]
+
+
+# ------------------------------------------------------------
+# end_current_lease (admin puts a rental back to Available)
+# ------------------------------------------------------------
+class LeaseCursor:
+    """Returns `current` for the running-lease lookup and records every statement."""
+
+    def __init__(self, current):
+        self.current = current
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((" ".join(sql.split()), params))
+
+    def fetchone(self):
+        return self.current
+
+    def writes(self):
+        return [(sql.split(" WHERE ")[0], params) for sql, params in self.executed[1:]]
+
+
+def test_running_lease_ends_yesterday_and_keeps_its_history():
+    cursor = LeaseCursor({"rent_id": 7, "start_date": date(2025, 1, 1), "has_payments": 1})
+    assert end_current_lease(cursor, 3, TODAY) == 7
+    yesterday = date(2025, 3, 9)
+    assert cursor.writes() == [
+        ("UPDATE Rents SET end_date = %s, dues_through = LEAST(dues_through, %s)", (yesterday, yesterday, 7)),
+        ("DELETE FROM RentDues", (7, yesterday)),
+    ]
+    # Only instalments nobody paid towards are dropped
+    assert "paid_amount = 0" in cursor.executed[-1][0]
+
+
+def test_only_the_lease_covering_today_is_touched():
+    cursor = LeaseCursor(None)
+    assert end_current_lease(cursor, 3, TODAY) is None
+    sql, params = cursor.executed[0]
+    assert "lease_end >= %s AND r.start_date <= %s" in sql and params == (3, TODAY, TODAY)
+    # Nothing is deleted or shortened, so future bookings and past leases stay
+    assert cursor.writes() == []
+    assert not any("DELETE FROM Rents WHERE property_id" in sql for sql, _ in cursor.executed)
+
+
+def test_unpaid_lease_starting_today_is_cancelled():
+    cursor = LeaseCursor({"rent_id": 8, "start_date": TODAY, "has_payments": 0})
+    assert end_current_lease(cursor, 3, TODAY) == 8
+    assert cursor.writes() == [("DELETE FROM Rents", (8,))]
+
+
+def test_lease_with_payments_is_never_deleted():
+    cursor = LeaseCursor({"rent_id": 9, "start_date": TODAY, "has_payments": 1})
+    with pytest.raises(ValueError):
+        end_current_lease(cursor, 3, TODAY)
+    assert cursor.writes() == []
@@ -0,0 +1,210 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from utils.ledger import (_open_dues, allocate_payment, instalment_schedule, ledger_balances,
+                          monthly_rental_income)
+
+
+class FakeCursor:
+    """Answers each execute() with the next canned result set."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.executed = []
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        self.rows = self.results.pop(0) if self.results else []
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, *args):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+def dues_of(schedule):
+    return [(d, e, a) for _, d, e, a in schedule]
+
+
+# ------------------------------------------------------------
+# instalment_schedule
+# ------------------------------------------------------------
+def test_month_end_anniversary_is_clipped_and_recovers():
+    schedule = instalment_schedule([1], [date(2025, 1, 31)], [None], [3000], date(2025, 4, 30))
+    assert dues_of(schedule) == [
+        (date(2025, 1, 31), date(2025, 2, 27), Decimal(3000)),
+        (date(2025, 2, 28), date(2025, 3, 30), Decimal(3000)),
+        (date(2025, 3, 31), date(2025, 4, 29), Decimal(3000)),
+        (date(2025, 4, 30), date(2025, 5, 30), Decimal(3000)),
+    ]
+
+
+def test_final_partial_period_is_prorated_by_days():
+    schedule = instalment_schedule([2], [date(2025, 1, 10)], [date(2025, 2, 24)], [3100], date(2025, 6, 1))
+    assert dues_of(schedule) == [
+        (date(2025, 1, 10), date(2025, 2, 9), Decimal(3100)),
+        # 15 of the 28 days from Feb 10 to Mar 9
+        (date(2025, 2, 10), date(2025, 2, 24), Decimal("1660.71")),
+    ]
+
+
+def test_instalment_due_on_through_is_included():
+    schedule = instalment_schedule([1], [date(2025, 1, 15)], [None], [1000], date(2025, 3, 15))
+    assert [d for _, d, _, _ in schedule] == [date(2025, 1, 15), date(2025, 2, 15), date(2025, 3, 15)]
+
+
+def test_after_skips_instalments_up_to_and_including_it():
+    schedule = instalment_schedule([3], [date(2025, 1, 15)], [None], [1000], date(2025, 5, 20), [date(2025, 3, 15)])
+    assert [d for _, d, _, _ in schedule] == [date(2025, 4, 15), date(2025, 5, 15)]
+
+
+def test_after_the_day_before_an_anniversary_keeps_it():
+    schedule = instalment_schedule([3], [date(2025, 1, 15)], [None], [1000], date(2025, 5, 20), [date(2025, 3, 14)])
+    assert [d for _, d, _, _ in schedule] == [date(2025, 3, 15), date(2025, 4, 15), date(2025, 5, 15)]
+
+
+def test_after_on_a_clipped_anniversary_moves_to_the_next_month():
+    schedule = instalment_schedule([1], [date(2025, 1, 31)], [None], [3000], date(2025, 3, 31), [date(2025, 2, 28)])
+    assert [d for _, d, _, _ in schedule] == [date(2025, 3, 31)]
+
+
+def test_leases_are_expanded_independently():
+    schedule = instalment_schedule([1, 2], [date(2025, 1, 1), date(2025, 3, 1)], [None, None], [100, 200],
+                                   date(2025, 3, 1), [None, None])
+    assert [(rid, d) for rid, d, _, _ in schedule] == [
+        (1, date(2025, 1, 1)), (1, date(2025, 2, 1)), (1, date(2025, 3, 1)), (2, date(2025, 3, 1)),
+    ]
+
+
+def test_lease_starting_after_through_has_no_instalments():
+    assert instalment_schedule([1], [date(2025, 6, 1)], [None], [1000], date(2025, 5, 31)) == []
+
+
+def test_no_leases():
+    assert instalment_schedule([], [], [], [], date(2025, 1, 1)) == []
+
+
+# ------------------------------------------------------------
+# _open_dues
+# ------------------------------------------------------------
+def test_open_dues_are_unpaid_rows_after_dues_through():
+    lease = {"rent_id": 7, "rent_amount": Decimal(1000), "start_date": date(2025, 1, 15),
+             "end_date": None, "dues_through": date(2025, 2, 20)}
+    cursor = FakeCursor([lease])
+    dues = _open_dues(cursor, date(2025, 4, 1), [7])
+    assert dues == [
+        {"rent_id": 7, "due_date": date(2025, 3, 15), "period_end": date(2025, 4, 14),
+         "amount": Decimal(1000), "paid_amount": Decimal(0)},
+    ]
+    # Only the requested leases are read
+    assert cursor.executed[0][1] == (date(2025, 4, 1), date(2025, 4, 1), 7)
+
+
+def test_open_dues_for_no_leases_runs_no_query():
+    cursor = FakeCursor()
+    assert _open_dues(cursor, date(2025, 4, 1), []) == []
+    assert cursor.executed == []
+
+
+# ------------------------------------------------------------
+# ledger_balances
+# ------------------------------------------------------------
+def due(rent_id, due_date, amount, paid=0):
+    return {"rent_id": rent_id, "due_date": due_date, "amount": Decimal(amount), "paid_amount": Decimal(paid)}
+
+
+def test_balances_split_due_overdue_and_upcoming():
+    balances = ledger_balances([
+        due(1, date(2025, 3, 1), 1000),            # 9 days late: overdue
+        due(1, date(2025, 3, 8), 1000, 400),       # 2 days late: due, within grace
+        due(1, date(2025, 4, 1), 1000),            # upcoming
+        due(1, date(2025, 2, 1), 1000, 1000),      # paid off
+    ], today=date(2025, 3, 10))
+    assert balances[1] == {
+        "outstanding": Decimal(1600), "overdue": Decimal(1000), "overdue_instalments": 1,
+        "days_overdue": 9, "next_due": date(2025, 4, 1),
+    }
+
+
+def test_overdue_starts_the_day_after_the_grace_period():
+    balances = ledger_balances([due(1, date(2025, 3, 5), 500), due(2, date(2025, 3, 4), 500)],
+                               today=date(2025, 3, 10), grace_days=5)
+    assert balances[1]["overdue"] == 0 and balances[1]["outstanding"] == 500
+    assert balances[2]["overdue"] == 500 and balances[2]["days_overdue"] == 6
+
+
+def test_balances_are_kept_apart_per_lease():
+    balances = ledger_balances([due(2, date(2025, 3, 1), 300), due(1, date(2025, 3, 1), 100, 50)],
+                               today=date(2025, 3, 2))
+    assert (balances[1]["outstanding"], balances[2]["outstanding"]) == (Decimal(50), Decimal(300))
+    assert balances[1]["next_due"] is None
+
+
+def test_no_dues_no_balances():
+    assert ledger_balances([]) == {}
+
+
+# ------------------------------------------------------------
+# allocate_payment
+# ------------------------------------------------------------
+OPEN = [{"due_id": 1, "owed": Decimal(500)}, {"due_id": 2, "owed": Decimal(1000)}]
+
+
+def test_payment_fills_the_oldest_instalment_first():
+    assert allocate_payment(OPEN, Decimal(700)) == [(1, Decimal(500)), (2, Decimal(200))]
+
+
+def test_payment_of_exactly_the_amount_owed_is_accepted():
+    assert allocate_payment(OPEN, Decimal(1500)) == [(1, Decimal(500)), (2, Decimal(1000))]
+
+
+def test_overpayment_by_one_paisa_is_rejected():
+    with pytest.raises(ValueError):
+        allocate_payment(OPEN, Decimal("1500.01"))
+
+
+def test_payment_with_nothing_owed_is_rejected():
+    with pytest.raises(ValueError):
+        allocate_payment([], Decimal(1))
+
+
+# ------------------------------------------------------------
+# monthly_rental_income
+# ------------------------------------------------------------
+def income(stored, today, pending_leases=()):
+    cursor = FakeCursor(stored, list(pending_leases))
+    return monthly_rental_income(today, connect=lambda: FakeConnection(cursor))
+
+
+def test_period_straddling_a_month_is_split_by_days():
+    stored = [{"due_date": date(2025, 1, 15), "period_end": date(2025, 2, 14), "amount": Decimal(3100)}]
+    assert income(stored, date(2025, 3, 1)) == {"2025-01": Decimal(1700), "2025-02": Decimal(1400)}
+
+
+def test_only_elapsed_days_of_the_current_period_accrue():
+    stored = [{"due_date": date(2025, 1, 15), "period_end": date(2025, 2, 14), "amount": Decimal(3100)}]
+    assert income(stored, date(2025, 1, 20)) == {"2025-01": Decimal(600)}
+
+
+def test_instalments_not_materialised_yet_still_accrue():
+    lease = {"rent_id": 1, "rent_amount": Decimal(3100), "start_date": date(2025, 1, 1),
+             "end_date": None, "dues_through": None}
+    assert income([], date(2025, 1, 31), [lease]) == {"2025-01": Decimal(3100)}
@@ -0,0 +1,166 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import db.admission as admission_module
+import utils.review_stats as review_stats
+from db.admission import AdmissionController
+from utils.review_stats import apply_review, rebuild_subject, refresh_queued_review_stats, STATS_TABLES
+
+EARLY = datetime(2025, 1, 1)
+LATE = datetime(2025, 2, 1)
+
+
+class FakeStatsCursor:
+    """Just enough of Reviews, the two stats tables and ReviewStatsQueue."""
+
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.result = []
+        if sql.startswith("SELECT rating, comments, created_at FROM Reviews"):
+            key = sql.split(" WHERE ")[1].split()[0]
+            self.result = [r for r in self.db.reviews if r[key] == params[0]]
+        elif sql.startswith("SELECT histogram, monthly, keywords FROM"):
+            table = sql.split(" FROM ")[1].split()[0]
+            row = self.db.stats[table].get(params[0])
+            self.result = [dict(row)] if row else []
+        elif sql.startswith("INSERT INTO"):
+            table = sql.split()[2]
+            subject_id, rating, histogram, monthly, counts = params
+            row = self.db.stats[table].setdefault(subject_id, {"review_count": 0, "rating_sum": 0})
+            row.update(review_count=row["review_count"] + 1, rating_sum=row["rating_sum"] + rating,
+                       histogram=histogram, monthly=monthly, keywords=counts)
+        elif sql.startswith("DELETE FROM ReviewStatsQueue WHERE"):
+            scope, subject_id, queued_at = params
+            if self.db.queue.get((scope, subject_id), queued_at) <= queued_at:
+                self.db.queue.pop((scope, subject_id), None)
+        elif sql.startswith("DELETE FROM"):
+            self.db.stats[sql.split()[2]].pop(params[0], None)
+        elif sql.startswith("SELECT scope, subject_id, queued_at FROM ReviewStatsQueue"):
+            self.result = [{"scope": s, "subject_id": i, "queued_at": t}
+                           for (s, i), t in sorted(self.db.queue.items(), key=lambda kv: kv[1])]
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeStatsDB:
+    def __init__(self):
+        self.reviews = []
+        self.stats = {"AgentReviewStats": {}, "PropertyReviewStats": {}}
+        self.queue = {}
+        self.commits = 0
+
+    def review(self, review_id, agent_id, property_id, rating, comments, created_at):
+        row = {"review_id": review_id, "agent_id": agent_id, "property_id": property_id,
+               "rating": rating, "comments": comments, "created_at": created_at}
+        self.reviews.append(row)
+        apply_review(self.cursor(), property_id, agent_id, rating, comments, created_at)
+        return row
+
+    def delete_review(self, review_id, queued_at):
+        """What the DELETE and trg_AfterReviewDelete_QueueReviewStats do."""
+        row = next(r for r in self.reviews if r["review_id"] == review_id)
+        self.reviews.remove(row)
+        self.queue[("agent", row["agent_id"])] = queued_at
+        self.queue[("property", row["property_id"])] = queued_at
+
+    def row(self, scope, subject_id):
+        row = self.stats[STATS_TABLES[scope][0]].get(subject_id)
+        if row is None:
+            return None
+        return {k: json.loads(v) if isinstance(v, str) else v for k, v in row.items()}
+
+    def cursor(self, *args):
+        return FakeStatsCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(admission_module, "admission", AdmissionController(capacity=1))
+    fake = FakeStatsDB()
+    monkeypatch.setattr(review_stats, "create_connection", lambda: fake)
+    return fake
+
+
+def folded(reviews):
+    """The stats rows a fresh fold of `reviews` produces."""
+    fresh = FakeStatsDB()
+    for r in reviews:
+        fresh.review(**r)
+    return fresh
+
+
+# ------------------------------------------------------------
+# Deleted reviews leave the counters
+# ------------------------------------------------------------
+def test_rebuilt_rows_match_the_remaining_reviews(db):
+    kept = db.review(1, 10, 100, 5, "Spacious balcony and quiet street", EARLY)
+    db.review(2, 10, 100, 1, "Noisy street, broken lift", LATE)
+    db.delete_review(2, queued_at=LATE)
+
+    assert rebuild_subject(db.cursor(), "agent", 10, LATE) == 1
+    assert rebuild_subject(db.cursor(), "property", 100, LATE) == 1
+
+    expected = folded([kept])
+    for scope, subject_id in (("agent", 10), ("property", 100)):
+        row = db.row(scope, subject_id)
+        assert row == expected.row(scope, subject_id)
+        assert (row["review_count"], row["rating_sum"]) == (1, 5)
+        assert row["histogram"] == [0, 0, 0, 0, 1]
+        assert row["monthly"] == {"2025-01": [1, 5]}
+        assert "broken" not in row["keywords"] and "lift" not in row["keywords"]
+    assert db.queue == {}
+
+
+def test_subject_without_reviews_left_has_no_row(db):
+    db.review(1, 10, 100, 4, "Good light", EARLY)
+    db.delete_review(1, queued_at=LATE)
+    assert rebuild_subject(db.cursor(), "agent", 10, LATE) == 0
+    assert db.row("agent", 10) is None
+
+
+def test_a_later_delete_stays_queued(db):
+    db.review(1, 10, 100, 4, "Good light", EARLY)
+    db.review(2, 10, 101, 2, "Damp walls", EARLY)
+    db.delete_review(1, queued_at=EARLY)
+    # Another delete lands after the rebuild read the queue
+    db.delete_review(2, queued_at=LATE)
+    rebuild_subject(db.cursor(), "agent", 10, EARLY)
+    assert ("agent", 10) in db.queue
+
+
+def test_refresh_rebuilds_every_queued_row(db):
+    db.review(1, 10, 100, 3, "Fair price", EARLY)
+    db.review(2, 11, 100, 5, "Helpful agent", EARLY)
+    # A reviewer was deleted: their review cascaded and the user trigger queued its rows
+    db.delete_review(2, queued_at=LATE)
+    assert refresh_queued_review_stats() == 2
+    assert db.row("agent", 11) is None
+    assert (db.row("property", 100)["review_count"], db.row("agent", 10)["review_count"]) == (1, 1)
+    assert db.queue == {} and db.commits == 1
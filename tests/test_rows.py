@@ -0,0 +1,68 @@
+import sys
+
+import pandas as pd
+import pytest
+
+from db.rows import CompactRow, RowSchema, compact_rows
+
+ROWS = [
+    {"property_id": 1, "title": "Lake View", "type": "For_Sale", "location": "Pune, Baner"},
+    {"property_id": 2, "title": "Studio", "type": "For_Rent", "location": "Pune, Baner"},
+]
+
+
+# ------------------------------------------------------------
+# Mapping contract
+# ------------------------------------------------------------
+def test_compact_rows_read_like_dict_rows():
+    rows = compact_rows([dict(r) for r in ROWS])
+    row = rows[0]
+    assert isinstance(row, CompactRow)
+    assert row["title"] == "Lake View"
+    assert row.get("title") == "Lake View"
+    assert row.get("missing") is None and row.get("missing", 0) == 0
+    assert "type" in row and "missing" not in row
+    assert list(row) == list(row.keys()) == list(ROWS[0])
+    assert list(row.values()) == list(ROWS[0].values())
+    assert list(row.items()) == list(ROWS[0].items())
+    assert len(row) == 4
+    assert dict(row) == ROWS[0]
+
+
+def test_missing_key_raises_key_error():
+    row = compact_rows([dict(ROWS[0])])[0]
+    with pytest.raises(KeyError):
+        row["missing"]
+
+
+def test_rows_compare_equal_to_dicts_and_to_each_other():
+    a, b = compact_rows([dict(r) for r in ROWS])
+    assert a == ROWS[0] and ROWS[0] == a
+    assert a != b
+    assert a == compact_rows([dict(ROWS[0])])[0]
+    assert CompactRow.__hash__ is None
+
+
+def test_rows_share_one_schema_and_pooled_strings():
+    a, b = compact_rows([dict(r) for r in ROWS])
+    assert a._schema is b._schema
+    assert a["location"] is b["location"]
+
+
+def test_rows_build_a_dataframe():
+    df = pd.DataFrame(compact_rows([dict(r) for r in ROWS]))
+    assert list(df.columns) == list(ROWS[0])
+    assert df["property_id"].tolist() == [1, 2]
+
+
+def test_non_dict_results_pass_through():
+    assert compact_rows([]) == []
+    assert compact_rows(None) is None
+    assert compact_rows([(1, 2)]) == [(1, 2)]
+    assert compact_rows({"a": 1}) == {"a": 1}
+
+
+def test_enum_values_are_interned():
+    schema = RowSchema(("type", "title"))
+    row = schema.row(["".join(["For_", "Sale"]), "Lake View"])
+    assert row["type"] is sys.intern("For_Sale")
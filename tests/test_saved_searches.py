@@ -0,0 +1,62 @@
+from utils.saved_searches import PREFIX_CHARS, candidate_prefixes, match_listing
+
+LOCATION = "Bangalore, Whitefield"
+
+
+def location_prefix(search_text):
+    """SavedSearches.location_prefix = LEFT(location, 3), compared case-insensitively."""
+    return search_text.strip()[:PREFIX_CHARS].lower()
+
+
+class FakeCursor:
+    rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.sql, self.params = sql, params
+
+
+# ------------------------------------------------------------
+# candidate_prefixes
+# ------------------------------------------------------------
+def test_every_text_the_like_search_finds_is_a_candidate():
+    # Whatever substring a client typed, LIKE '%text%' finds the listing,
+    # so its saved search must be among the indexed candidates
+    for i in range(len(LOCATION)):
+        for j in range(i + 1, len(LOCATION) + 1):
+            text = LOCATION[i:j]
+            if text.strip():
+                assert location_prefix(text) in candidate_prefixes(LOCATION), text
+
+
+def test_partial_words_are_candidates():
+    # Whole-word keys missed these although the Location search finds them
+    for text in ("White", "whitef", "galore", "ore, Wh"):
+        assert location_prefix(text) in candidate_prefixes(LOCATION)
+
+
+def test_case_does_not_matter():
+    assert location_prefix("WHITEFIELD") in candidate_prefixes(LOCATION)
+
+
+def test_anywhere_search_is_always_a_candidate():
+    assert "" in candidate_prefixes(LOCATION)
+    assert candidate_prefixes(None) == [""]
+
+
+def test_candidates_grow_linearly_with_the_location():
+    assert len(candidate_prefixes(LOCATION)) <= PREFIX_CHARS * len(LOCATION) + 1
+
+
+def test_unrelated_text_is_not_a_candidate():
+    assert location_prefix("Mumbai") not in candidate_prefixes(LOCATION)
+
+
+# ------------------------------------------------------------
+# match_listing
+# ------------------------------------------------------------
+def test_candidates_are_confirmed_with_the_search_like():
+    cursor = FakeCursor()
+    match_listing(cursor, 42, "For_Sale", 5_000_000, LOCATION, "Lake View")
+    keys = candidate_prefixes(LOCATION)
+    assert "LIKE CONCAT('%%', s.location, '%%')" in cursor.sql
+    assert cursor.params == (42, "Lake View", 5_000_000, LOCATION, "For_Sale", *keys, 5_000_000, LOCATION)
@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+
+from db.sharding import ShardMap, each_shard, merge_grouped, merge_sorted, shard_key, shard_names
+
+CONFIG = {
+    "shards": {"south": {}, "west": {"port": 3307}},
+    "cities": {"Bangalore": "south", "mumbai": "west"},
+    "default": "south",
+}
+
+
+# ------------------------------------------------------------
+# ShardMap
+# ------------------------------------------------------------
+def test_shard_key_is_the_normalised_city():
+    assert shard_key("  Bangalore , Whitefield") == "bangalore"
+    assert shard_key(None) == ""
+
+
+def test_cities_route_to_their_shard_and_others_to_the_default():
+    shard_map = ShardMap(CONFIG)
+    assert shard_map.shard_for_location("Mumbai, Andheri") == "west"
+    assert shard_map.shard_for_location("bangalore") == "south"
+    assert shard_map.shard_for_location("Goa") == "south"
+    assert shard_map.is_directory("south") and not shard_map.is_directory("west")
+
+
+def test_unknown_shard_in_the_map_is_rejected():
+    with pytest.raises(ValueError):
+        ShardMap({"shards": {"south": {}}, "cities": {"pune": "west"}})
+
+
+def test_the_app_runs_on_the_main_database_only():
+    assert not ShardMap().sharded
+    assert shard_names() == ["main"]
+    assert each_shard(lambda connect: 1) == {"main": 1}
+
+
+# ------------------------------------------------------------
+# Merging fan-out results
+# ------------------------------------------------------------
+def test_merge_sorted_interleaves_ordered_shard_results():
+    results = {
+        "south": [{"d": date(2025, 3, 1)}, {"d": date(2025, 1, 1)}],
+        "west": [{"d": date(2025, 2, 1)}],
+    }
+    merged = merge_sorted(results, "d", reverse=True, limit=2)
+    assert [r["d"] for r in merged] == [date(2025, 3, 1), date(2025, 2, 1)]
+
+
+def test_merge_grouped_re_sums_per_group():
+    results = {
+        "south": [{"agent": 1, "sales": 2, "total": 100}],
+        "west": [{"agent": 1, "sales": 1, "total": None}, {"agent": 2, "sales": 4, "total": 50}],
+    }
+    merged = {r["agent"]: r for r in merge_grouped(results, ("agent",), ("sales", "total"))}
+    assert (merged[1]["sales"], merged[1]["total"]) == (3, 100)
+    assert merged[2]["sales"] == 4
@@ -0,0 +1,78 @@
+import pytest
+
+import db.versions as versions
+from db.rows import CompactRow
+from db.versions import cached_query, clear_cache
+
+TABLES = ("Properties", "Users")
+
+
+@pytest.fixture
+def stamps(monkeypatch):
+    """TableVersions as a dict the tests bump, read without MySQL."""
+    current = {"Properties": 1, "Users": 1}
+    monkeypatch.setattr(versions, "fetch_versions", lambda tables: dict(current))
+    clear_cache()
+    yield current
+    clear_cache()
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [{"property_id": 1, "calls": self.calls}]
+
+
+# ------------------------------------------------------------
+# Invalidation on a version bump
+# ------------------------------------------------------------
+def test_result_is_reused_while_versions_are_unchanged(stamps):
+    loader = Loader()
+    first = cached_query("listings", TABLES, loader)
+    assert cached_query("listings", TABLES, loader) is first
+    assert loader.calls == 1
+    assert isinstance(first[0], CompactRow)
+
+
+def test_bumping_a_listed_table_reloads(stamps):
+    loader = Loader()
+    cached_query("listings", TABLES, loader)
+    stamps["Users"] += 1
+    assert cached_query("listings", TABLES, loader)[0]["calls"] == 2
+    assert cached_query("listings", TABLES, loader)[0]["calls"] == 2
+
+
+def test_bumping_another_table_keeps_the_result(stamps):
+    loader = Loader()
+    cached_query("listings", ("Properties",), loader)
+    stamps["Users"] += 1
+    cached_query("listings", ("Properties",), loader)
+    assert loader.calls == 1
+
+
+def test_unreadable_versions_bypass_the_cache(stamps, monkeypatch):
+    loader = Loader()
+    cached_query("listings", TABLES, loader)
+    monkeypatch.setattr(versions, "fetch_versions", lambda tables: None)
+    cached_query("listings", TABLES, loader)
+    cached_query("listings", TABLES, loader)
+    assert loader.calls == 3
+
+
+def test_none_results_are_not_cached(stamps):
+    calls = []
+    cached_query("broken", TABLES, lambda: calls.append(1))
+    cached_query("broken", TABLES, lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_cache_is_bounded(stamps, monkeypatch):
+    monkeypatch.setattr(versions, "MAX_CACHED_RESULTS", 2)
+    loaders = {key: Loader() for key in ("a", "b", "c")}
+    for key, loader in loaders.items():
+        cached_query(key, TABLES, loader)
+    cached_query("a", TABLES, loaders["a"])
+    assert loaders["a"].calls == 2 and len(versions._cache) == 2
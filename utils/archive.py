@@ -0,0 +1,88 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+from db.admission import admitted, ANALYTICS
+from db.connection import create_connection
+
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_CHUNK_SIZE = 500
+CHUNK_PAUSE = 0.05      # seconds between chunks so live traffic can interleave
+
+CLOSED_STATUSES = ("Completed", "Cancelled")
+
+
+# ------------------------------------------------------------
+# Chunked Archival Job
+# ------------------------------------------------------------
+@admitted(ANALYTICS)
+def archive_closed_appointments(older_than_days=ARCHIVE_AFTER_DAYS, chunk_size=ARCHIVE_CHUNK_SIZE, max_chunks=None):
+    """
+    Move Completed/Cancelled appointments older than the cutoff into
+    AppointmentsArchive, one short transaction per chunk. Returns rows moved.
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    moved = 0
+    chunks = 0
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        while max_chunks is None or chunks < max_chunks:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                # Walks idx_appt_status_datetime; locks only this chunk's rows
+                cursor.execute("""
+                    SELECT appointment_id
+                    FROM Appointments
+                    WHERE status IN (%s, %s) AND datetime < %s
+                    ORDER BY datetime
+                    LIMIT %s
+                    FOR UPDATE;
+                """, CLOSED_STATUSES + (cutoff, chunk_size))
+                ids = [row["appointment_id"] for row in cursor.fetchall()]
+                if not ids:
+                    conn.rollback()
+                    break
+                placeholders = ", ".join(["%s"] * len(ids))
+                cursor.execute(f"""
+                    INSERT INTO AppointmentsArchive (appointment_id, property_id, user_id, agent_id, datetime, status)
+                    SELECT appointment_id, property_id, user_id, agent_id, datetime, status
+                    FROM Appointments
+                    WHERE appointment_id IN ({placeholders});
+                """, tuple(ids))
+                cursor.execute(f"DELETE FROM Appointments WHERE appointment_id IN ({placeholders});", tuple(ids))
+            conn.commit()
+            moved += len(ids)
+            chunks += 1
+            if len(ids) < chunk_size:
+                break
+            time.sleep(CHUNK_PAUSE)
+        return moved
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@admitted(ANALYTICS, busy=None)
+def fetch_archive_stats():
+    conn = create_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM Appointments) AS hot_rows,
+                    (SELECT COUNT(*) FROM AppointmentsArchive) AS archived_rows;
+            """)
+            return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    print(f"Archived {archive_closed_appointments(days)} appointments older than {days} days.")
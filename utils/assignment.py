@@ -0,0 +1,157 @@
+import heapq
+
+import pymysql
+from db.bulk import bulk_update_column
+from db.admission import admitted, WRITE
+from db.connection import create_connection
+
+DEFAULT_RATING = 3.0
+
+# A same-city agent is preferred only while they carry at most this many more
+# (weighted) listings than the least-loaded agent overall.
+CITY_LOAD_SLACK = 5
+
+
+# ------------------------------------------------------------
+# Load-Balancing Planner
+# ------------------------------------------------------------
+class AgentLoadHeap:
+    """
+    Min-heap of agents keyed on weighted active-listing load, with one extra
+    heap per city for agents already working there. Stale entries are skipped
+    lazily on pop instead of being removed on every assignment.
+    """
+
+    def __init__(self, agents, agent_cities, rating_weight=0.0):
+        self.load = {a["user_id"]: int(a["active_listings"]) for a in agents}
+        # Better-rated agents absorb proportionally more listings when rating_weight > 0
+        self.weight = {
+            a["user_id"]: max(0.1, 1.0 + rating_weight * (float(a["rating"] or DEFAULT_RATING) - DEFAULT_RATING) / 5.0)
+            for a in agents
+        }
+        self.agent_cities = {a: set() for a in self.load}
+        for agent_id, city in agent_cities:
+            if agent_id in self.load:
+                self.agent_cities[agent_id].add(city)
+        self.heap = [(self.key(a), a) for a in self.load]
+        heapq.heapify(self.heap)
+        self.city_heaps = {}
+        for agent_id, cities in self.agent_cities.items():
+            for city in cities:
+                self.city_heaps.setdefault(city, []).append((self.key(agent_id), agent_id))
+        for h in self.city_heaps.values():
+            heapq.heapify(h)
+
+    def key(self, agent_id):
+        return (self.load[agent_id] / self.weight[agent_id], agent_id)
+
+    def _peek(self, heap):
+        while heap and heap[0][0] != self.key(heap[0][1]):
+            heapq.heappop(heap)
+        return heap[0][1] if heap else None
+
+    def take(self, city=None):
+        """Pick the least-loaded agent (preferring one already in `city`) and charge them one listing."""
+        agent_id = self._peek(self.heap)
+        if agent_id is None:
+            return None
+        if city is not None:
+            local = self._peek(self.city_heaps.get(city, []))
+            if local is not None and self.key(local)[0] <= self.key(agent_id)[0] + CITY_LOAD_SLACK:
+                agent_id = local
+            self.agent_cities[agent_id].add(city)
+        self.load[agent_id] += 1
+        entry = (self.key(agent_id), agent_id)
+        heapq.heappush(self.heap, entry)
+        for c in self.agent_cities[agent_id]:
+            heapq.heappush(self.city_heaps.setdefault(c, []), entry)
+        return agent_id
+
+
+def _city_key(location):
+    return (location or "").strip().lower()
+
+
+def plan_assignments(properties, agents, agent_cities=(), prefer_city=True, rating_weight=0.0):
+    """Return [(property_id, agent_id)] spreading `properties` over `agents` by current load."""
+    if not agents:
+        return []
+    heap = AgentLoadHeap(agents, [(a, _city_key(c)) for a, c in agent_cities], rating_weight)
+    plan = []
+    for p in properties:
+        agent_id = heap.take(_city_key(p["location"]) if prefer_city else None)
+        plan.append((p["property_id"], agent_id))
+    return plan
+
+
+# ------------------------------------------------------------
+# Batched Auto-Assignment
+# ------------------------------------------------------------
+@admitted(WRITE)
+def auto_assign_unassigned(property_ids=None, prefer_city=True, rating_weight=0.0, commit=True):
+    """
+    Assign unassigned listings (all of them, or just `property_ids`) to agents
+    in one transaction. Returns [(property_id, title, agent_id, agent_name)].
+    """
+    conn = create_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("Could not connect to the database.")
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            id_filter, params = "", ()
+            if property_ids is not None:
+                if not property_ids:
+                    conn.rollback()
+                    return []
+                id_filter = f"AND property_id IN ({', '.join(['%s'] * len(property_ids))})"
+                params = tuple(property_ids)
+            cursor.execute(f"""
+                SELECT property_id, title, location
+                FROM Properties
+                WHERE agent_id IS NULL {id_filter}
+                ORDER BY property_id
+                FOR UPDATE;
+            """, params)
+            unassigned = cursor.fetchall()
+            if not unassigned:
+                conn.rollback()
+                return []
+
+            cursor.execute("""
+                SELECT u.user_id, u.name,
+                       COUNT(p.property_id) AS active_listings,
+                       ar.avg_rating AS rating
+                FROM Users u
+                LEFT JOIN Properties p ON p.agent_id = u.user_id AND p.status = 'Available'
+                LEFT JOIN (
+                    SELECT agent_id, AVG(rating) AS avg_rating FROM Reviews GROUP BY agent_id
+                ) ar ON ar.agent_id = u.user_id
+                WHERE u.role = 'Agent'
+                GROUP BY u.user_id, u.name, ar.avg_rating;
+            """)
+            agents = cursor.fetchall()
+            agent_cities = []
+            if prefer_city:
+                cursor.execute("""
+                    SELECT DISTINCT agent_id, location
+                    FROM Properties
+                    WHERE agent_id IS NOT NULL AND status = 'Available';
+                """)
+                agent_cities = [(r["agent_id"], r["location"]) for r in cursor.fetchall()]
+
+            plan = [(pid, aid) for pid, aid in plan_assignments(unassigned, agents, agent_cities, prefer_city, rating_weight)
+                    if aid is not None]
+            if plan:
+                bulk_update_column(cursor, "Properties", "property_id", "agent_id", "INT", plan)
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        titles = {p["property_id"]: p["title"] for p in unassigned}
+        names = {a["user_id"]: a["name"] for a in agents}
+        return [(pid, titles[pid], aid, names[aid]) for pid, aid in plan]
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
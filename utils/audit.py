@@ -0,0 +1,229 @@
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+import pymysql
+from db.admission import admitted, admitted_connection, ANALYTICS
+from db.connection import create_connection
+
+AUDIT_QUEUE_SIZE = 10000
+FLUSH_BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0        # seconds between flushes when the queue is quiet
+ENQUEUE_TIMEOUT = 0.05      # how long a full queue may block the caller before the event is dropped
+RETRY_BACKOFF_MAX = 30.0
+
+ENTITIES = ("Property", "User", "Appointment", "Buy", "Rent", "Review")
+
+_INSERT_SQL = """
+    INSERT INTO AuditLog (occurred_at, actor_id, entity, entity_id, action, details)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+# ------------------------------------------------------------
+# Write-Behind Audit Writer
+# ------------------------------------------------------------
+class AuditWriter:
+    """
+    Buffers audit events in a bounded in-memory queue and writes them from a
+    background thread as multi-row INSERTs, so a mutation never waits on its
+    audit row.
+    """
+
+    def __init__(self, max_queue=AUDIT_QUEUE_SIZE, batch_size=FLUSH_BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._retry = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "blocked": 0,
+            "batches": 0,
+            "flush_errors": 0,
+            "max_depth": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    def _bump(self, key, n=1):
+        with self._metrics_lock:
+            self._metrics[key] += n
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def record(self, actor_id, entity, entity_id, action, **details):
+        """Queue one event. Returns False if it was dropped because the queue stayed full."""
+        self._ensure_started()
+        event = (
+            datetime.now(),
+            actor_id,
+            entity,
+            entity_id,
+            action,
+            json.dumps(details, default=str) if details else None,
+        )
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._bump("blocked")
+            try:
+                self._queue.put(event, timeout=ENQUEUE_TIMEOUT)
+            except queue.Full:
+                self._bump("dropped")
+                return False
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            self._metrics["enqueued"] += 1
+            self._metrics["max_depth"] = max(self._metrics["max_depth"], depth)
+        return True
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        # A busy database raises DatabaseBusy here and the batch is retried with backoff
+        with admitted_connection(ANALYTICS) as conn:
+            try:
+                with conn.cursor() as cursor:
+                    # executemany rewrites INSERT ... VALUES into one multi-row statement
+                    cursor.executemany(_INSERT_SQL, batch)
+                conn.commit()
+            except pymysql.Error:
+                conn.rollback()
+                raise
+        with self._metrics_lock:
+            self._metrics["written"] += len(batch)
+            self._metrics["batches"] += 1
+            self._metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _flush_pending(self, batch):
+        with self._flush_lock:
+            batch = self._retry + batch
+            self._retry = []
+            done = 0
+            try:
+                while done < len(batch):
+                    chunk = batch[done:done + self.batch_size]
+                    self._write(chunk)
+                    done += len(chunk)
+            except (pymysql.Error, OSError) as e:
+                print(f"Audit flush failed: {e}")
+                self._bump("flush_errors")
+                # Keep unwritten events for the next attempt, bounded like the queue itself
+                unwritten = batch[done:]
+                self._retry = unwritten[-self._queue.maxsize:]
+                self._bump("dropped", len(unwritten) - len(self._retry))
+                return False
+            return True
+
+    def _run(self):
+        backoff = self.interval
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=backoff)
+            except queue.Empty:
+                if self._retry and self._flush_pending([]):
+                    backoff = self.interval
+                continue
+            if self._flush_pending(self._drain(first)):
+                backoff = self.interval
+            else:
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+                self._stop.wait(backoff)
+
+    def flush(self):
+        """Write everything queued so far on the calling thread."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch or self._retry:
+            self._flush_pending(batch)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def metrics(self):
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        snapshot["queue_depth"] = self._queue.qsize()
+        snapshot["queue_capacity"] = self._queue.maxsize
+        snapshot["pending_retry"] = len(self._retry)
+        return snapshot
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.close)
+
+
+def audit(actor_id, entity, entity_id, action, **details):
+    return audit_writer.record(actor_id, entity, entity_id, action, **details)
+
+
+# ------------------------------------------------------------
+# Admin Viewer Query
+# ------------------------------------------------------------
+@admitted(ANALYTICS, busy=list)
+def fetch_audit_events(entity=None, entity_id=None, actor_id=None, since=None, until=None, limit=200):
+    clauses, params = [], []
+    if entity:
+        clauses.append("entity = %s")
+        params.append(entity)
+    if entity_id is not None:
+        clauses.append("entity_id = %s")
+        params.append(entity_id)
+    if actor_id is not None:
+        clauses.append("actor_id = %s")
+        params.append(actor_id)
+    if since is not None:
+        clauses.append("occurred_at >= %s")
+        params.append(since)
+    if until is not None:
+        clauses.append("occurred_at < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    params.append(limit)
+
+    conn = create_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT event_id, occurred_at, actor_id, entity, entity_id, action, details
+                FROM AuditLog
+                {where}
+                ORDER BY occurred_at DESC, event_id DESC
+                LIMIT %s;
+            """, tuple(params))
+            return cursor.fetchall()
+    finally:
+        conn.close()
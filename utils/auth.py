@@ -1,21 +1,164 @@
-from db.connection import create_connection
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-def authenticate_user(email, password):
-    conn = create_connection()
+from db.admission import admitted, ANALYTICS, INTERACTIVE, WRITE
+from db.sharding import connect_directory, sync_users
+
+# ------------------------------------------------------------
+# Hash Parameters
+# ------------------------------------------------------------
+# Stored format: scrypt$<version>$<log2 n>$<r>$<p>$<salt b64>$<hash b64>. The
+# parameters travel with each hash, so raising the cost only affects new
+# hashes; older ones are upgraded on the next login.
+#
+# The cost is NOT calibrated automatically: `python -m utils.auth --calibrate`
+# only measures this machine and prints a value, and operators must export
+# REALESTATE_SCRYPT_LOG2_N with it on every app host (the same value
+# everywhere, or logins would keep re-hashing between hosts). Unset, 2^14 is used.
+HASH_VERSION = "v1"
+SCRYPT_LOG2_N = int(os.environ.get("REALESTATE_SCRYPT_LOG2_N", "14"))
+SCRYPT_R = int(os.environ.get("REALESTATE_SCRYPT_R", "8"))
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+TARGET_VERIFY_MS = 100
+
+# scrypt releases the GIL, so a small pool bounds CPU and memory (128 * r * n
+# bytes per hash) during login spikes without blocking other sessions.
+VERIFY_WORKERS = int(os.environ.get("REALESTATE_AUTH_WORKERS", "2"))
+MAX_PENDING = 32
+VERIFY_TIMEOUT = 10.0
+
+
+class AuthBusy(Exception):
+    """Too many password checks are already queued; the user should retry shortly."""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password, salt, log2_n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=1 << log2_n, r=r, p=p,
+                          maxmem=256 * r * (1 << log2_n), dklen=KEY_BYTES)
+
+
+def _hash_now(password, log2_n=SCRYPT_LOG2_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = os.urandom(SALT_BYTES)
+    return f"scrypt${HASH_VERSION}${log2_n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, log2_n, r, p))}"
+
+
+def _verify_now(password, stored):
+    """(matches, needs_rehash). Plaintext rows from before hashing still verify once."""
+    if not stored:
+        return False, False
+    if not stored.startswith("scrypt$"):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+    try:
+        _, version, log2_n, r, p, salt, digest = stored.split("$")
+        log2_n, r, p = int(log2_n), int(r), int(p)
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), log2_n, r, p)
+    except (ValueError, TypeError):
+        return False, False
+    current = (version, log2_n, r, p) == (HASH_VERSION, SCRYPT_LOG2_N, SCRYPT_R, SCRYPT_P)
+    return hmac.compare_digest(actual, expected), not current
+
+
+# Verified against when the email is unknown so both paths cost the same
+_DUMMY_HASH = None
+
+
+# ------------------------------------------------------------
+# Bounded Worker Pool
+# ------------------------------------------------------------
+_pool = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="auth")
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _run(fn, *args):
+    if not _pending.acquire(blocking=False):
+        raise AuthBusy("Too many sign-ins in progress. Please try again in a moment.")
+    try:
+        return _pool.submit(fn, *args).result(timeout=VERIFY_TIMEOUT)
+    except FutureTimeout:
+        raise AuthBusy("Sign-in is taking longer than usual. Please try again in a moment.") from None
+    finally:
+        _pending.release()
+
+
+def hash_password(password):
+    return _run(_hash_now, password)
+
+
+def verify_password(password, stored):
+    return _run(_verify_now, password, stored)
+
+
+# ------------------------------------------------------------
+# Account Operations
+# ------------------------------------------------------------
+@admitted(INTERACTIVE)
+def _fetch_account(email):
+    """The Users row for `email` (None if unknown or unreachable), read under a short INTERACTIVE slot."""
+    conn = connect_directory()
     if not conn:
         return None
     try:
         with conn.cursor() as cursor:
-            sql = "SELECT * FROM Users WHERE email=%s AND password=%s"
-            cursor.execute(sql, (email, password))
-            user = cursor.fetchone()
-            return user
+            cursor.execute("SELECT * FROM Users WHERE email=%s", (email,))
+            return cursor.fetchone()
     finally:
         conn.close()
 
 
-def create_user(name, email, phone, password):
-    conn = create_connection()
+@admitted(WRITE)
+def _replace_hash(user_id, old_hash, new_hash):
+    """Compare-and-swap so a concurrent password change is never overwritten. Returns True if stored."""
+    conn = connect_directory()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE Users SET password=%s WHERE user_id=%s AND password=%s",
+                           (new_hash, user_id, old_hash))
+            conn.commit()
+            return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def authenticate_user(email, password):
+    """
+    The user row without its password, or None. The row is read under an
+    admission slot that is released before the password is checked, so slow
+    or queued hashing never holds a database slot or connection; only a
+    rehash takes a WRITE slot again, for the update itself.
+    """
+    global _DUMMY_HASH
+    user = _fetch_account(email)
+    if not user:
+        _DUMMY_HASH = _DUMMY_HASH or hash_password(os.urandom(8).hex())
+        verify_password(password, _DUMMY_HASH)
+        return None
+    stored = user.pop("password")
+    ok, needs_rehash = verify_password(password, stored)
+    if not ok:
+        return None
+    if needs_rehash and _replace_hash(user["user_id"], stored, hash_password(password)):
+        sync_user(email)
+    return user
+
+
+@admitted(WRITE)
+def _insert_client(name, email, phone, password_hash):
+    conn = connect_directory()
     if not conn:
         return False
     try:
@@ -25,7 +168,7 @@ def create_user(name, email, phone, password):
                 INSERT INTO Users (name, email, phone, role, password)
                 VALUES (%s, %s, %s, 'Client', %s)
             """
-            cursor.execute(sql, (name, email, phone, password))
+            cursor.execute(sql, (name, email, phone, password_hash))
             conn.commit()
             return True
     except Exception as e:
@@ -35,15 +178,103 @@ def create_user(name, email, phone, password):
         conn.close()
 
 
-def reset_password(email, new_password):
-    conn = create_connection()
+def create_user(name, email, phone, password):
+    # Hashed before taking a slot, like authenticate_user()
+    if not _insert_client(name, email, phone, hash_password(password)):
+        return False
+    sync_user(email)
+    return True
+
+
+def sync_user(email=None, user_id=None):
+    """Copy the directory row to every office shard; a failure is retried by `python -m db.sharding --sync-users`."""
+    try:
+        sync_users(user_ids=[user_id] if user_id else None, emails=[email] if email else None)
+    except Exception as e:
+        print("Error syncing user to shards:", e)
+
+
+@admitted(WRITE)
+def _store_password(email, password_hash):
+    conn = connect_directory()
     if not conn:
         return False
     try:
         with conn.cursor() as cursor:
             sql = "UPDATE Users SET password=%s WHERE email=%s"
-            cursor.execute(sql, (new_password, email))
+            cursor.execute(sql, (password_hash, email))
             conn.commit()
             return cursor.rowcount > 0
     finally:
         conn.close()
+
+
+def reset_password(email, new_password):
+    changed = _store_password(email, hash_password(new_password))
+    if changed:
+        sync_user(email)
+    return changed
+
+
+@admitted(ANALYTICS)
+def migrate_plaintext_passwords():
+    """Hash every remaining plaintext password in place. Returns rows migrated."""
+    conn = connect_directory()
+    if not conn:
+        return 0
+    migrated = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT user_id, email, password FROM Users WHERE password NOT LIKE %s", ("scrypt$%",))
+            for row in cursor.fetchall():
+                cursor.execute("UPDATE Users SET password=%s WHERE user_id=%s AND password=%s",
+                               (hash_password(row["password"]), row["user_id"], row["password"]))
+                if cursor.rowcount:
+                    migrated.append(row["email"])
+            conn.commit()
+    finally:
+        conn.close()
+    if migrated:
+        try:
+            sync_users(emails=migrated)
+        except Exception as e:
+            print("Error syncing users to shards:", e)
+    return len(migrated)
+
+
+# ------------------------------------------------------------
+# Cost Calibration
+# ------------------------------------------------------------
+def calibrate(target_ms=TARGET_VERIFY_MS, r=SCRYPT_R, repeats=3):
+    """Largest log2(n) whose verification stays within `target_ms` on this machine."""
+    salt = os.urandom(SALT_BYTES)
+    best, timings = 10, []
+    for log2_n in range(10, 21):
+        elapsed = min(
+            _timed(lambda: _scrypt("calibration", salt, log2_n, r, SCRYPT_P)) for _ in range(repeats)
+        )
+        timings.append((log2_n, elapsed))
+        if elapsed > target_ms:
+            break
+        best = log2_n
+    return best, timings
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return (time.perf_counter() - started) * 1000
+
+
+if __name__ == "__main__":
+    if "--migrate" in sys.argv:
+        print(f"Hashed {migrate_plaintext_passwords()} plaintext password(s).")
+    if "--calibrate" in sys.argv:
+        i = sys.argv.index("--calibrate")
+        target = float(sys.argv[i + 1]) if len(sys.argv) > i + 1 else TARGET_VERIFY_MS
+        best, timings = calibrate(target)
+        for log2_n, ms in timings:
+            print(f"n=2^{log2_n:<2} r={SCRYPT_R} p={SCRYPT_P}: {ms:8.1f} ms  {128 * SCRYPT_R * (1 << log2_n) >> 20} MiB")
+        print(f"\nTarget {target:.0f} ms -> export REALESTATE_SCRYPT_LOG2_N={best}")
+        print(f"Current setting: 2^{SCRYPT_LOG2_N}. Nothing is changed automatically: set the variable on "
+              f"every app host and restart.")
@@ -0,0 +1,496 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pymysql
+from db.connection import create_connection
+from db.versions import fetch_versions, TRACKED_TABLES
+from utils.dedup import find_duplicate_clusters
+from utils.digests import build_schedule_digests
+from utils.recommend import refresh_recommendations
+from utils.review_stats import rebuild_review_stats
+
+# Parent tables first; the order only matters for reporting, loads run with FK checks off.
+# Every table holding primary data that references a core table travels with it.
+BACKUP_TABLES = ("Users", "Properties", "Appointments", "Buys", "Rents", "Reviews",
+                 "RentDues", "RentPayments", "PriceHistory", "PropertyPhotos", "SavedSearches", "SearchMatches")
+# Computed from the tables above: emptied before a restore and rebuilt from the restored rows
+DERIVED_TABLES = ("PropertySignatures", "PropertyLSH", "PropertySimilar", "RecommendationQueue",
+                  "AgentReviewStats", "PropertyReviewStats", "ReviewStatsQueue", "AgentScheduleDigest",
+                  "PriceRollups", "PriceRollupBuckets")
+BACKUP_DIR = os.environ.get("REALESTATE_BACKUP_DIR", "backups")
+MANIFEST_NAME = "manifest.json"
+BATCH_ROWS = 10_000
+MAX_STATEMENT_BYTES = 1 << 20   # multi-row INSERTs stay well under max_allowed_packet
+MAX_WORKERS = min(len(BACKUP_TABLES), os.cpu_count() or 2)
+
+GEOMETRY_TYPES = {"geometry", "point", "linestring", "polygon", "multipoint", "multilinestring",
+                  "multipolygon", "geomcollection", "geometrycollection"}
+
+
+class BackupError(Exception):
+    """The snapshot on disk does not match its manifest or the live schema."""
+
+
+# ------------------------------------------------------------
+# Column Types
+# ------------------------------------------------------------
+def _table_columns(cursor, table):
+    """[(name, data_type, precision, scale)] in table order, generated columns excluded."""
+    cursor.execute("""
+        SELECT COLUMN_NAME AS name, DATA_TYPE AS data_type,
+               NUMERIC_PRECISION AS num_precision, NUMERIC_SCALE AS num_scale
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+          AND EXTRA NOT LIKE %s AND EXTRA NOT LIKE %s
+        ORDER BY ORDINAL_POSITION;
+    """, (table, "%VIRTUAL GENERATED%", "%STORED GENERATED%"))
+    return [(r["name"], r["data_type"], r["num_precision"], r["num_scale"]) for r in cursor.fetchall()]
+
+
+def _arrow_type(data_type, precision, scale):
+    if data_type in ("tinyint", "smallint", "mediumint", "int", "year"):
+        return pa.int32()
+    if data_type == "bigint":
+        return pa.int64()
+    if data_type == "decimal":
+        return pa.decimal128(precision, scale)
+    if data_type in ("float", "double"):
+        return pa.float64()
+    if data_type == "date":
+        return pa.date32()
+    if data_type in ("datetime", "timestamp"):
+        return pa.timestamp("us")
+    if data_type == "time":
+        return pa.duration("us")
+    if data_type in GEOMETRY_TYPES or data_type == "bit" or data_type.endswith(("blob", "binary")):
+        return pa.binary()
+    return pa.string()          # char/varchar/text/enum/set/json
+
+
+def _select_list(columns):
+    # Geometry travels as WKB so the file does not depend on MySQL's internal format
+    return ", ".join(
+        f"ST_AsBinary(`{name}`) AS `{name}`" if data_type in GEOMETRY_TYPES else f"`{name}`"
+        for name, data_type, _, _ in columns
+    )
+
+
+def _row_digest(rows, total=0):
+    """Order-independent content checksum: sum of per-row hashes mod 2**64."""
+    for row in rows:
+        total += int.from_bytes(hashlib.blake2b(repr(row).encode("utf-8"), digest_size=8).digest(), "big")
+    return total % (1 << 64)
+
+
+def _stream(conn, table, columns, batch_rows):
+    with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute(f"SELECT {_select_list(columns)} FROM `{table}`;")
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            yield rows
+
+
+def _connect(bulk_restore=False):
+    # @bulk_restore makes the derived-table triggers skip restored rows; they are rebuilt once at the end
+    init = "SET SESSION foreign_key_checks = 0, unique_checks = 0" + (", @bulk_restore = 1" if bulk_restore else "")
+    conn = create_connection(init_command=init)
+    if not conn:
+        raise ConnectionError("Could not connect to the database.")
+    return conn
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ------------------------------------------------------------
+# Export (one worker process per table)
+# ------------------------------------------------------------
+def _export_table(table, out_dir, batch_rows):
+    started = time.perf_counter()
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            columns = _table_columns(cursor, table)
+        schema = pa.schema([(name, _arrow_type(t, p, s)) for name, t, p, s in columns])
+        path = os.path.join(out_dir, f"{table}.parquet")
+        rows_written, digest = 0, 0
+        with pq.ParquetWriter(f"{path}.tmp", schema, compression="zstd") as writer:
+            for rows in _stream(conn, table, columns, batch_rows):
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                rows_written += len(rows)
+                digest = _row_digest(rows, digest)
+        os.replace(f"{path}.tmp", path)
+    finally:
+        conn.close()
+    return table, {
+        "file": os.path.basename(path),
+        "rows": rows_written,
+        "bytes": os.path.getsize(path),
+        "sha256": _sha256(path),
+        "digest": f"{digest:016x}",
+        "columns": [[name, t] for name, t, _, _ in columns],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def export_snapshot(out_dir=None, tables=BACKUP_TABLES, workers=MAX_WORKERS, batch_rows=BATCH_ROWS):
+    """
+    Write <out_dir>/<Table>.parquet for every table in parallel, plus a
+    manifest with row counts and checksums. Tables are read by separate
+    connections, so the manifest records whether any of them changed while
+    the export ran ("consistent"). Returns the manifest.
+    """
+    out_dir = out_dir or os.path.join(BACKUP_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    before = fetch_versions(tables)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = dict(pool.map(_export_table, tables, [out_dir] * len(tables), [batch_rows] * len(tables)))
+    after = fetch_versions(tables)
+    manifest = {
+        "format": 1,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "consistent": before is not None and before == after,
+        "versions": after,
+        "seconds": round(time.perf_counter() - started, 3),
+        "tables": {t: results[t] for t in tables},
+    }
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+    return manifest
+
+
+# ------------------------------------------------------------
+# Deferred Secondary Indexes
+# ------------------------------------------------------------
+def _index_definitions(cursor, table):
+    cursor.execute("""
+        SELECT INDEX_NAME AS name, NON_UNIQUE AS non_unique, INDEX_TYPE AS index_type,
+               COLUMN_NAME AS column_name, SUB_PART AS sub_part
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX;
+    """, (table,))
+    indexes = {}
+    for r in cursor.fetchall():
+        d = indexes.setdefault(r["name"], {"unique": not r["non_unique"], "type": r["index_type"], "columns": []})
+        d["columns"].append((r["column_name"], r["sub_part"]))
+    return indexes
+
+
+def _foreign_key_columns(cursor, table):
+    """Column lists that must stay indexed: this table's FKs and columns other tables reference."""
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME AS name, TABLE_NAME AS t, COLUMN_NAME AS col, REFERENCED_COLUMN_NAME AS ref_col,
+               REFERENCED_TABLE_NAME AS ref_t
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+          AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+        ORDER BY CONSTRAINT_NAME, ORDINAL_POSITION;
+    """, (table, table))
+    needs = {}
+    for r in cursor.fetchall():
+        if r["t"] == table:
+            needs.setdefault(("out", r["name"]), []).append(r["col"])
+        if r["ref_t"] == table:
+            needs.setdefault(("in", r["name"]), []).append(r["ref_col"])
+    return list(needs.values())
+
+
+def _deferrable_indexes(cursor, table):
+    """
+    The idx_* secondary indexes that can be dropped during the load: every
+    foreign key must still be covered by some remaining index's leading columns.
+    """
+    indexes = _index_definitions(cursor, table)
+    needs = _foreign_key_columns(cursor, table)
+    kept = {name: [c for c, _ in d["columns"]] for name, d in indexes.items()}
+    deferred = {}
+    for name in sorted(indexes):
+        cols = kept[name]
+        if not name.startswith("idx_") or None in cols:
+            continue
+        remaining = [c for n, c in kept.items() if n != name]
+        if all(any(c[:len(need)] == need for c in remaining) for need in needs):
+            deferred[name] = indexes[name]
+            del kept[name]
+    return deferred
+
+
+def _index_clause(name, d):
+    kind = {"SPATIAL": "SPATIAL ", "FULLTEXT": "FULLTEXT "}.get(d["type"], "UNIQUE " if d["unique"] else "")
+    cols = ", ".join(f"`{c}`({n})" if n else f"`{c}`" for c, n in d["columns"])
+    return f"ADD {kind}INDEX `{name}` ({cols})"
+
+
+def _rebuild_indexes(table, deferred):
+    """One ALTER per table so InnoDB sorts and builds all of its indexes in a single pass."""
+    started = time.perf_counter()
+    conn = _connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE `{table}` " + ", ".join(_index_clause(n, d) for n, d in deferred.items()))
+    finally:
+        conn.close()
+    return table, round(time.perf_counter() - started, 3)
+
+
+# ------------------------------------------------------------
+# Restore
+# ------------------------------------------------------------
+def load_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _insert_rows(cursor, head, row_sql, rows):
+    """Multi-row INSERTs of up to MAX_STATEMENT_BYTES each (executemany cannot batch ST_GeomFromWKB values)."""
+    parts, size = [], len(head)
+    for row in rows:
+        part = cursor.mogrify(row_sql, row)
+        if parts and size + len(part) + 1 > MAX_STATEMENT_BYTES:
+            cursor.execute(head + ",".join(parts))
+            parts, size = [], len(head)
+        parts.append(part)
+        size += len(part) + 1
+    if parts:
+        cursor.execute(head + ",".join(parts))
+
+
+def _load_table(table, path, columns, batch_rows):
+    started = time.perf_counter()
+    names = ", ".join(f"`{name}`" for name, _ in columns)
+    placeholders = ", ".join("ST_GeomFromWKB(%s)" if t in GEOMETRY_TYPES else "%s" for _, t in columns)
+    head = f"INSERT INTO `{table}` ({names}) VALUES "
+    loaded = 0
+    conn = _connect(bulk_restore=True)
+    try:
+        with conn.cursor() as cursor:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+                rows = list(zip(*(col.to_pylist() for col in batch.columns)))
+                _insert_rows(cursor, head, f"({placeholders})", rows)
+                conn.commit()
+                loaded += len(rows)
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return table, loaded, round(time.perf_counter() - started, 3)
+
+
+def _table_digest(table, columns):
+    conn = _connect()
+    try:
+        count, digest = 0, 0
+        for rows in _stream(conn, table, [(n, t, None, None) for n, t in columns], BATCH_ROWS):
+            count += len(rows)
+            digest = _row_digest(rows, digest)
+    finally:
+        conn.close()
+    return table, count, f"{digest:016x}"
+
+
+def _orphan_counts(cursor, tables):
+    """
+    FK checks were off during the load, so validate once at the end every
+    constraint on a restored table and every constraint pointing at one:
+    rows in tables outside the snapshot may now reference missing parents.
+    """
+    placeholders = ", ".join(["%s"] * len(tables))
+    cursor.execute(f"""
+        SELECT CONSTRAINT_NAME AS name, TABLE_NAME AS t, COLUMN_NAME AS col,
+               REFERENCED_TABLE_NAME AS ref_t, REFERENCED_COLUMN_NAME AS ref_col
+        FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+          AND (TABLE_NAME IN ({placeholders}) OR REFERENCED_TABLE_NAME IN ({placeholders}))
+        ORDER BY CONSTRAINT_NAME, ORDINAL_POSITION;
+    """, tuple(tables) * 2)
+    constraints = {}
+    for r in cursor.fetchall():
+        constraints.setdefault((r["name"], r["t"], r["ref_t"]), []).append((r["col"], r["ref_col"]))
+    orphans = {}
+    for (name, t, ref_t), pairs in constraints.items():
+        join = " AND ".join(f"c.`{col}` = p.`{ref_col}`" for col, ref_col in pairs)
+        not_null = " AND ".join(f"c.`{col}` IS NOT NULL" for col, _ in pairs)
+        cursor.execute(f"""
+            SELECT COUNT(*) AS n FROM `{t}` c LEFT JOIN `{ref_t}` p ON {join}
+            WHERE {not_null} AND p.`{pairs[0][1]}` IS NULL;
+        """)
+        n = cursor.fetchone()["n"]
+        if n:
+            orphans[name] = n
+    return orphans
+
+
+def _rebuild_derived(conn, tables):
+    """
+    Recompute the derived tables emptied before the load, and bump the
+    version of every restored table once (the per-row bumps were skipped).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("CALL RebuildPriceRollups();")
+        for table in tables:
+            if table in TRACKED_TABLES:
+                cursor.execute("CALL BumpTableVersion(%s);", (table,))
+    conn.commit()
+    rebuild_review_stats()
+    refresh_recommendations(full=True)
+    find_duplicate_clusters(refresh_index=True)
+    build_schedule_digests()
+
+
+def verify_snapshot(snapshot_dir, check_files=True):
+    """Raise BackupError if any Parquet file no longer matches the sha256 in its manifest."""
+    manifest = load_manifest(snapshot_dir)
+    if check_files:
+        for table, entry in manifest["tables"].items():
+            path = os.path.join(snapshot_dir, entry["file"])
+            if not os.path.exists(path) or _sha256(path) != entry["sha256"]:
+                raise BackupError(f"{entry['file']} is missing or does not match its checksum.")
+    return manifest
+
+
+def restore_snapshot(snapshot_dir, workers=MAX_WORKERS, batch_rows=BATCH_ROWS):
+    """
+    Replace the contents of the snapshot's tables with the Parquet files.
+
+    The target tables are truncated and loaded in parallel with foreign key
+    and unique checks off and idx_* secondary indexes dropped; afterwards the
+    indexes are rebuilt, every FK is checked for orphans and each table's row
+    count and content checksum are compared with the manifest, including
+    constraints from tables outside the snapshot that point into it.
+
+    The loaders set @bulk_restore, so row triggers (version bumps,
+    recommendation queue, price history and rollups) skip restored rows.
+    DERIVED_TABLES are emptied first and rebuilt once from the restored
+    tables at the end. The audit log and appointment archive are left as
+    they are.
+    """
+    manifest = verify_snapshot(snapshot_dir)
+    tables = list(manifest["tables"])
+    started = time.perf_counter()
+    conn = _connect()
+    deferred = {}
+    try:
+        with conn.cursor() as cursor:
+            for table in tables:
+                live = [[name, t] for name, t, _, _ in _table_columns(cursor, table)]
+                if live != manifest["tables"][table]["columns"]:
+                    raise BackupError(f"{table}: the live columns differ from the snapshot; migrate the schema first.")
+            for table in tables:
+                deferred[table] = _deferrable_indexes(cursor, table)
+                if deferred[table]:
+                    cursor.execute(f"ALTER TABLE `{table}` " + ", ".join(f"DROP INDEX `{n}`" for n in deferred[table]))
+                cursor.execute(f"TRUNCATE TABLE `{table}`;")
+            for table in DERIVED_TABLES:
+                cursor.execute(f"TRUNCATE TABLE `{table}`;")
+
+        load_started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            entries = [manifest["tables"][t] for t in tables]
+            loads = list(pool.map(
+                _load_table, tables,
+                [os.path.join(snapshot_dir, e["file"]) for e in entries],
+                [e["columns"] for e in entries],
+                [batch_rows] * len(tables),
+            ))
+            load_seconds = time.perf_counter() - load_started
+            pending = {t: d for t, d in deferred.items() if d}
+            index_seconds = dict(pool.map(_rebuild_indexes, pending, pending.values()))
+            deferred = {}
+            checks = list(pool.map(_table_digest, tables, [e["columns"] for e in entries]))
+
+        with conn.cursor() as cursor:
+            orphans = _orphan_counts(cursor, tables)
+        rebuild_started = time.perf_counter()
+        _rebuild_derived(conn, tables)
+        rebuild_seconds = time.perf_counter() - rebuild_started
+    finally:
+        # Never leave the live tables without their indexes, even after a failed load
+        with conn.cursor() as cursor:
+            for table, d in deferred.items():
+                if d:
+                    cursor.execute(f"ALTER TABLE `{table}` " + ", ".join(_index_clause(n, i) for n, i in d.items()))
+        conn.close()
+
+    mismatches = [
+        table for table, count, digest in checks
+        if (count, digest) != (manifest["tables"][table]["rows"], manifest["tables"][table]["digest"])
+    ]
+    return {
+        "tables": {table: {"rows": loaded, "seconds": seconds, "index_seconds": index_seconds.get(table, 0.0)}
+                   for table, loaded, seconds in loads},
+        "load_seconds": round(load_seconds, 3),
+        "rebuild_seconds": round(rebuild_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "orphans": orphans,
+        "mismatches": mismatches,
+        "ok": not orphans and not mismatches,
+    }
+
+
+# ------------------------------------------------------------
+# Reporting
+# ------------------------------------------------------------
+def _throughput(rows, nbytes, seconds):
+    seconds = max(seconds, 1e-6)
+    return f"{rows:>10,} rows {nbytes / 2**20:>8.1f} MiB {seconds:>8.2f} s {rows / seconds:>10,.0f} rows/s"
+
+
+def print_export_report(manifest):
+    for table, e in manifest["tables"].items():
+        print(f"{table:<14} {_throughput(e['rows'], e['bytes'], e['seconds'])}  {e['digest']}")
+    total_rows = sum(e["rows"] for e in manifest["tables"].values())
+    total_bytes = sum(e["bytes"] for e in manifest["tables"].values())
+    print(f"{'total':<14} {_throughput(total_rows, total_bytes, manifest['seconds'])}")
+    if not manifest["consistent"]:
+        print("Warning: tables changed during the export; the snapshot may mix points in time.")
+
+
+def print_restore_report(manifest, result):
+    for table, r in result["tables"].items():
+        nbytes = manifest["tables"][table]["bytes"]
+        print(f"{table:<14} {_throughput(r['rows'], nbytes, r['seconds'])}  +{r['index_seconds']:.2f} s indexes")
+    total_rows = sum(r["rows"] for r in result["tables"].values())
+    total_bytes = sum(e["bytes"] for e in manifest["tables"].values())
+    print(f"{'total':<14} {_throughput(total_rows, total_bytes, result['seconds'])}")
+    for name, n in result["orphans"].items():
+        print(f"Foreign key {name}: {n} orphaned row(s)")
+    for table in result["mismatches"]:
+        print(f"{table}: row count or checksum differs from the manifest")
+    print("Restore verified." if result["ok"] else "Restore finished with errors.")
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else MAX_WORKERS
+    if "--export" in sys.argv:
+        out = sys.argv[sys.argv.index("--out") + 1] if "--out" in sys.argv else None
+        print_export_report(export_snapshot(out, workers=workers))
+    elif "--restore" in sys.argv:
+        snapshot = sys.argv[sys.argv.index("--restore") + 1]
+        result = restore_snapshot(snapshot, workers=workers)
+        print_restore_report(load_manifest(snapshot), result)
+        sys.exit(0 if result["ok"] else 1)
+    elif "--verify" in sys.argv:
+        verify_snapshot(sys.argv[sys.argv.index("--verify") + 1])
+        print("All snapshot files match the manifest.")
+    else:
+        print("Usage: python -m utils.backup --export [--out DIR] | --restore DIR | --verify DIR [--workers N]")
@@ -0,0 +1,410 @@
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+import pymysql
+from db.admission import admitted, ANALYTICS
+from db.connection import create_connection
+from db.rows import RowSchema
+from db.versions import version_stamp
+from utils.leases import BOOKABLE_SQL
+
+SNAPSHOT_DIR = os.environ.get("REALESTATE_SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "catalog.bin")
+CATALOG_TABLES = ("Properties", "Users")
+POLL_INTERVAL = 1.0          # seconds between background version checks
+# A published stamp older than this (refreshers stopped, MySQL down) is not trusted
+STAMP_MAX_AGE = 3.0
+LOCK_STALE_AFTER = 120.0     # a writer lock older than this is assumed abandoned
+
+# Shared by every row handed out, so a page of listings carries no per-row keys
+PROPERTY_SCHEMA = RowSchema(("property_id", "title", "price", "location", "type", "status",
+                             "agent_name", "agent_phone", "agent_email", "agent_id"))
+AGENT_SCHEMA = RowSchema(("user_id", "name", "phone", "email"))
+
+MAGIC = b"RECATv2\0"
+ALIGN = 8
+
+
+# ------------------------------------------------------------
+# Columnar Writer
+# ------------------------------------------------------------
+class _Builder:
+    """Lays out typed columns back to back (8-byte aligned) after a JSON header."""
+
+    def __init__(self):
+        self.blocks = []
+        self.size = 0
+
+    def add(self, array):
+        array = np.ascontiguousarray(array)
+        offset = self.size
+        self.blocks.append(array.tobytes())
+        self.size += len(self.blocks[-1])
+        pad = -self.size % ALIGN
+        if pad:
+            self.blocks.append(b"\0" * pad)
+            self.size += pad
+        return {"dtype": array.dtype.str, "offset": offset, "count": len(array)}
+
+    def add_strings(self, values):
+        encoded = [(v or "").encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return {
+            "kind": "str",
+            "offsets": self.add(offsets),
+            "data": self.add(np.frombuffer(b"".join(encoded), dtype=np.uint8)),
+            "nulls": self.add(np.array([v is None for v in values], dtype=np.bool_)),
+        }
+
+    def add_category(self, values):
+        labels = sorted({v or "" for v in values})
+        index = {label: i for i, label in enumerate(labels)}
+        return {"kind": "cat", "labels": labels, "codes": self.add(np.array([index[v or ""] for v in values], dtype=np.uint32))}
+
+
+def _fetch_catalog(cursor):
+    cursor.execute(f"""
+        SELECT p.property_id, p.agent_id, p.title, p.price, p.location, p.type, p.status
+        FROM Properties p
+        JOIN Users u ON p.agent_id = u.user_id
+        WHERE {BOOKABLE_SQL}
+        ORDER BY p.property_id;
+    """)
+    properties = cursor.fetchall()
+    cursor.execute("SELECT user_id, name, phone, email FROM Users WHERE role='Agent' ORDER BY user_id;")
+    agents = cursor.fetchall()
+    # Listings can belong to a user whose role has since changed; keep them joinable
+    agent_ids = {a["user_id"] for a in agents}
+    missing = sorted({p["agent_id"] for p in properties} - agent_ids)
+    if missing:
+        cursor.execute(f"""
+            SELECT user_id, name, phone, email FROM Users
+            WHERE user_id IN ({', '.join(['%s'] * len(missing))});
+        """, tuple(missing))
+        extra = cursor.fetchall()
+    else:
+        extra = []
+    return properties, agents, extra
+
+
+@admitted(ANALYTICS, busy=None)
+def write_snapshot(path=SNAPSHOT_PATH):
+    """
+    Serialise bookable listings and agents into a columnar file and swap it
+    in atomically (write to a temp file, fsync, rename). Returns the version
+    stamp it was built at, or None if MySQL is unreachable.
+    """
+    stamp = version_stamp(CATALOG_TABLES)   # read first: a concurrent write makes the file look stale, never fresh
+    if stamp is None:
+        return None
+    conn = create_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            properties, agents, extra = _fetch_catalog(cursor)
+    finally:
+        conn.close()
+    _serialize(path, stamp, properties, agents, extra)
+    return stamp
+
+
+def _serialize(path, stamp, properties, agents, extra):
+    agent_ids = {a["user_id"] for a in agents}
+    people = sorted(agents + extra, key=lambda a: a["user_id"])
+    b = _Builder()
+    header = {
+        "stamp": list(stamp),
+        "created_at": time.time(),
+        "properties": {
+            "rows": len(properties),
+            "property_id": b.add(np.array([p["property_id"] for p in properties], dtype=np.int64)),
+            "agent_id": b.add(np.array([p["agent_id"] for p in properties], dtype=np.int64)),
+            "price_paise": b.add(np.array([int(p["price"] * 100) for p in properties], dtype=np.int64)),
+            "title": b.add_strings([p["title"] for p in properties]),
+            "location": b.add_category([p["location"] for p in properties]),
+            "type": b.add_category([p["type"] for p in properties]),
+            "status": b.add_category([p["status"] for p in properties]),
+        },
+        "users": {
+            "rows": len(people),
+            "user_id": b.add(np.array([a["user_id"] for a in people], dtype=np.int64)),
+            "is_agent": b.add(np.array([a["user_id"] in agent_ids for a in people], dtype=np.bool_)),
+            "name": b.add_strings([a["name"] for a in people]),
+            "phone": b.add_strings([a["phone"] for a in people]),
+            "email": b.add_strings([a["email"] for a in people]),
+        },
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(len(MAGIC) + 8 + len(header_bytes)) % ALIGN)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for block in b.blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# ------------------------------------------------------------
+# Memory-Mapped Reader
+# ------------------------------------------------------------
+class CatalogSnapshot:
+    """
+    Read-only view over a snapshot file. Columns are numpy arrays backed by
+    the shared page cache, so every worker process mapping the same file
+    shares one physical copy; rows are only materialised for the page shown.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.identity = (st.st_ino, st.st_mtime_ns)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.touched = False
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header_len = int(np.frombuffer(self._mm, dtype=np.uint64, count=1, offset=len(MAGIC))[0])
+        self._base = len(MAGIC) + 8 + header_len
+        header = json.loads(self._mm[len(MAGIC) + 8:self._base])
+        self.stamp = tuple(header["stamp"])
+        self.created_at = header["created_at"]
+        self.properties = {name: self._column(spec) for name, spec in header["properties"].items() if name != "rows"}
+        self.users = {name: self._column(spec) for name, spec in header["users"].items() if name != "rows"}
+
+    def _array(self, spec):
+        return np.frombuffer(self._mm, dtype=np.dtype(spec["dtype"]), count=spec["count"],
+                             offset=self._base + spec["offset"])
+
+    def _column(self, spec):
+        if spec.get("kind") == "str":
+            return {"kind": "str", "offsets": self._array(spec["offsets"]),
+                    "start": self._base + spec["data"]["offset"], "nulls": self._array(spec["nulls"])}
+        if spec.get("kind") == "cat":
+            return {"kind": "cat", "labels": spec["labels"], "codes": self._array(spec["codes"])}
+        return self._array(spec)
+
+    def _strings(self, column, rows):
+        mm, start = self._mm, column["start"]
+        begins = (column["offsets"][rows] + start).tolist()
+        ends = (column["offsets"][rows + 1] + start).tolist()
+        nulls = column["nulls"][rows].tolist()
+        return [None if null else mm[b:e].decode("utf-8") for b, e, null in zip(begins, ends, nulls)]
+
+    @staticmethod
+    def _labels(column, rows):
+        labels = column["labels"]
+        return [labels[c] for c in column["codes"][rows].tolist()]
+
+    def touch(self):
+        """Fault every page in once (warm-up) so the first request does no disk I/O."""
+        self.touched = True
+        return sum(self._mm[i] for i in range(0, len(self._mm), mmap.PAGESIZE))
+
+    # -------------------------- queries --------------------------
+    def search(self, prop_type=None, location=None, budget=None):
+        """Row positions matching the client search filters, computed on the mapped columns."""
+        cols = self.properties
+        mask = np.ones(len(cols["property_id"]), dtype=bool)
+        if prop_type is not None:
+            labels = cols["type"]["labels"]
+            mask &= cols["type"]["codes"] == (labels.index(prop_type) if prop_type in labels else len(labels))
+        if budget is not None:
+            mask &= cols["price_paise"] <= int(Decimal(str(budget)) * 100)
+        if location:
+            # LIKE '%x%' on a low-cardinality column: test each distinct label once, then match codes
+            needle = location.lower()
+            hits = [i for i, label in enumerate(cols["location"]["labels"]) if needle in label.lower()]
+            mask &= np.isin(cols["location"]["codes"], hits)
+        return np.flatnonzero(mask)
+
+    def property_rows(self, rows=None):
+        cols, users = self.properties, self.users
+        rows = np.arange(len(cols["property_id"])) if rows is None else rows
+        agent_ids = cols["agent_id"][rows]
+        agent_pos = np.searchsorted(users["user_id"], agent_ids)
+        titles, locations, types, statuses = (self._strings(cols["title"], rows), self._labels(cols["location"], rows),
+                                              self._labels(cols["type"], rows), self._labels(cols["status"], rows))
+        names, phones, emails = (self._strings(users[c], agent_pos) for c in ("name", "phone", "email"))
+        row = PROPERTY_SCHEMA.row
+        return [
+            row((pid, title, Decimal(paise).scaleb(-2), loc, ptype, status, name, phone, email, aid))
+            for pid, title, paise, loc, ptype, status, name, phone, email, aid in zip(
+                cols["property_id"][rows].tolist(), titles, cols["price_paise"][rows].tolist(),
+                locations, types, statuses, names, phones, emails, agent_ids.tolist())
+        ]
+
+    def agent_rows(self):
+        users = self.users
+        rows = np.flatnonzero(users["is_agent"])
+        names, phones, emails = (self._strings(users[c], rows) for c in ("name", "phone", "email"))
+        row = AGENT_SCHEMA.row
+        return [
+            row((uid, name, phone, email))
+            for uid, name, phone, email in zip(users["user_id"][rows].tolist(), names, phones, emails)
+        ]
+
+
+# ------------------------------------------------------------
+# Process-Wide Access, Refresh and Warm-Up
+# ------------------------------------------------------------
+_current = None
+_current_lock = threading.Lock()
+_refresher = None
+
+
+def current_snapshot(path=SNAPSHOT_PATH):
+    """
+    The mapped snapshot, remapped if another process has swapped in a new
+    file. Costs one stat() call and never touches MySQL; None if absent.
+    """
+    global _current
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    with _current_lock:
+        if _current is None or _current.identity != (st.st_ino, st.st_mtime_ns):
+            try:
+                # The old mapping is released once no request still holds it
+                _current = CatalogSnapshot(path)
+            except (OSError, ValueError) as e:
+                print(f"Error mapping catalog snapshot: {e}")
+                return _current
+        return _current
+
+
+def _stamp_path(path):
+    return f"{path}.stamp"
+
+
+def publish_stamp(stamp, path=SNAPSHOT_PATH):
+    """
+    Record the Properties/Users version stamp just read from MySQL in a
+    sidecar file next to the snapshot (atomic replace), so every worker
+    on the host can check freshness without querying MySQL itself.
+    """
+    target = _stamp_path(path)
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"stamp": list(stamp), "observed_at": time.time()}, f)
+    os.replace(tmp, target)
+
+
+_published = (None, None)    # ((sidecar path, mtime_ns), (stamp, observed_at))
+
+
+def published_stamp(path=SNAPSHOT_PATH, max_age=STAMP_MAX_AGE, now=None):
+    """The last stamp any refresher published, or None if absent or older than max_age seconds."""
+    global _published
+    target = _stamp_path(path)
+    try:
+        key = (target, os.stat(target).st_mtime_ns)
+        if _published[0] != key:
+            with open(target, encoding="utf-8") as f:
+                data = json.load(f)
+            _published = (key, (tuple(data["stamp"]), data["observed_at"]))
+    except (OSError, ValueError, KeyError):
+        return None
+    stamp, observed_at = _published[1]
+    if (now or time.time()) - observed_at > max_age:
+        return None
+    return stamp
+
+
+def fresh_snapshot(path=SNAPSHOT_PATH):
+    """
+    current_snapshot() if it was built at the version stamp the background
+    refreshers last published (see publish_stamp()), else None so the caller
+    falls back to SQL. Costs two stat() calls and no MySQL round trip; a
+    listing sold or edited elsewhere can be served from the old file for at
+    most POLL_INTERVAL plus the refresher's query time, and never once the
+    published stamp is older than STAMP_MAX_AGE.
+    """
+    snap = current_snapshot(path)
+    if snap is None or snap.stamp != published_stamp(path):
+        return None
+    return snap
+
+
+def refresh_if_stale(path=SNAPSHOT_PATH, stamp=None):
+    """Rebuild the snapshot when Properties/Users changed. Only one process writes at a time."""
+    stamp = stamp or version_stamp(CATALOG_TABLES)
+    snap = current_snapshot(path)
+    if stamp is None or (snap is not None and snap.stamp == stamp):
+        return False
+    lock = f"{path}.lock"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock) > LOCK_STALE_AFTER:
+                os.remove(lock)
+        except OSError:
+            pass
+        return False   # another worker is rebuilding; we will remap its file
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        return write_snapshot(path) is not None
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+
+def _poll(path):
+    while True:
+        try:
+            stamp = version_stamp(CATALOG_TABLES)
+            if stamp is not None:
+                publish_stamp(stamp, path)
+            refresh_if_stale(path, stamp)
+            snap = current_snapshot(path)
+            if snap is not None and not snap.touched:
+                snap.touch()
+        except Exception as e:
+            print(f"Error refreshing catalog snapshot: {e}")
+        time.sleep(POLL_INTERVAL)
+
+
+def warm_up(path=SNAPSHOT_PATH):
+    """
+    Start this process's background refresher, which publishes the current
+    version stamp every POLL_INTERVAL, builds the snapshot if no worker has
+    yet, maps it and faults its pages in. Never blocks the calling request:
+    until a fresh file is mapped, reads fall back to SQL. A worker started
+    while another is already refreshing serves its first page from the
+    shared file and sidecar stamp without a MySQL round trip.
+    Safe to call on every script run; only the first call per process does
+    any work.
+    """
+    global _refresher
+    with _current_lock:
+        if _refresher is not None:
+            return
+        _refresher = threading.Thread(target=_poll, args=(path,), name="catalog-snapshot", daemon=True)
+    _refresher.start()
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    stamp = write_snapshot()
+    snap = current_snapshot()
+    if snap is None:
+        sys.exit("Could not build the catalog snapshot.")
+    print(f"Wrote {SNAPSHOT_PATH}: {len(snap.properties['property_id'])} listings, "
+          f"{int(snap.users['is_agent'].sum())} agents, {os.path.getsize(SNAPSHOT_PATH):,} bytes "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms (stamp {stamp})")
@@ -0,0 +1,339 @@
+import hashlib
+import math
+import re
+import sys
+import zlib
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+import pymysql
+from db.admission import admitted, ANALYTICS, WRITE
+from db.connection import create_connection
+from db.sharding import connect_shard, each_shard, shard_for_location, shard_key
+
+# 32 bands x 4 rows: a pair at 0.5 Jaccard shares a bucket ~87% of the time, at 0.6 ~98%
+NUM_PERM = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+DUPLICATE_THRESHOLD = 0.6     # estimated Jaccard to flag a likely duplicate
+PRICE_BAND_WIDTH = 0.10       # log-spaced price bands, ~10% wide
+MAX_PRICE_GAP = 0.15          # candidates further apart in price are different listings
+MAX_BUCKET_SIZE = 50          # larger buckets are only compared against their first member
+SCAN_BATCH = 2000
+
+# Multiply-shift hash family, fixed seed so stored signatures stay comparable
+_rng = np.random.default_rng(20240917)
+_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+_SHIFT = np.uint64(32)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# ------------------------------------------------------------
+# Shingles and MinHash Signatures
+# ------------------------------------------------------------
+def price_band(price):
+    return int(math.log(max(float(price), 1.0)) / math.log1p(PRICE_BAND_WIDTH))
+
+
+def shingles(title, location, price):
+    """
+    Character 3-grams of the title with case, spacing and punctuation
+    removed, plus the location's words and the price band: '2BHK Flat, MG
+    Road' and '2 BHK flat MG road' produce the same set.
+    """
+    text = "".join(_WORD.findall((title or "").lower()))
+    grams = {text[i:i + 3] for i in range(max(len(text) - 2, 1))}
+    grams.update(f"@{w}" for w in _WORD.findall((location or "").lower()))
+    grams.add(f"${price_band(price)}")
+    return grams
+
+
+def signature(grams):
+    """MinHash signature: NUM_PERM uint32 minima of the hashed shingles."""
+    x = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    hashed = (_A[:, None] * x[None, :] + _B[:, None]) >> _SHIFT
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def listing_signature(title, location, price):
+    return signature(shingles(title, location, price))
+
+
+def band_buckets(sig, location):
+    """
+    (band, bucket) LSH keys: each band's rows hashed, together with the
+    city (the shard key), to an unsigned 64-bit bucket. Listings in different
+    cities never share a bucket, so common title templates ('2BHK Apartment
+    near Metro') do not pile every city into the same buckets, while
+    'Pune, Baner' and 'Pune, Baner Road' can still pair up.
+    """
+    rows = sig.reshape(BANDS, ROWS_PER_BAND)
+    salt = shard_key(location).encode("utf-8")
+    return [
+        (band, int.from_bytes(hashlib.blake2b(rows[band].tobytes(), digest_size=8, key=salt[:64]).digest(), "big"))
+        for band in range(BANDS)
+    ]
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity: the fraction of equal minima."""
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+_NUMBER = re.compile(r"\d+")
+
+
+def _compatible(a, b):
+    """
+    Cheap checks a signature match must also pass: prices within
+    MAX_PRICE_GAP and the same numbers in both titles, so '2BHK ... 14 MG
+    Road' never pairs with '3BHK ... 41 MG Road' however similar the text.
+    """
+    pa, pb = float(a["price"]), float(b["price"])
+    if abs(pa - pb) > MAX_PRICE_GAP * max(pa, pb, 1.0):
+        return False
+    na, nb = set(_NUMBER.findall(a["title"] or "")), set(_NUMBER.findall(b["title"] or ""))
+    return not (na and nb) or na == nb
+
+
+# ------------------------------------------------------------
+# LSH Index Tables
+# ------------------------------------------------------------
+def index_listing(cursor, property_id, title, location, price, sig=None):
+    """(Re)write a listing's signature and LSH buckets in the caller's transaction."""
+    sig = listing_signature(title, location, price) if sig is None else sig
+    cursor.execute("""
+        INSERT INTO PropertySignatures (property_id, signature) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE signature = VALUES(signature);
+    """, (property_id, sig.tobytes()))
+    cursor.execute("DELETE FROM PropertyLSH WHERE property_id = %s;", (property_id,))
+    cursor.executemany("INSERT INTO PropertyLSH (band, bucket, property_id) VALUES (%s, %s, %s);",
+                       [(band, bucket, property_id) for band, bucket in band_buckets(sig, location)])
+
+
+def index_listings(cursor, listings, sigs=None):
+    """
+    index_listing() for many rows (dicts with property_id, title, location,
+    price) in SCAN_BATCH statements, in the caller's transaction. Called
+    whenever a listing's title, location or price changes.
+    """
+    if sigs is None:
+        sigs = [listing_signature(r["title"], r["location"], r["price"]) for r in listings]
+    for start in range(0, len(listings), SCAN_BATCH):
+        batch = range(start, min(start + SCAN_BATCH, len(listings)))
+        ids = [listings[i]["property_id"] for i in batch]
+        cursor.executemany("""
+            INSERT INTO PropertySignatures (property_id, signature) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE signature = VALUES(signature);
+        """, [(listings[i]["property_id"], sigs[i].tobytes()) for i in batch])
+        cursor.execute(f"DELETE FROM PropertyLSH WHERE property_id IN ({', '.join(['%s'] * len(ids))});", tuple(ids))
+        cursor.executemany(
+            "INSERT INTO PropertyLSH (band, bucket, property_id) VALUES (%s, %s, %s);",
+            [(band, bucket, listings[i]["property_id"])
+             for i in batch for band, bucket in band_buckets(sigs[i], listings[i]["location"])],
+        )
+
+
+def find_duplicates(cursor, title, location, price, threshold=DUPLICATE_THRESHOLD, exclude_id=None):
+    """
+    Likely duplicates of a (new) listing, best first. One lookup of its
+    BANDS buckets on the PropertyLSH primary key finds the candidates; only
+    those are compared by signature and price.
+    """
+    sig = listing_signature(title, location, price)
+    buckets = band_buckets(sig, location)
+    pairs = ", ".join(["(%s, %s)"] * len(buckets))
+    cursor.execute(f"""
+        SELECT p.property_id, p.title, p.price, p.location, p.status, s.signature
+        FROM (SELECT DISTINCT property_id FROM PropertyLSH WHERE (band, bucket) IN ({pairs})) c
+        JOIN PropertySignatures s ON s.property_id = c.property_id
+        JOIN Properties p ON p.property_id = c.property_id;
+    """, tuple(v for pair in buckets for v in pair))
+    listing = {"title": title, "price": price}
+    matches = []
+    for row in cursor.fetchall():
+        if row["property_id"] == exclude_id or not _compatible(row, listing):
+            continue
+        score = similarity(sig, np.frombuffer(row["signature"], dtype=np.uint32))
+        if score >= threshold:
+            matches.append({k: row[k] for k in ("property_id", "title", "price", "location", "status")}
+                           | {"similarity": round(score, 2)})
+    return sorted(matches, key=lambda m: m["similarity"], reverse=True)
+
+
+@admitted(WRITE)
+def check_duplicates(listings, threshold=DUPLICATE_THRESHOLD):
+    """
+    find_duplicates() for each listing dict (title, location, price) on the
+    shard that will own it; duplicates share a city, hence a shard. One
+    connection per shard. Returns {listing index: matches} for flagged ones.
+    """
+    by_shard = defaultdict(list)
+    for i, listing in enumerate(listings):
+        by_shard[shard_for_location(listing["location"])].append(i)
+    flagged = {}
+    for shard, indexes in by_shard.items():
+        conn = connect_shard(shard)
+        if not conn:
+            continue
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                for i in indexes:
+                    r = listings[i]
+                    matches = find_duplicates(cursor, r["title"], r["location"], r["price"], threshold)
+                    if matches:
+                        flagged[i] = matches
+        finally:
+            conn.close()
+    return flagged
+
+
+@admitted(WRITE)
+def insert_listings(agent_id, listings):
+    """
+    Insert listings (dicts with title, type, price, location and optional
+    building_age/latitude/longitude), grouped by owning shard with one
+    transaction per shard, and index each in the LSH tables as it goes.
+    Returns the inserted listings with their new property_id.
+    """
+    by_shard = defaultdict(list)
+    for listing in listings:
+        by_shard[shard_for_location(listing["location"])].append(listing)
+    inserted = []
+    for shard, rows in by_shard.items():
+        conn = connect_shard(shard)
+        if not conn:
+            raise pymysql.err.OperationalError(f"Could not connect to shard '{shard}'.")
+        try:
+            with conn.cursor() as cursor:
+                for r in rows:
+                    cursor.execute("""
+                        INSERT INTO Properties
+                        (agent_id, title, type, price, location, building_age, status, latitude, longitude)
+                        VALUES (%s, %s, %s, %s, %s, %s, 'Available', %s, %s);
+                    """, (agent_id, r["title"], r["type"], r["price"], r["location"], r.get("building_age"),
+                          r.get("latitude"), r.get("longitude")))
+                    property_id = cursor.lastrowid
+                    index_listing(cursor, property_id, r["title"], r["location"], r["price"])
+                    inserted.append({**r, "property_id": property_id})
+            conn.commit()
+        except pymysql.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return inserted
+
+
+def flag_batch_duplicates(listings, threshold=DUPLICATE_THRESHOLD):
+    """
+    For a bulk import: each row's likely duplicates among the earlier rows
+    of the same batch, through an in-memory LSH table. Returns {row index: [earlier indexes]}.
+    """
+    buckets = defaultdict(list)
+    sigs, flagged = [], {}
+    for i, r in enumerate(listings):
+        sig = listing_signature(r["title"], r["location"], r["price"])
+        sigs.append(sig)
+        candidates = set()
+        for key in band_buckets(sig, r["location"]):
+            candidates.update(buckets[key])
+            buckets[key].append(i)
+        dups = sorted(j for j in candidates
+                      if _compatible(listings[j], r) and similarity(sig, sigs[j]) >= threshold)
+        if dups:
+            flagged[i] = dups
+    return flagged
+
+
+# ------------------------------------------------------------
+# Catalog-Wide Duplicate Clusters
+# ------------------------------------------------------------
+class _DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def find_duplicate_clusters(threshold=DUPLICATE_THRESHOLD, connect=create_connection, refresh_index=True):
+    """
+    Group the whole catalog into clusters of likely duplicates.
+
+    Every listing is signed once and bucketed per band; only listings that
+    share a bucket are compared, so the work is O(n * BANDS + candidate
+    pairs) rather than O(n^2). Verified pairs are joined with union-find.
+    With `refresh_index` the signatures and buckets are also written back,
+    which backfills listings created before the index existed.
+    Returns clusters (lists of property rows, lowest id first), largest first.
+    """
+    conn = connect()
+    if not conn:
+        return []
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("SELECT property_id, title, price, location, status, agent_id FROM Properties;")
+            props = cursor.fetchall()
+        sigs = [listing_signature(p["title"], p["location"], p["price"]) for p in props]
+
+        buckets = defaultdict(list)
+        for i, sig in enumerate(sigs):
+            for key in band_buckets(sig, props[i]["location"]):
+                buckets[key].append(i)
+
+        clusters = _DisjointSet()
+        seen = set()
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) > MAX_BUCKET_SIZE:
+                pairs = ((members[0], j) for j in members[1:])
+            else:
+                pairs = ((members[a], members[b]) for a in range(len(members)) for b in range(a + 1, len(members)))
+            for i, j in pairs:
+                if (i, j) in seen:
+                    continue
+                seen.add((i, j))
+                if _compatible(props[i], props[j]) and similarity(sigs[i], sigs[j]) >= threshold:
+                    clusters.union(i, j)
+
+        if refresh_index:
+            with conn.cursor() as cursor:
+                index_listings(cursor, props, sigs)
+            conn.commit()
+    finally:
+        conn.close()
+
+    groups = defaultdict(list)
+    for i in clusters.parent:
+        groups[clusters.find(i)].append(props[i])
+    result = [sorted(g, key=lambda p: p["property_id"]) for g in groups.values() if len(g) > 1]
+    return sorted(result, key=len, reverse=True)
+
+
+def find_duplicate_clusters_all_shards(threshold=DUPLICATE_THRESHOLD):
+    """Run the scan on every office shard; a city's listings (and their duplicates) share one shard."""
+    per_shard = each_shard(lambda connect: find_duplicate_clusters(threshold, connect), priority=ANALYTICS)
+    return sorted((c for clusters in per_shard.values() for c in clusters), key=len, reverse=True)
+
+
+if __name__ == "__main__":
+    threshold = float(sys.argv[sys.argv.index("--threshold") + 1]) if "--threshold" in sys.argv else DUPLICATE_THRESHOLD
+    found = find_duplicate_clusters_all_shards(threshold)
+    for cluster in found:
+        print(" | ".join(f"#{p['property_id']} {p['title']} ({p['location']}, {Decimal(p['price']):,.0f})" for p in cluster))
+    print(f"{len(found)} duplicate cluster(s), {sum(len(c) for c in found)} listings.")
@@ -0,0 +1,162 @@
+import itertools
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pymysql
+from db.admission import admitted, ANALYTICS, INTERACTIVE
+from db.connection import create_connection
+
+DIGEST_HORIZON_DAYS = 7
+DIGEST_WRITE_BATCH = 200
+ACTIVE_STATUSES = ("Pending", "Confirmed")
+
+
+# ------------------------------------------------------------
+# Streaming Scan
+# ------------------------------------------------------------
+def iter_upcoming_appointments(conn, start, end):
+    """
+    Stream upcoming appointments ordered by (agent_id, datetime) through an
+    unbuffered server-side cursor.
+
+    The WHERE clause is a range on idx_appt_status_datetime, so only the
+    upcoming window is read (never past history), and the sort runs over that
+    window alone.
+    """
+    with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute("""
+            SELECT a.agent_id, a.appointment_id, a.datetime, a.status,
+                   p.title AS property, p.location,
+                   u.name AS client_name, u.phone AS client_phone
+            FROM Appointments a
+            JOIN Properties p ON a.property_id = p.property_id
+            JOIN Users u ON a.user_id = u.user_id
+            WHERE a.status IN (%s, %s)
+              AND a.datetime >= %s AND a.datetime < %s
+            ORDER BY a.agent_id, a.datetime;
+        """, ACTIVE_STATUSES + (start, end))
+        for row in cursor:
+            yield row
+
+
+def iter_agent_schedules(conn, start, end):
+    """Yield (agent_id, [appointments]) one agent at a time."""
+    rows = iter_upcoming_appointments(conn, start, end)
+    for agent_id, group in itertools.groupby(rows, key=lambda r: r["agent_id"]):
+        yield agent_id, [
+            {
+                "appointment_id": r["appointment_id"],
+                "datetime": r["datetime"].isoformat(sep=" "),
+                "status": r["status"],
+                "property": r["property"],
+                "location": r["location"],
+                "client_name": r["client_name"],
+                "client_phone": r["client_phone"],
+            }
+            for r in group
+        ]
+
+
+# ------------------------------------------------------------
+# Digest Writers
+# ------------------------------------------------------------
+def format_digest_text(agent_id, appointments, start, days):
+    lines = [f"Schedule for agent {agent_id}: {start:%Y-%m-%d} + {days} days", ""]
+    for day, items in itertools.groupby(appointments, key=lambda a: a["datetime"][:10]):
+        lines.append(day)
+        for a in items:
+            lines.append(f"  {a['datetime'][11:16]}  {a['property']} ({a['location']}) - "
+                         f"{a['client_name']} {a['client_phone'] or ''} [{a['status']}]")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _flush(write_conn, batch):
+    with write_conn.cursor() as cursor:
+        cursor.executemany("""
+            INSERT INTO AgentScheduleDigest (agent_id, generated_at, horizon_days, appointment_count, digest)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                generated_at = VALUES(generated_at),
+                horizon_days = VALUES(horizon_days),
+                appointment_count = VALUES(appointment_count),
+                digest = VALUES(digest);
+        """, batch)
+    write_conn.commit()
+    batch.clear()
+
+
+@admitted(ANALYTICS)
+def build_schedule_digests(days=DIGEST_HORIZON_DAYS, output_dir=None):
+    """
+    Rebuild every agent's digest for the next `days` days in one pass.
+    Optionally also writes digests/agent_<id>.txt files. Returns agents written.
+    """
+    generated_at = datetime.now().replace(microsecond=0)
+    end = generated_at + timedelta(days=days)
+    read_conn = create_connection()
+    write_conn = create_connection()
+    if not read_conn or not write_conn:
+        for c in (read_conn, write_conn):
+            if c:
+                c.close()
+        return 0
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    written = 0
+    batch = []
+    try:
+        for agent_id, appointments in iter_agent_schedules(read_conn, generated_at, end):
+            batch.append((agent_id, generated_at, days, len(appointments), json.dumps(appointments)))
+            if output_dir:
+                path = os.path.join(output_dir, f"agent_{agent_id}.txt")
+                with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                    f.write(format_digest_text(agent_id, appointments, generated_at, days))
+                os.replace(f"{path}.tmp", path)
+            written += 1
+            if len(batch) >= DIGEST_WRITE_BATCH:
+                _flush(write_conn, batch)
+        if batch:
+            _flush(write_conn, batch)
+        # Agents with nothing upcoming keep no stale digest
+        with write_conn.cursor() as cursor:
+            cursor.execute("DELETE FROM AgentScheduleDigest WHERE generated_at < %s;", (generated_at,))
+        write_conn.commit()
+        return written
+    except pymysql.Error:
+        write_conn.rollback()
+        raise
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+
+# ------------------------------------------------------------
+# Dashboard Read
+# ------------------------------------------------------------
+@admitted(INTERACTIVE, busy=None)
+def fetch_schedule_digest(agent_id):
+    conn = create_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT generated_at, horizon_days, appointment_count, digest
+                FROM AgentScheduleDigest
+                WHERE agent_id = %s;
+            """, (agent_id,))
+            row = cursor.fetchone()
+            if row:
+                row["digest"] = json.loads(row["digest"])
+            return row
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    horizon = int(sys.argv[sys.argv.index("--days") + 1]) if "--days" in sys.argv else DIGEST_HORIZON_DAYS
+    out = sys.argv[sys.argv.index("--out") + 1] if "--out" in sys.argv else None
+    print(f"Wrote {build_schedule_digests(horizon, out)} agent digests for the next {horizon} days.")
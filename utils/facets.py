@@ -0,0 +1,118 @@
+from collections import defaultdict
+
+from utils.leases import BOOKABLE_SQL
+
+# (upper bound exclusive, label); the last bucket has no upper bound
+PRICE_BUCKETS = [
+    (25000, "Under ₹25K"),
+    (100000, "₹25K – ₹1L"),
+    (1000000, "₹1L – ₹10L"),
+    (5000000, "₹10L – ₹50L"),
+    (10000000, "₹50L – ₹1Cr"),
+    (None, "Over ₹1Cr"),
+]
+
+AGE_BUCKETS = [
+    (3, "New (0–2 yrs)"),
+    (11, "3–10 yrs"),
+    (26, "11–25 yrs"),
+    (None, "25+ yrs"),
+]
+
+UNKNOWN_AGE = "Unknown"
+
+FACET_NAMES = ("type", "city", "price_bucket", "age_bucket", "agent_name")
+AGENT_FACET_LIMIT = 8
+
+# Same key as db/sharding.py: 'Bangalore, Whitefield' -> 'bangalore'
+CITY_KEY_SQL = "LOWER(TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1)))"
+
+
+def _bucket_case(column, buckets, null_label=None):
+    parts = ["CASE"]
+    if null_label is not None:
+        parts.append(f"WHEN {column} IS NULL THEN '{null_label}'")
+    for upper, label in buckets:
+        if upper is None:
+            parts.append(f"ELSE '{label}'")
+        else:
+            parts.append(f"WHEN {column} < {upper} THEN '{label}'")
+    parts.append("END")
+    return " ".join(parts)
+
+
+# ------------------------------------------------------------
+# Single Grouped Query
+# ------------------------------------------------------------
+# Rows are grouped by the low-cardinality facet dimensions at once, with each
+# active filter reduced to a 0/1 column. Every facet count (including the
+# "what if I drop this filter" counts) is then a sum over these few
+# combination rows. Cities are grouped on their normalised key rather than the
+# free-text location, and agents are left out: crossing either with the other
+# dimensions multiplies the rows by the number of distinct values.
+FACET_COMBINATIONS_SQL = f"""
+    SELECT p.type,
+           {CITY_KEY_SQL} AS city_key,
+           MIN(TRIM(SUBSTRING_INDEX(COALESCE(p.location, ''), ',', 1))) AS city,
+           {_bucket_case("p.price", PRICE_BUCKETS)} AS price_bucket,
+           {_bucket_case("p.building_age", AGE_BUCKETS, UNKNOWN_AGE)} AS age_bucket,
+           (p.price <= %s) AS within_budget,
+           (p.location LIKE %s) AS location_match,
+           COUNT(*) AS n
+    FROM Properties p
+    WHERE {BOOKABLE_SQL}
+    GROUP BY p.type, city_key, price_bucket, age_bucket, within_budget, location_match;
+"""
+
+# The agent facet has every filter applied, so it is one grouped query over
+# the matching listings, cut to the busiest agents.
+AGENT_FACET_SQL = f"""
+    SELECT u.name AS agent_name, COUNT(*) AS n
+    FROM Properties p
+    JOIN Users u ON p.agent_id = u.user_id
+    WHERE {BOOKABLE_SQL} AND p.type = %s AND p.price <= %s AND p.location LIKE %s
+    GROUP BY p.agent_id, u.name
+    ORDER BY n DESC, u.name
+    LIMIT {AGENT_FACET_LIMIT};
+"""
+
+
+def compute_facets(combinations, prop_type, agents=None):
+    """
+    Turn FACET_COMBINATIONS_SQL rows (and AGENT_FACET_SQL rows) into
+    {facet: [(value, count), ...]}.
+
+    Each facet is counted with every filter applied except its own, so the
+    counts show how many results picking that value instead would return.
+    """
+    counts = {name: defaultdict(int) for name in FACET_NAMES}
+    city_labels = {}
+    for row in combinations or []:
+        type_ok = row["type"] == prop_type
+        budget_ok = bool(row["within_budget"])
+        location_ok = bool(row["location_match"])
+        n = int(row["n"])
+
+        if budget_ok and location_ok:
+            counts["type"][row["type"]] += n
+        if type_ok and budget_ok:
+            # One entry per city key, shown under its first spelling
+            counts["city"][city_labels.setdefault(row["city_key"], row["city"])] += n
+        if type_ok and location_ok:
+            counts["price_bucket"][row["price_bucket"]] += n
+        if type_ok and budget_ok and location_ok:
+            counts["age_bucket"][row["age_bucket"]] += n
+    for row in agents or []:
+        counts["agent_name"][row["agent_name"]] += int(row["n"])
+
+    bucket_order = {
+        "price_bucket": [label for _, label in PRICE_BUCKETS],
+        "age_bucket": [label for _, label in AGE_BUCKETS] + [UNKNOWN_AGE],
+    }
+    facets = {}
+    for name, values in counts.items():
+        if name in bucket_order:
+            facets[name] = [(label, values[label]) for label in bucket_order[name] if values.get(label)]
+        else:
+            facets[name] = sorted(values.items(), key=lambda kv: (-kv[1], str(kv[0])))
+    return facets
@@ -0,0 +1,161 @@
+import math
+
+import pymysql
+from db.admission import admitted, ANALYTICS, INTERACTIVE, WRITE
+from db.connection import create_connection
+
+KM_PER_DEGREE_LAT = 111.32
+
+# Upper bound on rows returned by a geo search, regardless of catalog size
+MAX_GEO_RESULTS = 50
+
+# Must match the ST_GeoHash(..., 9) length the sync triggers store
+GEOHASH_LENGTH = 9
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Most geohash prefixes (B-tree ranges) one search may OR together
+MAX_GEOHASH_CELLS = 9
+
+
+# ------------------------------------------------------------
+# Geometry Helpers
+# ------------------------------------------------------------
+def bounding_box(lat, lng, radius_km):
+    """Return (min_lat, min_lng, max_lat, max_lng) enclosing a circle of radius_km."""
+    d_lat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    d_lng = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return (
+        max(lat - d_lat, -90.0),
+        max(lng - d_lng, -180.0),
+        min(lat + d_lat, 90.0),
+        min(lng + d_lng, 180.0),
+    )
+
+
+def box_to_wkt(min_lat, min_lng, max_lat, max_lng):
+    # geo_point stores POINT(longitude, latitude), so x = lng and y = lat
+    return (
+        f"POLYGON(({min_lng} {min_lat}, {max_lng} {min_lat}, {max_lng} {max_lat}, "
+        f"{min_lng} {max_lat}, {min_lng} {min_lat}))"
+    )
+
+
+def geohash_encode(lat, lng, length=GEOHASH_LENGTH):
+    """Standard base-32 geohash, bit-for-bit what MySQL's ST_GeoHash(lng, lat, length) returns."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < length:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(length):
+    """(lat_degrees, lng_degrees) covered by one geohash cell of this length."""
+    lng_bits = (5 * length + 1) // 2
+    lat_bits = 5 * length // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_prefixes(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_GEOHASH_CELLS):
+    """
+    The longest geohash prefixes whose cells cover the box, at most
+    max_cells of them, so `geohash LIKE 'prefix%'` ranges on idx_prop_geohash
+    select a superset of the listings inside it. Returns [] when even
+    one-character cells would need more than max_cells.
+    """
+    for length in range(GEOHASH_LENGTH, 0, -1):
+        d_lat, d_lng = _cell_size(length)
+        rows = range(int((min_lat + 90) // d_lat), min(int((max_lat + 90) // d_lat), int(180 / d_lat) - 1) + 1)
+        cols = range(int((min_lng + 180) // d_lng), min(int((max_lng + 180) // d_lng), int(360 / d_lng) - 1) + 1)
+        if len(rows) * len(cols) > max_cells:
+            continue
+        # Encode each cell's centre; any point inside it shares the prefix
+        return sorted({
+            geohash_encode(-90 + (i + 0.5) * d_lat, -180 + (j + 0.5) * d_lng, length)
+            for i in rows for j in cols
+        })
+    return []
+
+
+# ------------------------------------------------------------
+# Local Geocoding (CityCoordinates lookup table)
+# ------------------------------------------------------------
+@admitted(INTERACTIVE)
+def lookup_city(city):
+    """Return (latitude, longitude) for a city in the lookup table, or None."""
+    conn = create_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(
+                "SELECT latitude, longitude FROM CityCoordinates WHERE city=%s;",
+                (city.strip(),),
+            )
+            row = cursor.fetchone()
+            return (float(row["latitude"]), float(row["longitude"])) if row else None
+    finally:
+        conn.close()
+
+
+@admitted(WRITE)
+def import_city_coordinates(rows):
+    """
+    Upsert (city, latitude, longitude) rows into the lookup table, skipping
+    rows without a city name or with missing coordinates (pandas reads blank
+    CSV cells as NaN). Returns rows written.
+    """
+    rows = [
+        (c.strip(), float(lat), float(lng)) for c, lat, lng in rows
+        if isinstance(c, str) and c.strip() and math.isfinite(float(lat)) and math.isfinite(float(lng))
+    ]
+    if not rows:
+        return 0
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO CityCoordinates (city, latitude, longitude)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE latitude=VALUES(latitude), longitude=VALUES(longitude);
+            """, rows)
+        conn.commit()
+        return len(rows)
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@admitted(ANALYTICS)
+def geocode_properties():
+    """Fill coordinates for listings without them from the city lookup table."""
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CALL GeocodePropertiesFromCities();")
+            updated = cursor.rowcount
+        conn.commit()
+        return updated
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,255 @@
+import sys
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pymysql
+from db.admission import admitted, INTERACTIVE, WRITE
+from db.connection import create_connection
+from db.sharding import each_shard
+from utils.saved_searches import notify_matches
+
+# Listings a client can act on: anything Available, plus rentals whose current
+# lease is running (they can still be booked from their next free date).
+BOOKABLE_SQL = "(p.status = 'Available' OR (p.type = 'For_Rent' AND p.status = 'Rented'))"
+
+OPEN_ENDED = date(9999, 12, 31)
+
+
+# ------------------------------------------------------------
+# Calendar Arithmetic
+# ------------------------------------------------------------
+def windows_overlap(start_a, end_a, start_b, end_b):
+    """
+    Whether two inclusive date windows share a day; None ends are open-ended.
+    The same predicate book_lease() runs in SQL: start <= new_end AND end >= new_start.
+    """
+    return start_a <= (end_b or OPEN_ENDED) and (end_a or OPEN_ENDED) >= start_b
+
+
+def first_clash(windows, start_date, end_date=None):
+    """The first booked (start, end) window overlapping the requested one, or None."""
+    return next((w for w in windows if windows_overlap(w[0], w[1], start_date, end_date)), None)
+
+
+def available_from(windows, today=None):
+    """
+    First date on or after `today` not covered by any lease. `windows` are
+    (start_date, end_date) pairs sorted by start; end_date is inclusive and
+    None means open-ended. Returns None when an open-ended lease blocks it.
+    """
+    day = today or date.today()
+    for start, end in windows:
+        if start > day:
+            break
+        if end is None:
+            return None
+        if end >= day:
+            day = end + timedelta(days=1)
+    return day
+
+
+# ------------------------------------------------------------
+# Booking (inside the caller's transaction)
+# ------------------------------------------------------------
+def book_lease(cursor, tenant_id, property_id, rent_amount, start_date, end_date=None, today=None):
+    """
+    Insert a lease unless it overlaps another one on the same property, and
+    mark the listing Rented when it starts today. The property row is locked
+    first so two bookings for the same window serialise; the overlap check
+    is then a range scan on idx_rents_property_window that starts at the
+    first lease ending on or after start_date, so past leases are never
+    read. Raises ValueError for
+    a listing that is not bookable or a clashing window. Returns the rent_id.
+    """
+    today = today or date.today()
+    if start_date < today:
+        raise ValueError("Start date cannot be in the past.")
+    if end_date is not None and end_date <= start_date:
+        raise ValueError("End date must be after start date.")
+
+    cursor.execute("SELECT type, status FROM Properties WHERE property_id = %s FOR UPDATE;", (property_id,))
+    prop = cursor.fetchone()
+    if not prop or prop["type"] != "For_Rent" or prop["status"] not in ("Available", "Rented"):
+        raise ValueError("This property is not available for rent.")
+
+    cursor.execute("""
+        SELECT start_date, end_date
+        FROM Rents
+        WHERE property_id = %s AND lease_end >= %s AND start_date <= %s
+        ORDER BY start_date
+        LIMIT 1;
+    """, (property_id, start_date, end_date or OPEN_ENDED))
+    clash = cursor.fetchone()
+    if clash:
+        raise ValueError(f"Already booked {clash['start_date']} → {clash['end_date'] or 'open-ended'}.")
+
+    cursor.execute("""
+        INSERT INTO Rents (tenant_id, property_id, rent_amount, start_date, end_date)
+        VALUES (%s, %s, %s, %s, %s);
+    """, (tenant_id, property_id, rent_amount, start_date, end_date))
+    rent_id = cursor.lastrowid
+    if start_date <= today and prop["status"] != "Rented":
+        cursor.execute("UPDATE Properties SET status = 'Rented' WHERE property_id = %s;", (property_id,))
+    return rent_id
+
+
+def end_current_lease(cursor, property_id, today=None):
+    """
+    Free a rental listing from `today` when an admin puts it back to
+    Available. The lease covering today is ended yesterday, keeping its dues
+    and payments; unpaid instalments after that are dropped. A lease that
+    starts today is cancelled instead, unless payments have already been
+    recorded against it (ValueError). Past leases and future bookings are
+    left alone. Returns the rent_id that was changed, or None.
+    """
+    today = today or date.today()
+    cursor.execute("""
+        SELECT r.rent_id, r.start_date,
+               EXISTS (SELECT 1 FROM RentPayments rp WHERE rp.rent_id = r.rent_id) AS has_payments
+        FROM Rents r
+        WHERE r.property_id = %s AND r.lease_end >= %s AND r.start_date <= %s
+        LIMIT 1
+        FOR UPDATE;
+    """, (property_id, today, today))
+    lease = cursor.fetchone()
+    if not lease:
+        return None
+
+    rent_id = lease["rent_id"]
+    if lease["start_date"] < today:
+        yesterday = today - timedelta(days=1)
+        cursor.execute("UPDATE Rents SET end_date = %s, dues_through = LEAST(dues_through, %s) WHERE rent_id = %s;",
+                       (yesterday, yesterday, rent_id))
+        cursor.execute("DELETE FROM RentDues WHERE rent_id = %s AND due_date > %s AND paid_amount = 0;",
+                       (rent_id, yesterday))
+    elif lease["has_payments"]:
+        raise ValueError("The lease starting today already has payments recorded; it cannot be cancelled.")
+    else:
+        cursor.execute("DELETE FROM Rents WHERE rent_id = %s;", (rent_id,))
+    return rent_id
+
+
+@admitted(WRITE)
+def create_lease(tenant_id, property_id, rent_amount, start_date, end_date=None):
+    """book_lease() in its own transaction. Returns the rent_id."""
+    conn = create_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("Could not connect to the database.")
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            rent_id = book_lease(cursor, tenant_id, property_id, rent_amount, start_date, end_date)
+        conn.commit()
+        return rent_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Calendar Reads
+# ------------------------------------------------------------
+@admitted(INTERACTIVE, busy=dict)
+def fetch_lease_calendars(property_ids, today=None):
+    """
+    Current and future leases per property, {property_id: [(start, end), ...]}
+    sorted by start. One query; each property is a range on
+    idx_rents_property_window.
+    """
+    if not property_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(property_ids))
+    conn = create_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT property_id, start_date, end_date
+                FROM Rents
+                WHERE property_id IN ({placeholders}) AND lease_end >= %s
+                ORDER BY property_id, start_date;
+            """, (*property_ids, today or date.today()))
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+    calendars = defaultdict(list)
+    for r in rows:
+        calendars[r["property_id"]].append((r["start_date"], r["end_date"]))
+    return dict(calendars)
+
+
+# ------------------------------------------------------------
+# Daily Status Refresh
+# ------------------------------------------------------------
+_refreshed_on = None
+_refresh_lock = threading.Lock()
+
+
+def refresh_rental_statuses(connect=create_connection):
+    """
+    Run RefreshRentalStatuses() on one database and match every listing it
+    puts back to Available against saved searches (like a re-listing).
+    Returns rows changed.
+    """
+    conn = connect()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            # Locked so a concurrent refresh cannot report the same listings twice
+            cursor.execute("""
+                SELECT p.property_id, p.type, p.price, p.location, p.title
+                FROM Properties p
+                WHERE p.type = 'For_Rent' AND p.status = 'Rented'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM Rents r
+                      WHERE r.property_id = p.property_id AND r.lease_end >= CURDATE() AND r.start_date <= CURDATE()
+                  )
+                FOR UPDATE;
+            """)
+            freed = cursor.fetchall()
+            cursor.execute("CALL RefreshRentalStatuses();")
+            changed = cursor.rowcount
+        conn.commit()
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    # Saved searches live in the main database, whichever shard the listing is on
+    for p in freed:
+        notify_matches(p["property_id"], p["type"], p["price"], p["location"], p["title"])
+    return changed
+
+
+def _refresh_all_shards():
+    try:
+        each_shard(refresh_rental_statuses, priority=WRITE)
+    except Exception as e:
+        print(f"Error refreshing rental statuses: {e}")
+
+
+def refresh_statuses_if_due(today=None):
+    """
+    Start the day's status refresh in the background the first time this
+    process serves a page on a new day, so leases starting and ending flip
+    their listings without relying on MySQL's event_scheduler. Cheap to call
+    on every script run.
+    """
+    global _refreshed_on
+    today = today or date.today()
+    with _refresh_lock:
+        if _refreshed_on == today:
+            return False
+        _refreshed_on = today
+    threading.Thread(target=_refresh_all_shards, name="rental-status-refresh", daemon=True).start()
+    return True
+
+
+if __name__ == "__main__":
+    if "--refresh" in sys.argv:
+        changed = each_shard(refresh_rental_statuses, priority=WRITE)
+        print(f"Updated {sum(changed.values())} rental status(es) across {len(changed)} shard(s).")
@@ -0,0 +1,420 @@
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pymysql
+from db.admission import admitted, ANALYTICS, WRITE
+from db.connection import create_connection
+from db.sharding import each_shard
+
+DUES_LOOKAHEAD_DAYS = 31     # keep the next upcoming instalment visible
+OVERDUE_GRACE_DAYS = 5
+LEDGER_PAGE_SIZE = 20
+OPEN_ENDED = np.datetime64("9999-12-31")
+
+
+# ------------------------------------------------------------
+# Vectorized Instalment Schedule
+# ------------------------------------------------------------
+def _anniversary(months, day_offset):
+    """Day `day_offset` of each month in `months`, clipped to the month's last day (Jan 31 -> Feb 28)."""
+    first = months.astype("datetime64[D]")
+    days_in_month = ((months + 1).astype("datetime64[D]") - first).astype(np.int64)
+    return first + np.minimum(day_offset, days_in_month - 1)
+
+
+def instalment_schedule(rent_ids, starts, ends, amounts, through, after=None):
+    """
+    Expand every lease into its monthly instalments due on or before `through`
+    (and, per lease, after the date in `after` when one is given).
+
+    Instalments fall on the lease's monthly anniversary; a final partial
+    period is prorated by days. All leases are expanded together with array
+    arithmetic, starting at each lease's first missing month rather than its
+    start date. Returns (rent_id, due_date, period_end, amount) tuples.
+    """
+    if not len(rent_ids):
+        return []
+    rent_ids = np.asarray(rent_ids, dtype=np.int64)
+    starts = np.asarray(starts, dtype="datetime64[D]")
+    ends = np.array([OPEN_ENDED if e is None else np.datetime64(e, "D") for e in ends], dtype="datetime64[D]")
+    paise = np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+    last = np.minimum(ends, np.datetime64(through, "D"))
+    after = (np.full(len(rent_ids), np.datetime64("NaT", "D")) if after is None else
+             np.array([np.datetime64("NaT") if a is None else np.datetime64(a, "D") for a in after],
+                      dtype="datetime64[D]"))
+
+    start_months = starts.astype("datetime64[M]")
+    day_offset = (starts - start_months.astype("datetime64[D]")).astype(np.int64)
+    # The instalment due after `after` is in after's month or the next one
+    skip = np.where(np.isnat(after), 0, (after.astype("datetime64[M]") - start_months).astype(np.int64))
+    skip = np.maximum(skip, 0)
+    counts = np.maximum((last.astype("datetime64[M]") - start_months).astype(np.int64) + 1 - skip, 0)
+
+    lease = np.repeat(np.arange(len(rent_ids)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + skip[lease]
+    months = start_months[lease] + k
+    due = _anniversary(months, day_offset[lease])
+    next_due = _anniversary(months + 1, day_offset[lease])
+    keep = (due <= last[lease]) & (np.isnat(after[lease]) | (due > after[lease]))
+
+    lease, due, next_due = lease[keep], due[keep], next_due[keep]
+    period_end = np.minimum(next_due - 1, ends[lease])
+    full_days = (next_due - due).astype(np.int64)
+    days = (period_end - due).astype(np.int64) + 1
+    due_paise = np.rint(paise[lease] * days / full_days).astype(np.int64)
+
+    return [
+        (rid, d, e, Decimal(p) / 100)
+        for rid, d, e, p in zip(rent_ids[lease].tolist(), due.tolist(), period_end.tolist(), due_paise.tolist())
+    ]
+
+
+def _pending_dues(cursor, through, rent_ids=None):
+    """
+    Leases whose schedule is not generated up to `through`, and their missing
+    instalments (those after dues_through). Returns (leases, dues).
+    """
+    id_filter, params = "", (through, through)
+    if rent_ids is not None:
+        id_filter = f"AND rent_id IN ({', '.join(['%s'] * len(rent_ids))})"
+        params += tuple(rent_ids)
+    cursor.execute(f"""
+        SELECT rent_id, rent_amount, start_date, end_date, dues_through
+        FROM Rents
+        WHERE (dues_through IS NULL OR dues_through < %s)
+          AND (end_date IS NULL OR dues_through IS NULL OR dues_through < end_date)
+          AND start_date <= %s
+          {id_filter};
+    """, params)
+    leases = cursor.fetchall()
+    dues = instalment_schedule(
+        [r["rent_id"] for r in leases], [r["start_date"] for r in leases],
+        [r["end_date"] for r in leases], [r["rent_amount"] for r in leases], through,
+        [r["dues_through"] for r in leases],
+    )
+    return leases, dues
+
+
+def ensure_dues(cursor, through=None, rent_ids=None):
+    """
+    Materialise instalments up to `through` (default: today plus the
+    lookahead) for leases whose schedule is not generated that far yet,
+    continuing from each lease's dues_through. Runs in the caller's
+    transaction; returns the number of new instalments. Called on payment
+    and by the daily catch-up (`python -m utils.ledger --catch-up`), never
+    from page reads.
+    """
+    through = through or date.today() + timedelta(days=DUES_LOOKAHEAD_DAYS)
+    if rent_ids is not None and not rent_ids:
+        return 0
+    leases, dues = _pending_dues(cursor, through, rent_ids)
+    if not leases:
+        return 0
+    created = 0
+    if dues:
+        created = cursor.executemany("""
+            INSERT IGNORE INTO RentDues (rent_id, due_date, period_end, amount)
+            VALUES (%s, %s, %s, %s);
+        """, dues)
+    placeholders = ", ".join(["%s"] * len(leases))
+    cursor.execute(f"UPDATE Rents SET dues_through = %s WHERE rent_id IN ({placeholders});",
+                   (through,) + tuple(r["rent_id"] for r in leases))
+    return created or 0
+
+
+def catch_up_dues(connect=create_connection):
+    """ensure_dues() for every lease on one database in its own transaction. Returns instalments created."""
+    conn = connect()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            created = ensure_dues(cursor)
+        conn.commit()
+        return created
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _open_dues(cursor, through, rent_ids=None):
+    """
+    Instalments not materialised yet (computed in memory, unpaid) for every
+    lease or just `rent_ids`, so reads are current without writing anything.
+    """
+    if rent_ids is not None and not rent_ids:
+        return []
+    _, pending = _pending_dues(cursor, through, rent_ids)
+    return [
+        {"rent_id": rid, "due_date": d, "period_end": e, "amount": a, "paid_amount": Decimal(0)}
+        for rid, d, e, a in pending
+    ]
+
+
+# ------------------------------------------------------------
+# Vectorized Balances
+# ------------------------------------------------------------
+def ledger_balances(dues, today=None, grace_days=OVERDUE_GRACE_DAYS):
+    """
+    Outstanding and overdue balances per lease from unpaid instalment rows
+    (rent_id, due_date, amount, paid_amount), aggregated in one array pass.
+    Returns {rent_id: {...}}.
+    """
+    if not dues:
+        return {}
+    today = np.datetime64(today or date.today(), "D")
+    rent_ids = np.array([d["rent_id"] for d in dues], dtype=np.int64)
+    due = np.array([d["due_date"] for d in dues], dtype="datetime64[D]")
+    owed = (np.rint(np.array([d["amount"] for d in dues], dtype=np.float64) * 100)
+            - np.rint(np.array([d["paid_amount"] for d in dues], dtype=np.float64) * 100)).astype(np.int64)
+
+    days_late = (today - due).astype(np.int64)
+    is_due = (days_late >= 0) & (owed > 0)
+    is_overdue = (days_late > grace_days) & (owed > 0)
+    is_upcoming = (days_late < 0) & (owed > 0)
+
+    leases, inverse = np.unique(rent_ids, return_inverse=True)
+    n = len(leases)
+    outstanding = np.bincount(inverse, weights=owed * is_due, minlength=n)
+    overdue = np.bincount(inverse, weights=owed * is_overdue, minlength=n)
+    overdue_count = np.bincount(inverse, weights=is_overdue, minlength=n)
+    max_late = np.zeros(n, dtype=np.int64)
+    np.maximum.at(max_late, inverse[is_overdue], days_late[is_overdue])
+    next_due = np.full(n, OPEN_ENDED)
+    np.minimum.at(next_due, inverse[is_upcoming], due[is_upcoming])
+
+    return {
+        rid: {
+            "outstanding": Decimal(int(o)) / 100,
+            "overdue": Decimal(int(v)) / 100,
+            "overdue_instalments": int(c),
+            "days_overdue": int(m),
+            "next_due": None if nd == OPEN_ENDED else nd.astype(object),
+        }
+        for rid, o, v, c, m, nd in zip(leases.tolist(), outstanding, overdue, overdue_count, max_late, next_due)
+    }
+
+
+# Materialised instalments a lease is overdue on; the daily catch-up keeps
+# DUES_LOOKAHEAD_DAYS ahead of today, so every overdue instalment is stored
+OVERDUE_SQL = """EXISTS (
+    SELECT 1 FROM RentDues d
+    WHERE d.rent_id = r.rent_id AND d.paid_amount < d.amount AND d.due_date < %s
+)"""
+
+
+@admitted(ANALYTICS)
+def fetch_rent_ledger(page=0, overdue_only=False, today=None, page_size=LEDGER_PAGE_SIZE):
+    """
+    One page of leases (newest first) with tenant, paid-to-date and
+    vectorized outstanding/overdue balances, plus the number of leases.
+    Only the page's instalments are read, and missing ones are computed for
+    the page's leases alone. Returns (leases, total).
+    """
+    today = today or date.today()
+    where, params = "", ()
+    if overdue_only:
+        where, params = f"WHERE {OVERDUE_SQL}", (today - timedelta(days=OVERDUE_GRACE_DAYS),)
+    conn = create_connection()
+    if not conn:
+        return [], 0
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"SELECT COUNT(*) AS n FROM Rents r {where};", params)
+            total = cursor.fetchone()["n"]
+            cursor.execute(f"""
+                SELECT r.rent_id, r.property_id, p.title, u.name AS tenant, u.phone AS tenant_phone,
+                       r.rent_amount, r.start_date, r.end_date,
+                       (SELECT COALESCE(SUM(pay.amount), 0) FROM RentPayments pay
+                        WHERE pay.rent_id = r.rent_id) AS paid_to_date
+                FROM Rents r
+                JOIN Properties p ON r.property_id = p.property_id
+                JOIN Users u ON r.tenant_id = u.user_id
+                {where}
+                ORDER BY r.start_date DESC, r.rent_id DESC
+                LIMIT %s OFFSET %s;
+            """, params + (page_size, page * page_size))
+            leases = cursor.fetchall()
+            rent_ids = [l["rent_id"] for l in leases]
+            dues = []
+            if rent_ids:
+                placeholders = ", ".join(["%s"] * len(rent_ids))
+                cursor.execute(f"""
+                    SELECT rent_id, due_date, amount, paid_amount
+                    FROM RentDues
+                    WHERE rent_id IN ({placeholders}) AND paid_amount < amount;
+                """, tuple(rent_ids))
+                dues = list(cursor.fetchall()) + _open_dues(
+                    cursor, today + timedelta(days=DUES_LOOKAHEAD_DAYS), rent_ids)
+            balances = ledger_balances(dues, today)
+        empty = {"outstanding": Decimal(0), "overdue": Decimal(0), "overdue_instalments": 0,
+                 "days_overdue": 0, "next_due": None}
+        for lease in leases:
+            lease.update(balances.get(lease["rent_id"], empty))
+        return leases, total
+    finally:
+        conn.close()
+
+
+@admitted(ANALYTICS)
+def fetch_ledger_totals(today=None):
+    """
+    Outstanding and overdue totals and leases in arrears across every lease,
+    summed in SQL over the stored instalments (see OVERDUE_SQL).
+    """
+    today = today or date.today()
+    conn = create_connection()
+    if not conn:
+        return {"outstanding": Decimal(0), "overdue": Decimal(0), "leases_in_arrears": 0}
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(CASE WHEN due_date <= %s THEN amount - paid_amount END), 0) AS outstanding,
+                       COALESCE(SUM(CASE WHEN due_date < %s THEN amount - paid_amount END), 0) AS overdue,
+                       COUNT(DISTINCT CASE WHEN due_date < %s THEN rent_id END) AS leases_in_arrears
+                FROM RentDues
+                WHERE paid_amount < amount;
+            """, (today, *[today - timedelta(days=OVERDUE_GRACE_DAYS)] * 2))
+            return cursor.fetchone()
+    finally:
+        conn.close()
+
+
+@admitted(ANALYTICS, busy=list)
+def fetch_lease_dues(rent_id):
+    conn = create_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT due_id, due_date, period_end, amount, paid_amount
+                FROM RentDues
+                WHERE rent_id = %s
+                ORDER BY due_date;
+            """, (rent_id,))
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Payments
+# ------------------------------------------------------------
+def allocate_payment(open_dues, amount):
+    """
+    Split a payment over unpaid instalments (due_id, owed) given oldest
+    first. Returns [(due_id, applied)]; raises ValueError if it exceeds the
+    total owed.
+    """
+    total_owed = sum((d["owed"] for d in open_dues), Decimal(0))
+    if amount > total_owed:
+        raise ValueError(f"Payment exceeds the amount currently due (₹{total_owed:,}).")
+    allocations, remaining = [], amount
+    for d in open_dues:
+        if remaining <= 0:
+            break
+        applied = min(remaining, d["owed"])
+        allocations.append((d["due_id"], applied))
+        remaining -= applied
+    return allocations
+
+
+@admitted(WRITE)
+def record_rent_payment(rent_id, amount, paid_on=None, recorded_by=None):
+    """
+    Record a payment and allocate it to the lease's oldest unpaid instalments.
+    Raises ValueError if it exceeds what is currently due (including the next
+    upcoming instalment). Returns the new payment_id.
+    """
+    amount = Decimal(str(amount)).quantize(Decimal("0.01"))
+    if amount <= 0:
+        raise ValueError("Payment amount must be positive.")
+    conn = create_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("Could not connect to the database.")
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            ensure_dues(cursor, rent_ids=[rent_id])
+            cursor.execute("""
+                SELECT due_id, amount - paid_amount AS owed
+                FROM RentDues
+                WHERE rent_id = %s AND paid_amount < amount
+                ORDER BY due_date
+                FOR UPDATE;
+            """, (rent_id,))
+            allocations = allocate_payment(cursor.fetchall(), amount)
+
+            cursor.execute("""
+                INSERT INTO RentPayments (rent_id, amount, paid_on, recorded_by)
+                VALUES (%s, %s, %s, %s);
+            """, (rent_id, amount, paid_on or date.today(), recorded_by))
+            payment_id = cursor.lastrowid
+            cursor.executemany("UPDATE RentDues SET paid_amount = paid_amount + %s WHERE due_id = %s;",
+                               [(applied, due_id) for due_id, applied in allocations])
+        conn.commit()
+        return payment_id
+    except (pymysql.Error, ValueError):
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Accrual Revenue
+# ------------------------------------------------------------
+@admitted(ANALYTICS)
+def monthly_rental_income(today=None, connect=create_connection):
+    """
+    Accrual rental income by calendar month: each instalment that has fallen
+    due is spread over the days of its period up to today, so a period
+    straddling a month boundary is split between the two months and the
+    unelapsed days of a current period are not counted yet.
+    Returns {'YYYY-MM': Decimal}.
+    """
+    today = today or date.today()
+    conn = connect()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT due_date, period_end, amount
+                FROM RentDues
+                WHERE due_date <= %s;
+            """, (today,))
+            rows = list(cursor.fetchall()) + _open_dues(cursor, today)
+    finally:
+        conn.close()
+    if not rows:
+        return {}
+
+    start = np.array([r["due_date"] for r in rows], dtype="datetime64[D]")
+    period_end = np.array([r["period_end"] for r in rows], dtype="datetime64[D]")
+    full_days = (period_end - start).astype(np.int64) + 1
+    end = np.minimum(period_end, np.datetime64(today, "D"))
+    days = (end - start).astype(np.int64) + 1
+    paise = np.rint(np.array([r["amount"] for r in rows], dtype=np.float64) * 100 * days / full_days)
+    # A period is at most one month long, so it touches at most two calendar months
+    first_month = start.astype("datetime64[M]")
+    boundary = (first_month + 1).astype("datetime64[D]")
+    first_days = np.minimum((boundary - start).astype(np.int64), days)
+    first_share = np.rint(paise * first_days / days).astype(np.int64)
+    second_share = paise.astype(np.int64) - first_share
+
+    months = np.concatenate([first_month, first_month + 1])
+    shares = np.concatenate([first_share, second_share])
+    keys, inverse = np.unique(months, return_inverse=True)
+    totals = np.bincount(inverse, weights=shares)
+    return {str(m): Decimal(int(t)) / 100 for m, t in zip(keys, totals) if t}
+
+
+if __name__ == "__main__":
+    if "--catch-up" in sys.argv:
+        created = each_shard(catch_up_dues, priority=WRITE)
+        print(f"Generated {sum(created.values())} instalment(s) across {len(created)} shard(s).")
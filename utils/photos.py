@@ -0,0 +1,218 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+from PIL import Image, ImageOps
+from db.admission import admitted, INTERACTIVE, WRITE
+from db.connection import create_connection
+
+MEDIA_ROOT = os.environ.get("REALESTATE_MEDIA_ROOT", os.path.join(os.path.dirname(os.path.dirname(__file__)), "media"))
+ORIGINALS_DIR = os.path.join(MEDIA_ROOT, "originals")
+THUMBS_DIR = os.path.join(MEDIA_ROOT, "thumbs")
+PLACEHOLDER_IMAGE = "house.jpg"
+
+THUMB_SIZE = (240, 180)
+THUMB_QUALITY = 82
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+THUMB_WORKERS = 2
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+_thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix="thumbs")
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+# ------------------------------------------------------------
+# Bounded LRU Byte Cache
+# ------------------------------------------------------------
+class ByteCache:
+    """LRU cache of encoded image bytes, bounded by total size rather than entry count."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+thumb_cache = ByteCache(CACHE_MAX_BYTES)
+
+
+# ------------------------------------------------------------
+# Content-Addressed Storage
+# ------------------------------------------------------------
+def _original_path(digest):
+    return os.path.join(ORIGINALS_DIR, digest[:2], digest)
+
+
+def _thumb_path(digest):
+    return os.path.join(THUMBS_DIR, digest[:2], f"{digest}.jpg")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _make_thumbnail(digest):
+    path = _thumb_path(digest)
+    try:
+        if not os.path.exists(path):
+            with Image.open(_original_path(digest)) as img:
+                img.draft("RGB", (THUMB_SIZE[0] * 2, THUMB_SIZE[1] * 2))  # cheap JPEG downscale on decode
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                img.thumbnail(THUMB_SIZE)
+                out = io.BytesIO()
+                img.save(out, format="JPEG", quality=THUMB_QUALITY, optimize=True)
+            _write_atomic(path, out.getvalue())
+        return path
+    finally:
+        with _pending_lock:
+            _pending.pop(digest, None)
+
+
+def schedule_thumbnail(digest):
+    """Queue thumbnail generation on the worker pool (at most once per digest)."""
+    with _pending_lock:
+        if digest in _pending:
+            return _pending[digest]
+        future = _thumb_pool.submit(_make_thumbnail, digest)
+        _pending[digest] = future
+        return future
+
+
+@admitted(WRITE)
+def save_photo(property_id, data, make_primary=False):
+    """Store an uploaded image and link it to a property. Returns the content digest."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError("Image is larger than 15 MB.")
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+    except Exception as e:
+        raise ValueError(f"Not a valid image: {e}")
+
+    digest = hashlib.sha256(data).hexdigest()
+    if not os.path.exists(_original_path(digest)):
+        _write_atomic(_original_path(digest), data)
+
+    conn = create_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("Could not connect to the database.")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n FROM PropertyPhotos WHERE property_id=%s;", (property_id,))
+            has_photos = cursor.fetchone()["n"] > 0
+            primary = make_primary or not has_photos
+            if primary:
+                cursor.execute("UPDATE PropertyPhotos SET is_primary=0 WHERE property_id=%s;", (property_id,))
+            cursor.execute("""
+                INSERT INTO PropertyPhotos (property_id, sha256, is_primary)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE is_primary = GREATEST(is_primary, VALUES(is_primary));
+            """, (property_id, digest, int(primary)))
+        conn.commit()
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    schedule_thumbnail(digest)
+    return digest
+
+
+# ------------------------------------------------------------
+# Serving
+# ------------------------------------------------------------
+@admitted(INTERACTIVE, busy=dict)
+def fetch_primary_photos(property_ids):
+    """Return {property_id: sha256} for the primary photo of each listing, in one query."""
+    property_ids = list(dict.fromkeys(property_ids))
+    if not property_ids:
+        return {}
+    conn = create_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT property_id, sha256
+                FROM PropertyPhotos
+                WHERE is_primary = 1 AND property_id IN ({', '.join(['%s'] * len(property_ids))});
+            """, tuple(property_ids))
+            return {row["property_id"]: row["sha256"] for row in cursor.fetchall()}
+    except pymysql.Error as e:
+        print(f"Error fetching photos: {e}")
+        return {}
+    finally:
+        conn.close()
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def placeholder_bytes():
+    data = thumb_cache.get(PLACEHOLDER_IMAGE)
+    if data is None and os.path.exists(PLACEHOLDER_IMAGE):
+        data = _read_file(PLACEHOLDER_IMAGE)
+        thumb_cache.put(PLACEHOLDER_IMAGE, data)
+    return data
+
+
+def thumbnail_bytes(digest):
+    """
+    Encoded thumbnail for `digest`, or the placeholder while the worker pool is
+    still producing it. Never decodes the original on the calling thread.
+    """
+    if not digest:
+        return placeholder_bytes()
+    data = thumb_cache.get(digest)
+    if data is not None:
+        return data
+    path = _thumb_path(digest)
+    if os.path.exists(path):
+        data = _read_file(path)
+        thumb_cache.put(digest, data)
+        return data
+    if os.path.exists(_original_path(digest)):
+        schedule_thumbnail(digest)
+    return placeholder_bytes()
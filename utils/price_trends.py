@@ -0,0 +1,169 @@
+import sys
+from collections import defaultdict
+from datetime import date
+
+import pymysql
+from db.admission import admitted, INTERACTIVE
+from db.connection import create_connection
+from db.sharding import each_shard, shard_for_location
+
+# Must match RecordPricePoint in func_trig_proc.sql: bucket = FLOOR(LN(price) / LN(1.02))
+BUCKET_RATIO = 1.02
+DEFAULT_MONTHS = 12
+KINDS = ("Asking", "Transaction")
+
+
+def city_of(location):
+    """City part of a location, as the triggers store it: 'Bangalore, Whitefield' -> 'Bangalore'."""
+    return (location or "").split(",")[0].strip()
+
+
+def bucket_price(bucket):
+    """Geometric midpoint of a log bucket, so a median read from buckets is within ~1%."""
+    return BUCKET_RATIO ** (bucket + 0.5)
+
+
+def _first_month(months, today=None):
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# ------------------------------------------------------------
+# Rollup Reads (never touch PriceHistory)
+# ------------------------------------------------------------
+def _fetch_rollups(connect, city, prop_type, since):
+    """Rollup and bucket rows for one shard: a PK range scan with a city, idx_price_*_month without."""
+    conn = connect()
+    if not conn:
+        return [], []
+    where = "type = %s AND month >= %s" + (" AND city = %s" if city else "")
+    params = (prop_type, since) + ((city,) if city else ())
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"SELECT kind, month, samples, total FROM PriceRollups WHERE {where};", params)
+            rollups = cursor.fetchall()
+            cursor.execute(f"SELECT kind, month, bucket, samples FROM PriceRollupBuckets WHERE {where};", params)
+            buckets = cursor.fetchall()
+        return rollups, buckets
+    finally:
+        conn.close()
+
+
+def _median(buckets, samples):
+    """Walk the cumulative bucket counts up to the middle sample."""
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen * 2 >= samples:
+            return bucket_price(bucket)
+    return None
+
+
+def merge_trends(results):
+    """
+    Combine per-shard (rollups, buckets) into one trend: samples, totals and
+    bucket counts add up, so cities split across shards (or no city filter)
+    still give an exact average and a bucket-accurate median.
+    """
+    totals = defaultdict(lambda: [0, 0.0])
+    buckets = defaultdict(lambda: defaultdict(int))
+    for rollups, bucket_rows in results:
+        for r in rollups:
+            entry = totals[(r["kind"], r["month"])]
+            entry[0] += r["samples"]
+            entry[1] += float(r["total"])
+        for b in bucket_rows:
+            buckets[(b["kind"], b["month"])][b["bucket"]] += b["samples"]
+
+    trend = []
+    for (kind, month), (samples, total) in sorted(totals.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        if not samples:
+            continue
+        trend.append({
+            "month": month.strftime("%Y-%m"),
+            "kind": kind,
+            "samples": samples,
+            "average": total / samples,
+            "median": _median(buckets[(kind, month)], samples),
+        })
+    return trend
+
+
+def fetch_price_trends(city=None, prop_type="For_Sale", months=DEFAULT_MONTHS, today=None):
+    """
+    Monthly median/average asking and transaction prices for `city` (all
+    cities when None) and `prop_type` over the last `months` months. Returns
+    [{'month', 'kind', 'samples', 'average', 'median'}] ordered by month.
+
+    Only the rollup rows are read: a city lives on one shard, and without a
+    city every shard is read concurrently and merged.
+    """
+    since = _first_month(months, today)
+    city = city_of(city) or None
+    if city:
+        shard = shard_for_location(city)
+        results = each_shard(lambda connect: _fetch_rollups(connect, city, prop_type, since), [shard]).values()
+    else:
+        results = each_shard(lambda connect: _fetch_rollups(connect, None, prop_type, since)).values()
+    return merge_trends(results)
+
+
+def fetch_trend_cities():
+    """Cities that have any rollup rows, for the Insights selector."""
+    def cities(connect):
+        conn = connect()
+        if not conn:
+            return set()
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute("SELECT DISTINCT city FROM PriceRollups WHERE city <> '';")
+                return {r["city"] for r in cursor.fetchall()}
+        finally:
+            conn.close()
+    return sorted(set().union(*each_shard(cities).values()), key=str.lower)
+
+
+@admitted(INTERACTIVE, busy=list)
+def fetch_property_price_history(property_id, connect=create_connection):
+    """Every asking price of one listing, oldest first (idx_price_history_property)."""
+    conn = connect()
+    if not conn:
+        return []
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("""
+                SELECT old_price, new_price, changed_at
+                FROM PriceHistory
+                WHERE property_id = %s
+                ORDER BY changed_at, history_id;
+            """, (property_id,))
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Backfill / Repair
+# ------------------------------------------------------------
+def rebuild_price_rollups(connect=create_connection):
+    """Run RebuildPriceRollups() on one database (first install, or after bulk loads with triggers off)."""
+    conn = connect()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CALL RebuildPriceRollups();")
+        conn.commit()
+        return True
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv:
+        rebuilt = each_shard(rebuild_price_rollups)
+        print(f"Rebuilt price rollups on {sum(rebuilt.values())} of {len(rebuilt)} shard(s).")
@@ -0,0 +1,127 @@
+from decimal import Decimal
+
+import numpy as np
+import pymysql
+from db.bulk import bulk_update_column
+from db.admission import admitted, WRITE
+from db.connection import create_connection
+from utils.dedup import index_listings
+
+# Mirrors trg_BeforePropertyUpdate_CheckPriceDrop: NEW.price >= OLD.price * 0.90
+MAX_DROP_NUMERATOR, MAX_DROP_DENOMINATOR = 9, 10
+
+
+# ------------------------------------------------------------
+# Vectorized Validation
+# ------------------------------------------------------------
+class RepricePlan:
+    """Old/new prices (integer paise) and the trigger's verdict for each listing."""
+
+    def __init__(self, property_ids, prices, percent=0.0, delta=0.0):
+        self.ids = np.asarray(property_ids, dtype=np.int64)
+        # Prices are handled as integer paise so the 10% rule is checked exactly
+        # (10 * new >= 9 * old) rather than with float rounding at the boundary.
+        self.old = np.rint(np.asarray(prices, dtype=np.float64) * 100).astype(np.int64)
+        self.new = np.rint(self.old * (1.0 + percent / 100.0) + delta * 100).astype(np.int64)
+        self.too_steep = self.new * MAX_DROP_DENOMINATOR < self.old * MAX_DROP_NUMERATOR
+        self.not_positive = self.new <= 0
+        self.ok = ~(self.too_steep | self.not_positive)
+
+    @property
+    def accepted_count(self):
+        return int(self.ok.sum())
+
+    @property
+    def rejected_count(self):
+        return len(self.ids) - self.accepted_count
+
+    def changed_pairs(self):
+        """(property_id, new_price) for accepted rows whose price actually changes."""
+        mask = self.ok & (self.new != self.old)
+        return [(pid, Decimal(n) / 100) for pid, n in zip(self.ids[mask].tolist(), self.new[mask].tolist())]
+
+    def rows(self, accepted=True):
+        mask = self.ok if accepted else ~self.ok
+        out = []
+        for pid, o, n, steep in zip(self.ids[mask].tolist(), self.old[mask].tolist(),
+                                    self.new[mask].tolist(), self.too_steep[mask].tolist()):
+            row = {"property_id": pid, "old_price": Decimal(o) / 100, "new_price": Decimal(n) / 100}
+            if not accepted:
+                row["reason"] = "Drop exceeds 10%" if steep else "Price must stay positive"
+            out.append(row)
+        return out
+
+
+def plan_repricing(property_ids, prices, percent=0.0, delta=0.0):
+    """Validate a whole portfolio's price change against the 10% drop rule in one vectorized pass."""
+    return RepricePlan(property_ids, prices, percent, delta)
+
+
+# ------------------------------------------------------------
+# Bulk Repricing
+# ------------------------------------------------------------
+@admitted(WRITE)
+def bulk_reprice(agent_id=None, prop_type=None, location=None, status=None,
+                 percent=0.0, delta=0.0, dry_run=False, commit=True):
+    """
+    Reprice every listing matching the filters in one transaction.
+
+    Matching rows are locked with SELECT ... FOR UPDATE, validated together
+    against the 10% drop rule, and the accepted ones are written with a single
+    set-based UPDATE, so the trigger never aborts the batch. Returns
+    (accepted, rejected); with dry_run nothing is written.
+    """
+    clauses, params = [], []
+    if agent_id is not None:
+        clauses.append("agent_id = %s")
+        params.append(agent_id)
+    if prop_type:
+        clauses.append("type = %s")
+        params.append(prop_type)
+    if location:
+        clauses.append("location LIKE %s")
+        params.append(f"%{location}%")
+    if status:
+        clauses.append("status = %s")
+        params.append(status)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = create_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("Could not connect to the database.")
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            lock = "" if dry_run else "FOR UPDATE"
+            cursor.execute(f"SELECT property_id, title, price, location FROM Properties {where} ORDER BY property_id {lock};", tuple(params))
+            portfolio = cursor.fetchall()
+            if not portfolio:
+                conn.rollback()
+                return [], []
+
+            plan = plan_repricing(
+                [p["property_id"] for p in portfolio], [p["price"] for p in portfolio], percent, delta
+            )
+            accepted, rejected = plan.rows(accepted=True), plan.rows(accepted=False)
+            titles = {p["property_id"]: p["title"] for p in portfolio}
+            for row in accepted + rejected:
+                row["title"] = titles[row["property_id"]]
+
+            changed = plan.changed_pairs()
+            if dry_run or not changed:
+                conn.rollback()
+                return accepted, rejected
+
+            bulk_update_column(cursor, "Properties", "property_id", "price", "DECIMAL(12,2)", changed)
+            # The price band is part of each listing's duplicate signature
+            by_id = {p["property_id"]: p for p in portfolio}
+            index_listings(cursor, [{**by_id[pid], "price": price} for pid, price in changed])
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        return accepted, rejected
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
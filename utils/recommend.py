@@ -0,0 +1,249 @@
+import sys
+import time
+
+import numpy as np
+import pymysql
+from db.admission import admitted, ANALYTICS, INTERACTIVE
+from db.connection import create_connection
+
+TOP_K = 5
+
+# Pairwise distances are computed BLOCK_CELLS at a time (float32), so memory
+# stays bounded however large the catalog gets.
+BLOCK_CELLS = 4_000_000
+
+# Fall back to a full rebuild when more than this share of listings changed
+FULL_REFRESH_RATIO = 0.3
+
+# Feature weights. Numeric features use fixed scales (not catalog statistics)
+# so stored distances stay comparable across incremental refreshes.
+PRICE_WEIGHT = 2.0      # per 10x difference in price
+AGE_WEIGHT = 0.5        # per 10 years of building age
+RATING_WEIGHT = 1.0     # per 5 rating points
+TYPE_MISMATCH = 4.0     # For_Sale vs For_Rent
+CITY_MISMATCH = 1.5
+
+DEFAULT_RATING = 3.0
+DEFAULT_BUILDING_AGE = 10.0   # years; fixed like the scales above, not a catalog median
+
+
+# ------------------------------------------------------------
+# Feature Encoding
+# ------------------------------------------------------------
+def fetch_feature_rows(cursor):
+    cursor.execute("""
+        SELECT p.property_id, p.price, p.type, p.location, p.building_age, p.status,
+               ar.avg_rating
+        FROM Properties p
+        LEFT JOIN (
+            SELECT agent_id, AVG(rating) AS avg_rating
+            FROM Reviews
+            GROUP BY agent_id
+        ) ar ON ar.agent_id = p.agent_id
+        ORDER BY p.property_id;
+    """)
+    return cursor.fetchall()
+
+
+class FeatureMatrix:
+    """Numeric features plus integer codes for the categorical ones."""
+
+    def __init__(self, rows):
+        n = len(rows)
+        self.ids = np.fromiter((r["property_id"] for r in rows), dtype=np.int64, count=n)
+        price = np.fromiter((float(r["price"] or 1) for r in rows), dtype=np.float64, count=n)
+        age = np.array([DEFAULT_BUILDING_AGE if r["building_age"] is None else float(r["building_age"]) for r in rows])
+        rating = np.array([DEFAULT_RATING if r["avg_rating"] is None else float(r["avg_rating"]) for r in rows])
+
+        self.numeric = np.column_stack([
+            np.log10(np.maximum(price, 1.0)) * PRICE_WEIGHT,
+            age / 10.0 * AGE_WEIGHT,
+            rating / 5.0 * RATING_WEIGHT,
+        ]).astype(np.float32)
+        _, self.type_code = np.unique([r["type"] for r in rows], return_inverse=True)
+        _, self.city_code = np.unique([(r["location"] or "").strip().lower() for r in rows], return_inverse=True)
+        self.available = np.array([r["status"] == "Available" for r in rows], dtype=bool)
+        self.sq_norm = np.einsum("ij,ij->i", self.numeric, self.numeric)
+        self.index_of = {int(pid): i for i, pid in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, rows, cols):
+        """Squared distances between feature rows `rows` and `cols` (index arrays)."""
+        a, b = self.numeric[rows], self.numeric[cols]
+        d = self.sq_norm[rows][:, None] + self.sq_norm[cols][None, :] - 2.0 * (a @ b.T)
+        np.maximum(d, 0.0, out=d)
+        d += (TYPE_MISMATCH ** 2) * (self.type_code[rows][:, None] != self.type_code[cols][None, :])
+        d += (CITY_MISMATCH ** 2) * (self.city_code[rows][:, None] != self.city_code[cols][None, :])
+        return d
+
+
+def _blocks(sources, width):
+    step = max(1, BLOCK_CELLS // max(width, 1))
+    for start in range(0, len(sources), step):
+        yield sources[start:start + step]
+
+
+def top_k_neighbours(fm, sources, k=TOP_K):
+    """Yield (source_index, [(target_index, distance), ...]) nearest-first, Available targets only."""
+    targets = np.flatnonzero(fm.available)
+    if len(targets) == 0:
+        for s in sources:
+            yield int(s), []
+        return
+    for block in _blocks(sources, len(targets)):
+        d = fm.distances(block, targets)
+        d[block[:, None] == targets[None, :]] = np.inf   # never recommend a listing to itself
+        kk = min(k, len(targets))
+        part = np.argpartition(d, kk - 1, axis=1)[:, :kk]
+        part_d = np.take_along_axis(d, part, axis=1)
+        order = np.argsort(part_d, axis=1)
+        part, part_d = np.take_along_axis(part, order, axis=1), np.take_along_axis(part_d, order, axis=1)
+        for row, s in enumerate(block):
+            yield int(s), [(int(targets[j]), float(dist)) for j, dist in zip(part[row], part_d[row]) if np.isfinite(dist)]
+
+
+# ------------------------------------------------------------
+# Incremental Refresh
+# ------------------------------------------------------------
+def _dirty_sources(fm, changed_ids, stored):
+    """
+    Sources whose top-k may differ after `changed_ids` changed: the changed
+    listings themselves, anything that pointed at one of them, and anything a
+    changed (still Available) listing is now closer to than its current k-th
+    neighbour.
+    """
+    n = len(fm)
+    dirty = np.zeros(n, dtype=bool)
+    kth = np.full(n, np.inf, dtype=np.float32)
+    changed = set(changed_ids)
+
+    for pid, neighbours in stored.items():
+        i = fm.index_of.get(pid)
+        if i is None:
+            continue
+        if len(neighbours) >= TOP_K:
+            kth[i] = neighbours[-1][1]
+        if any(sid in changed for sid, _ in neighbours):
+            dirty[i] = True
+
+    for pid in changed:
+        i = fm.index_of.get(pid)
+        if i is not None:
+            dirty[i] = True
+
+    changed_targets = np.array(
+        [fm.index_of[pid] for pid in changed if pid in fm.index_of and fm.available[fm.index_of[pid]]],
+        dtype=np.int64,
+    )
+    everything = np.arange(n)
+    for block in _blocks(changed_targets, n):
+        d = fm.distances(block, everything)
+        d[block[:, None] == everything[None, :]] = np.inf
+        dirty |= (d < kth[None, :]).any(axis=0)
+
+    # Listings never computed before (e.g. inserted while the queue was cleared)
+    missing = np.array([int(pid) not in stored for pid in fm.ids], dtype=bool)
+    return np.flatnonzero(dirty | missing)
+
+
+@admitted(ANALYTICS)
+def refresh_recommendations(full=False):
+    """Recompute PropertySimilar, incrementally from RecommendationQueue unless `full`."""
+    started = time.perf_counter()
+    conn = create_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute("SELECT NOW(6) AS ts;")
+            snapshot = cursor.fetchone()["ts"]
+            cursor.execute("SELECT property_id FROM RecommendationQueue WHERE queued_at <= %s;", (snapshot,))
+            changed_ids = [r["property_id"] for r in cursor.fetchall()]
+
+            fm = FeatureMatrix(fetch_feature_rows(cursor))
+            if len(fm) == 0:
+                cursor.execute("DELETE FROM RecommendationQueue WHERE queued_at <= %s;", (snapshot,))
+                conn.commit()
+                return {"mode": "full", "recomputed": 0, "seconds": 0.0}
+
+            stored = {}
+            if not full:
+                cursor.execute("SELECT property_id, similar_id, distance FROM PropertySimilar ORDER BY property_id, rank_pos;")
+                for r in cursor.fetchall():
+                    stored.setdefault(r["property_id"], []).append((r["similar_id"], r["distance"]))
+                full = not stored or len(changed_ids) > FULL_REFRESH_RATIO * len(fm)
+
+            sources = np.arange(len(fm)) if full else _dirty_sources(fm, changed_ids, stored)
+
+            rows = []
+            for s, neighbours in top_k_neighbours(fm, sources):
+                pid = int(fm.ids[s])
+                rows.extend((pid, rank, int(fm.ids[t]), dist) for rank, (t, dist) in enumerate(neighbours, start=1))
+
+            if full:
+                cursor.execute("DELETE FROM PropertySimilar;")
+            else:
+                source_ids = [int(fm.ids[s]) for s in sources]
+                for start in range(0, len(source_ids), 1000):
+                    chunk = source_ids[start:start + 1000]
+                    cursor.execute(
+                        f"DELETE FROM PropertySimilar WHERE property_id IN ({', '.join(['%s'] * len(chunk))});",
+                        tuple(chunk),
+                    )
+            for start in range(0, len(rows), 5000):
+                cursor.executemany(
+                    "INSERT INTO PropertySimilar (property_id, rank_pos, similar_id, distance) VALUES (%s, %s, %s, %s);",
+                    rows[start:start + 5000],
+                )
+            cursor.execute("DELETE FROM RecommendationQueue WHERE queued_at <= %s;", (snapshot,))
+        conn.commit()
+        return {
+            "mode": "full" if full else "incremental",
+            "recomputed": int(len(sources)),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Serving
+# ------------------------------------------------------------
+@admitted(INTERACTIVE, busy=dict)
+def fetch_similar_properties(property_ids, limit=TOP_K):
+    """Return {property_id: [similar listing rows]} with one lookup on the PropertySimilar primary key."""
+    property_ids = list(dict.fromkeys(property_ids))
+    if not property_ids:
+        return {}
+    conn = create_connection()
+    if not conn:
+        return {}
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT s.property_id AS source_id, p.property_id, p.title, p.price, p.location, p.type
+                FROM PropertySimilar s
+                JOIN Properties p ON p.property_id = s.similar_id
+                WHERE s.property_id IN ({', '.join(['%s'] * len(property_ids))})
+                  AND s.rank_pos <= %s
+                  AND p.status = 'Available'
+                ORDER BY s.property_id, s.rank_pos;
+            """, tuple(property_ids) + (limit,))
+            similar = {}
+            for row in cursor.fetchall():
+                similar.setdefault(row.pop("source_id"), []).append(row)
+            return similar
+    except pymysql.Error as e:
+        print(f"Error fetching recommendations: {e}")
+        return {}
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(refresh_recommendations(full="--full" in sys.argv))
@@ -0,0 +1,292 @@
+import json
+import re
+import sys
+from datetime import datetime
+
+import pymysql
+from db.admission import admitted, ANALYTICS, INTERACTIVE, WRITE
+from db.connection import create_connection
+
+# Keyword counts use the Space-Saving heavy-hitters scheme: at most this many
+# words are tracked per agent/property, so the row stays small forever.
+MAX_TRACKED_KEYWORDS = 60
+TOP_KEYWORDS = 10
+MONTHS_KEPT = 36
+ROLLING_MONTHS = 3
+
+STATS_TABLES = {"agent": ("AgentReviewStats", "agent_id"), "property": ("PropertyReviewStats", "property_id")}
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours out
+over own really same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you your
+property agent place house flat apartment
+""".split())
+
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+# ------------------------------------------------------------
+# Local Tokenizer
+# ------------------------------------------------------------
+def keywords(text):
+    """Lowercased content words of a review, with simple plural folding ('rooms' -> 'room')."""
+    words = []
+    for w in _WORD.findall((text or "").lower()):
+        w = w.split("'")[0]
+        if len(w) < 3 or w in STOPWORDS:
+            continue
+        if len(w) > 4 and w.endswith("s") and not w.endswith(("ss", "us", "is")):
+            w = w[:-1]
+        words.append(w)
+    return words
+
+
+def _add_keywords(counts, words):
+    """Space-Saving update: a new word evicts the rarest one and inherits its count + 1."""
+    for w in set(words):
+        if w in counts:
+            counts[w] += 1
+        elif len(counts) < MAX_TRACKED_KEYWORDS:
+            counts[w] = 1
+        else:
+            rarest = min(counts, key=counts.get)
+            counts[w] = counts.pop(rarest) + 1
+
+
+# ------------------------------------------------------------
+# Incremental Update (inside the review's transaction)
+# ------------------------------------------------------------
+def _apply(cursor, table, key, subject_id, rating, words, month):
+    cursor.execute(f"SELECT histogram, monthly, keywords FROM {table} WHERE {key} = %s FOR UPDATE;", (subject_id,))
+    row = cursor.fetchone()
+    histogram = json.loads(row["histogram"]) if row else [0] * 5
+    monthly = json.loads(row["monthly"]) if row else {}
+    counts = json.loads(row["keywords"]) if row else {}
+
+    histogram[rating - 1] += 1
+    count, total = monthly.get(month, (0, 0))
+    monthly[month] = [count + 1, total + rating]
+    for old in sorted(monthly)[:-MONTHS_KEPT]:
+        del monthly[old]
+    _add_keywords(counts, words)
+
+    cursor.execute(f"""
+        INSERT INTO {table} ({key}, review_count, rating_sum, histogram, monthly, keywords)
+        VALUES (%s, 1, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            review_count = review_count + 1,
+            rating_sum = rating_sum + VALUES(rating_sum),
+            histogram = VALUES(histogram),
+            monthly = VALUES(monthly),
+            keywords = VALUES(keywords);
+    """, (subject_id, rating, json.dumps(histogram), json.dumps(monthly), json.dumps(counts)))
+
+
+def apply_review(cursor, property_id, agent_id, rating, comments, created_at=None):
+    """Fold one new review into its agent's and property's stats rows (two PK upserts)."""
+    month = (created_at or datetime.now()).strftime("%Y-%m")
+    words = keywords(comments)
+    rating = int(rating)
+    if agent_id:
+        _apply(cursor, *STATS_TABLES["agent"], agent_id, rating, words, month)
+    if property_id:
+        _apply(cursor, *STATS_TABLES["property"], property_id, rating, words, month)
+
+
+@admitted(WRITE)
+def add_review(user_id, property_id, agent_id, rating, comments):
+    """
+    Insert a review and update both stats rows in one transaction. Returns
+    the review_id.
+
+    This is the only writer of Reviews, and the stats are maintained here
+    rather than by a trigger because the keyword sketch needs the Python
+    tokenizer. Concurrent reviews stay correct (each stats row is read FOR
+    UPDATE). Edits and deletes, including cascades from deleting a user or
+    listing, are queued by triggers and handled by
+    refresh_queued_review_stats().
+    """
+    conn = create_connection()
+    if not conn:
+        raise pymysql.err.OperationalError("Could not connect to the database.")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO Reviews (user_id, property_id, agent_id, rating, comments)
+                VALUES (%s, %s, %s, %s, %s);
+            """, (user_id, property_id, agent_id, rating, comments))
+            review_id = cursor.lastrowid
+            apply_review(cursor, property_id, agent_id, rating, comments)
+        conn.commit()
+        return review_id
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Repair After Edits and Deletes (rows queued by triggers)
+# ------------------------------------------------------------
+def rebuild_subject(cursor, scope, subject_id, queued_at):
+    """
+    Recompute one stats row from its remaining reviews and clear its queue
+    entry if nothing re-queued it after `queued_at`. The reviews are read
+    with a locking read before the stats row is touched, the same order
+    add_review() takes its locks in.
+    """
+    table, key = STATS_TABLES[scope]
+    cursor.execute(f"""
+        SELECT rating, comments, created_at FROM Reviews
+        WHERE {key} = %s AND rating IS NOT NULL
+        ORDER BY review_id
+        FOR SHARE;
+    """, (subject_id,))
+    reviews = cursor.fetchall()
+    cursor.execute(f"DELETE FROM {table} WHERE {key} = %s;", (subject_id,))
+    for r in reviews:
+        _apply(cursor, table, key, subject_id, int(r["rating"]), keywords(r["comments"]),
+               r["created_at"].strftime("%Y-%m"))
+    cursor.execute("DELETE FROM ReviewStatsQueue WHERE scope = %s AND subject_id = %s AND queued_at <= %s;",
+                   (scope, subject_id, queued_at))
+    return len(reviews)
+
+
+@admitted(WRITE)
+def refresh_queued_review_stats():
+    """Rebuild every queued stats row (called after deleting users). Returns how many were rebuilt."""
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT scope, subject_id, queued_at FROM ReviewStatsQueue ORDER BY queued_at;")
+            queued = cursor.fetchall()
+            for q in queued:
+                rebuild_subject(cursor, q["scope"], q["subject_id"], q["queued_at"])
+        conn.commit()
+        return len(queued)
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Dashboard Read (one primary-key lookup)
+# ------------------------------------------------------------
+def _calendar_months(first, last):
+    """Every 'YYYY-MM' from `first` to `last` inclusive."""
+    year, month = map(int, first.split("-"))
+    end = tuple(map(int, last.split("-")))
+    while (year, month) <= end:
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def rolling_trend(monthly, through):
+    """
+    [(month, count, average, rolling average)] for every calendar month from
+    the first reviewed one through `through` ('YYYY-MM'). Months without
+    reviews count as empty in the ROLLING_MONTHS window instead of being
+    skipped; their average (and a window with no reviews at all) is None.
+    """
+    if not monthly:
+        return []
+    trend, window = [], []
+    for month in _calendar_months(min(monthly), max(max(monthly), through)):
+        count, total = monthly.get(month, (0, 0))
+        window = (window + [(count, total)])[-ROLLING_MONTHS:]
+        in_window = sum(c for c, _ in window)
+        trend.append((month, count, total / count if count else None,
+                      sum(t for _, t in window) / in_window if in_window else None))
+    return trend
+
+
+@admitted(INTERACTIVE, busy=None)
+def fetch_review_stats(scope, subject_id, today=None):
+    """
+    Stats for scope 'agent' or 'property': count, average, histogram
+    (index 0 = 1 star), monthly [(month, count, average, rolling average)]
+    through the current month, and the top keywords. None if nothing has
+    been reviewed yet.
+    """
+    table, key = STATS_TABLES[scope]
+    sql = f"""
+        SELECT s.review_count, s.rating_sum, s.histogram, s.monthly, s.keywords, s.updated_at,
+               q.queued_at AS stale_since
+        FROM (SELECT %s AS scope, %s AS subject_id) k
+        LEFT JOIN {table} s ON s.{key} = k.subject_id
+        LEFT JOIN ReviewStatsQueue q ON q.scope = k.scope AND q.subject_id = k.subject_id;
+    """
+    conn = create_connection()
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, (scope, subject_id))
+            row = cursor.fetchone()
+            if row and row["stale_since"]:
+                # Reviews were edited or deleted since the row was built
+                rebuild_subject(cursor, scope, subject_id, row["stale_since"])
+                conn.commit()
+                cursor.execute(sql, (scope, subject_id))
+                row = cursor.fetchone()
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if not row or not row["review_count"]:
+        return None
+
+    trend = rolling_trend(json.loads(row["monthly"]), (today or datetime.now()).strftime("%Y-%m"))
+    counts = json.loads(row["keywords"])
+    return {
+        "review_count": row["review_count"],
+        "average": row["rating_sum"] / row["review_count"],
+        "histogram": json.loads(row["histogram"]),
+        "monthly": trend,
+        "keywords": sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:TOP_KEYWORDS],
+        "updated_at": row["updated_at"],
+    }
+
+
+# ------------------------------------------------------------
+# Backfill / Repair
+# ------------------------------------------------------------
+@admitted(ANALYTICS)
+def rebuild_review_stats():
+    """Recompute every stats row from Reviews (first install, or after a restore)."""
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM AgentReviewStats;")
+            cursor.execute("DELETE FROM PropertyReviewStats;")
+            cursor.execute("DELETE FROM ReviewStatsQueue;")
+            cursor.execute("SELECT property_id, agent_id, rating, comments, created_at FROM Reviews ORDER BY review_id;")
+            reviews = cursor.fetchall()
+            for r in reviews:
+                if r["rating"] is not None:
+                    apply_review(cursor, r["property_id"], r["agent_id"], r["rating"], r["comments"], r["created_at"])
+        conn.commit()
+        return len(reviews)
+    except pymysql.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv:
+        print(f"Rebuilt review stats from {rebuild_review_stats()} review(s).")
+    else:
+        print(f"Rebuilt {refresh_queued_review_stats()} queued review stats row(s).")
@@ -0,0 +1,194 @@
+import pymysql
+from db.admission import admitted, INTERACTIVE, WRITE
+from db.connection import create_connection
+
+MAX_SAVED_SEARCHES = 20      # per client
+INBOX_LIMIT = 100
+PREFIX_CHARS = 3             # must match SavedSearches.location_prefix = LEFT(location, 3)
+
+
+# ------------------------------------------------------------
+# Location Prefixes
+# ------------------------------------------------------------
+def candidate_prefixes(location):
+    """
+    Every location_prefix a saved search matching a listing at `location`
+    can have. The Location search matches when the search text occurs
+    anywhere in the listing's location (LIKE '%text%'), so the text's first
+    PREFIX_CHARS characters (all of it, if shorter) occur there too: at most
+    PREFIX_CHARS keys per character of the location, plus '' (any location),
+    however many searches are saved. Case is left to the column collation.
+    """
+    text = (location or "").lower()
+    keys = {""}
+    for i in range(len(text)):
+        for n in range(1, PREFIX_CHARS + 1):
+            if i + n <= len(text):
+                keys.add(text[i:i + n])
+    return sorted(keys)
+
+
+# ------------------------------------------------------------
+# Reverse Matching
+# ------------------------------------------------------------
+def match_listing(cursor, property_id, prop_type, price, location, title):
+    """
+    Add `property_id` to the inbox of every client whose saved search it
+    satisfies. Runs in the caller's transaction on the main database.
+
+    Each candidate prefix is an equality on (type, location_prefix) followed
+    by a range on max_budget >= price within idx_saved_search_match, so the
+    cost is O(prefixes * log n + candidates) for n saved searches. Candidates
+    are then confirmed with the Location search's own LIKE '%text%', so a
+    saved search matches exactly the listings it finds when run by hand. A
+    listing matched before (e.g. re-listed as Available) is refreshed and
+    marked unseen again. Returns the number of inbox rows written.
+    """
+    keys = candidate_prefixes(location)
+    placeholders = ", ".join(["%s"] * len(keys))
+    cursor.execute(f"""
+        INSERT INTO SearchMatches (search_id, client_id, property_id, title, type, price, location)
+        SELECT s.search_id, s.client_id, %s, %s, s.type, %s, %s
+        FROM SavedSearches s
+        WHERE s.type = %s AND s.location_prefix IN ({placeholders}) AND s.max_budget >= %s
+          AND %s LIKE CONCAT('%%', s.location, '%%')
+        ON DUPLICATE KEY UPDATE
+            title = VALUES(title), price = VALUES(price), location = VALUES(location),
+            matched_at = CURRENT_TIMESTAMP, seen = 0;
+    """, (property_id, title, price, location, prop_type, *keys, price, location or ""))
+    return cursor.rowcount
+
+
+@admitted(WRITE, busy=0)
+def notify_matches(property_id, prop_type, price, location, title):
+    """
+    match_listing() in its own transaction, for listings written elsewhere
+    (e.g. on an office shard). A failure here never undoes the listing.
+    """
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            written = match_listing(cursor, property_id, prop_type, price, location, title)
+        conn.commit()
+        return written
+    except pymysql.Error as e:
+        conn.rollback()
+        print("Error matching saved searches:", e)
+        return 0
+    finally:
+        conn.close()
+
+
+# ------------------------------------------------------------
+# Client Operations
+# ------------------------------------------------------------
+@admitted(WRITE)
+def save_search(client_id, prop_type, location, max_budget):
+    """
+    Save a search; raises ValueError when the client already has
+    MAX_SAVED_SEARCHES. Re-saving an existing search (same uq_saved_search
+    key, compared case-insensitively like LIKE) only refreshes its location
+    text, so it is allowed at the limit.
+    """
+    location = (location or "").strip()
+    conn = create_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            # Same rounding as the insert, so a float budget matches its stored DECIMAL
+            cursor.execute("""
+                SELECT COUNT(*) AS n,
+                       COALESCE(SUM(type = %s AND location = %s AND max_budget = CAST(%s AS DECIMAL(12,2))), 0)
+                           AS existing
+                FROM SavedSearches WHERE client_id = %s
+                FOR UPDATE;
+            """, (prop_type, location, max_budget, client_id))
+            row = cursor.fetchone()
+            if not row["existing"] and row["n"] >= MAX_SAVED_SEARCHES:
+                raise ValueError(f"You can keep up to {MAX_SAVED_SEARCHES} saved searches.")
+            cursor.execute("""
+                INSERT INTO SavedSearches (client_id, type, location, max_budget)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE location = VALUES(location);
+            """, (client_id, prop_type, location, max_budget))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@admitted(WRITE, busy=False)
+def delete_search(client_id, search_id):
+    conn = create_connection()
+    if not conn:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM SavedSearches WHERE search_id=%s AND client_id=%s;", (search_id, client_id))
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+@admitted(INTERACTIVE, busy=list)
+def fetch_saved_searches(client_id):
+    conn = create_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT s.search_id, s.type, s.location, s.max_budget, s.created_at,
+                       COUNT(m.match_id) AS matches, COALESCE(SUM(m.seen = 0), 0) AS unseen
+                FROM SavedSearches s
+                LEFT JOIN SearchMatches m ON m.search_id = s.search_id
+                WHERE s.client_id = %s
+                GROUP BY s.search_id
+                ORDER BY s.created_at DESC;
+            """, (client_id,))
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+@admitted(INTERACTIVE, busy=list)
+def fetch_inbox(client_id, limit=INBOX_LIMIT):
+    """Newest matches first (idx_match_inbox); unseen ones are flagged by `seen = 0`."""
+    conn = create_connection()
+    if not conn:
+        return []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT m.match_id, m.property_id, m.title, m.type, m.price, m.location, m.matched_at, m.seen,
+                       s.location AS search_location, s.max_budget
+                FROM SearchMatches m
+                JOIN SavedSearches s ON s.search_id = m.search_id
+                WHERE m.client_id = %s
+                ORDER BY m.seen ASC, m.matched_at DESC
+                LIMIT %s;
+            """, (client_id, limit))
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+@admitted(WRITE, busy=0)
+def mark_inbox_seen(client_id):
+    conn = create_connection()
+    if not conn:
+        return 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("UPDATE SearchMatches SET seen = 1 WHERE client_id = %s AND seen = 0;", (client_id,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
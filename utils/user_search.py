@@ -0,0 +1,59 @@
+import time
+
+import pymysql
+from db.admission import admitted, INTERACTIVE
+from db.connection import create_connection
+
+SEARCH_LIMIT = 20
+ROLES = ("Admin", "Agent", "Client")
+
+
+def escape_like(text):
+    """Escape LIKE wildcards so user input is matched literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# ------------------------------------------------------------
+# Indexed Prefix Search
+# ------------------------------------------------------------
+@admitted(INTERACTIVE, busy=lambda: ([], 0.0))
+def search_users(prefix, role=None, limit=SEARCH_LIMIT):
+    """
+    Typeahead over name, email and phone. Each branch is a `col LIKE 'abc%'`
+    range scan on its own index (idx_users_name, the email unique key,
+    idx_users_phone) capped at `limit`, so cost depends on the number of
+    matches shown, not the size of Users. Returns (rows, elapsed_ms).
+    """
+    prefix = (prefix or "").strip()
+    if not prefix:
+        return [], 0.0
+    pattern = escape_like(prefix) + "%"
+    role_filter, role_params = "", ()
+    if role in ROLES:
+        role_filter, role_params = "AND role = %s", (role,)
+    branches, params = [], []
+    for column in ("name", "email", "phone"):
+        branches.append(f"""
+            (SELECT user_id, name, email, phone, role
+             FROM Users
+             WHERE {column} LIKE %s {role_filter}
+             ORDER BY {column}
+             LIMIT %s)
+        """)
+        params += [pattern, *role_params, limit]
+
+    started = time.perf_counter()
+    conn = create_connection()
+    if not conn:
+        return [], 0.0
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(f"""
+                SELECT * FROM ({' UNION '.join(branches)}) matches
+                ORDER BY name, user_id
+                LIMIT %s;
+            """, tuple(params) + (limit,))
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+    return rows, (time.perf_counter() - started) * 1000